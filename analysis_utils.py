@@ -1,119 +1,316 @@
-from google import genai
-from openai import OpenAI
 import anthropic
 from youtube_transcript_api import YouTubeTranscriptApi
 import json
 import os
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from audio_utils import AUDIO_PREFILTER_COVERAGE, prefilter_transcript
+from cache_utils import MEDIA_CACHE, DiskCache, make_cache_key
+from llm_utils import (MODEL_CAPABILITIES, call_with_limits, get_custom_provider, get_hedge_policy, get_limiter, get_llm_client,
+                       hedged_call, is_retryable, record_latency)
+from metrics_utils import bind_context, span, traced
+from profiling_utils import profiled
+from prompt_utils import estimate_tokens, format_transcript, line_token_counts, resolve_line_clips
+from transcript_utils import Transcript, TranscriptIndex, as_transcript_index
 
 # Model configurations for each provider
 GEMINI_MODELS = ["gemini-2.5-pro", "gemini-2.5-flash", "gemini-3-pro-preview", "gemini-3-flash-preview"]
 OPENAI_MODELS = ["gpt-5.2", "gpt-5.1", "gpt-5-mini", "o3-pro", "o4-mini"]
 ANTHROPIC_MODELS = ["claude-opus-4-5-20251101", "claude-sonnet-4-5-20250929", "claude-opus-4-1-20250805", "claude-sonnet-4-20250514"]
 
-def call_llm(prompt, provider, model, api_key):
+# Max concurrent clip validations per provider (keeps us under per-key rate limits)
+VALIDATION_CONCURRENCY = {
+    "Google Gemini": 8,
+    "OpenAI": 8,
+    "Anthropic": 4,
+}
+
+VALID_COMPLETENESS_ISSUES = ['starts_mid_sentence', 'ends_mid_sentence', 'both']
+
+# Counters for validate_and_expand_clips (calls_saved = per-clip requests avoided by batching)
+VALIDATION_STATS = {'batched_calls': 0, 'single_calls': 0, 'calls_saved': 0}
+_validation_stats_lock = threading.Lock()
+# Streamed clips (validate_clips_as_found) are validated in batches: clips arriving within
+# VALIDATION_BATCH_WINDOW seconds of the first one share a request (up to VALIDATION_BATCH_MAX)
+VALIDATION_BATCH_WINDOW = float(os.getenv("VALIDATION_BATCH_WINDOW", "1.5"))
+VALIDATION_BATCH_MAX = 8
+
+# Chunked (map-reduce) analysis for long transcripts: window length/overlap in seconds
+ANALYSIS_WINDOW_SECONDS = 1800
+ANALYSIS_WINDOW_OVERLAP = 120
+# Max windows analyzed in parallel per provider
+ANALYSIS_CONCURRENCY = {
+    "Google Gemini": 4,
+    "OpenAI": 4,
+    "Anthropic": 2,
+}
+
+# Prompt size control: transcript encoding ('compact', 'verbose', or 'auto' = verbose if it
+# fits the budget, else compact) and the max estimated input tokens per analysis call.
+# Windows are shrunk (down to MIN_ANALYSIS_WINDOW_SECONDS) until every prompt fits.
+PROMPT_ENCODING = os.getenv("PROMPT_ENCODING", "compact")
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "30000"))
+MIN_ANALYSIS_WINDOW_SECONDS = 120
+# Compact encoding: seconds (before, after) added around line-number clips - the
+# breathing room the verbose prompts ask the model to add itself
+COMPACT_CLIP_PADDING = {'humor_score': (0.0, 1.5), 'quality_score': (1.5, 2.5)}
+
+# Persistent LLM response cache (shared by all sessions/processes using the same directory)
+LLM_CACHE_DIR = os.getenv("LLM_CACHE_DIR", ".llm_cache")
+LLM_CACHE_MAX_BYTES = int(os.getenv("LLM_CACHE_MAX_MB", "200")) * 1024 * 1024
+LLM_CACHE_MAX_AGE = int(os.getenv("LLM_CACHE_MAX_AGE_HOURS", "168")) * 3600
+LLM_CACHE = None if os.getenv("LLM_CACHE_DISABLED") else DiskCache(LLM_CACHE_DIR, max_bytes=LLM_CACHE_MAX_BYTES, max_age=LLM_CACHE_MAX_AGE)
+
+# Media cache kind for fetched transcripts (binary Transcript format, memory-mapped on load)
+TRANSCRIPT_CACHE_KIND = "transcript-bin"
+
+def _gemini_config(model):
+    """
+    Default generation config for a Gemini model.
+    """
+    # Gemini 3 uses generation_config for output control
+    # Deep Think models may need special handling
+    is_deep_think = "deep-think" in model.lower()
+    
+    config = {
+        "max_output_tokens": 8192,
+        "temperature": 0.7 if not is_deep_think else None,  # Deep Think uses internal reasoning
+    }
+    # Remove None values
+    return {k: v for k, v in config.items() if v is not None}
+
+
+def _openai_params(model):
+    """
+    Default generation parameters (everything except model/messages) for an OpenAI model.
+    """
+    # Determine model type for parameter selection
+    is_reasoning = model.startswith("o1") or model.startswith("o3") or model.startswith("o4")
+    is_gpt5 = model.startswith("gpt-5")
+    
+    params = {}
+    
+    # GPT-5 series and reasoning models use max_completion_tokens
+    # Reasoning models don't support temperature
+    if is_reasoning:
+        params["max_completion_tokens"] = 10000
+        # No temperature for reasoning models
+    elif is_gpt5:
+        # GPT-5 uses max_completion_tokens (not max_tokens)
+        params["max_completion_tokens"] = 8192
+        params["temperature"] = 0.3 if "mini" in model else 0.7
+    else:
+        # Legacy models (gpt-4o, etc.) use max_tokens
+        params["temperature"] = 0.7
+        params["max_tokens"] = 4096
+    return params
+
+
+def _gemini_request_kwargs(model, shape):
+    """
+    The config argument for a Gemini request shape ("no_config" = the model's defaults).
+    """
+    return {} if "no_config" in shape else {"config": _gemini_config(model)}
+
+
+def _openai_request_params(model, shape):
+    """
+    _openai_params adjusted for a request shape (adjustments some models need).
+    """
+    params = _openai_params(model)
+    if "no_temperature" in shape:
+        params.pop("temperature", None)
+    if "max_completion_tokens" in shape and "max_tokens" in params:
+        params.pop("max_tokens")
+        params["max_completion_tokens"] = 8192
+    return params
+
+
+def _gemini_config_rejected(error_str):
+    """
+    True if a Gemini error rejects the generation config itself (not the key, model or content).
+    """
+    if "invalid" not in error_str and "unsupported" not in error_str and "not supported" not in error_str:
+        return False
+    return any(field in error_str for field in ("max_output_tokens", "temperature", "generation_config", "generationconfig"))
+
+
+def _openai_shape_fix(error_str, shape):
+    """
+    The adjustment an OpenAI "unsupported parameter" error asks for, or None.
+    """
+    if "unsupported" not in error_str:
+        return None
+    # Catch 1: Temperature unsupported (reasoning model)
+    if "temperature" in error_str and "no_temperature" not in shape:
+        return "no_temperature"
+    # Catch 2: max_tokens unsupported (needs max_completion_tokens)
+    if "max_tokens" in error_str and "max_completion_tokens" not in shape:
+        return "max_completion_tokens"
+    return None
+
+
+def _generation_params(provider, model):
+    """
+    The generation parameters call_llm sends for (provider, model) - part of the cache key.
+    """
+    if provider == "Google Gemini":
+        return _gemini_config(model)
+    if provider == "OpenAI":
+        return _openai_params(model.strip())
+    return {"max_tokens": 8192}
+
+
+def call_llm(prompt, provider, model, api_key, use_cache=True):
     """
     Unified wrapper for calling LLM APIs (Gemini, OpenAI, or Anthropic).
+    Identical requests are answered from the on-disk LLM_CACHE (no network, no client);
+    pass use_cache=False to bypass it. Requests go through the provider's rate limiter
+    and rate limits / transient errors are retried with backoff (see call_with_limits).
+    With a hedging policy (LLM_HEDGE or hedging()), slow calls are raced against a backup model.
     Returns the text response from the model.
     """
-    if provider == "Google Gemini":
-        client = genai.Client(api_key=api_key)
-        print(f"DEBUG: Calling Gemini with model '{model}'")
+    with span("llm.call", provider=provider, model=model, prompt_chars=len(prompt)) as llm_span:
+        cache_key = None
+        if use_cache and LLM_CACHE is not None:
+            cache_key = make_cache_key(provider, model.strip(), prompt, _generation_params(provider, model))
+            cached = LLM_CACHE.get(cache_key)
+            if cached is not None:
+                print(f"DEBUG: LLM cache hit ({provider} '{model}')")
+                llm_span.set(cached=True, response_chars=len(cached))
+                return cached
         
-        # Gemini 3 uses generation_config for output control
-        # Deep Think models may need special handling
-        is_deep_think = "deep-think" in model.lower()
+        retries = []
         
-        config = {
-            "max_output_tokens": 8192,
-            "temperature": 0.7 if not is_deep_think else None,  # Deep Think uses internal reasoning
-        }
-        # Remove None values
-        config = {k: v for k, v in config.items() if v is not None}
+        def timed_call(call_provider, call_model, call_key, on_attempt=None):
+            # Only the request itself is timed (no limiter queueing, backoff or failed
+            # attempts), so slow periods don't drag the hedge deadlines up
+            def attempt():
+                if on_attempt:
+                    on_attempt()
+                started = time.perf_counter()
+                text = _call_provider(prompt, call_provider, call_model, call_key)
+                record_latency(call_provider, call_model, prompt, time.perf_counter() - started)
+                return text
+            return call_with_limits(call_provider, attempt, on_retry=lambda attempt, status, delay: retries.append(status))
         
-        try:
-            response = client.models.generate_content(
-                model=model,
-                contents=prompt,
-                config=config
+        # Optional hedging: a second provider/model races calls that run past the usual latency
+        policy = get_hedge_policy()
+        deadline = policy.deadline(provider, model, prompt) if policy else None
+        if deadline is None:
+            text_response = timed_call(provider, model, api_key)
+        else:
+            text_response, winner = hedged_call(
+                lambda on_attempt: timed_call(provider, model, api_key, on_attempt),
+                lambda on_attempt: timed_call(policy.provider, policy.model, policy.api_key, on_attempt),
+                deadline, policy
             )
-            return response.text.strip()
-        except Exception as e:
-            print(f"DEBUG: Gemini Error: {e}")
-            # Fallback without config if it fails
+            llm_span.set(hedge_deadline=round(deadline, 3), winner=winner)
+            if winner == "backup":
+                cache_key = None  # Don't cache another model's answer under this model's key
+        llm_span.set(cached=False, response_chars=len(text_response or ""), retries=len(retries))
+    
+    if cache_key is not None and text_response:
+        LLM_CACHE.set(cache_key, text_response)
+    return text_response
+
+
+def _gemini_text(response):
+    """
+    The stripped text of a Gemini response; "" if the reply was blocked (no text).
+    """
+    if response.text is None:
+        print("DEBUG: Gemini returned no text (blocked or empty reply)")
+        return ""
+    return response.text.strip()
+
+
+def _call_provider(prompt, provider, model, api_key):
+    """
+    Sends the prompt to the provider and returns the stripped text response.
+    Clients come from the shared pool so keep-alive connections are reused.
+    Parameters a model rejected before are left out from the start (MODEL_CAPABILITIES).
+    """
+    custom = get_custom_provider(provider)
+    if custom is not None:
+        return custom.complete(prompt, model).strip()
+    
+    if provider == "Google Gemini":
+        client = get_llm_client(provider, api_key)
+        print(f"DEBUG: Calling Gemini with model '{model}'")
+        
+        shape = MODEL_CAPABILITIES.working_shape(provider, model)
+        if shape is None or "no_config" not in shape:
             try:
                 response = client.models.generate_content(
                     model=model,
-                    contents=prompt
+                    contents=prompt,
+                    config=_gemini_config(model)
                 )
-                return response.text.strip()
-            except Exception:
-                raise e
+            except Exception as e:
+                error_str = str(e).lower()
+                print(f"DEBUG: Gemini Error: {error_str}")
+                # Only a rejected config is a capability of the model; anything else
+                # (rate limits, bad key or model, outages) is re-raised untouched
+                if is_retryable(e) or not _gemini_config_rejected(error_str):
+                    raise
+                MODEL_CAPABILITIES.record_failure(provider, model, [])
+                print("DEBUG: Retrying without generation config...")
+            else:
+                if shape is None:
+                    MODEL_CAPABILITIES.record_success(provider, model, [])
+                return _gemini_text(response)
+        
+        # Without config: the model rejected it (just now, or before - see MODEL_CAPABILITIES)
+        response = client.models.generate_content(
+            model=model,
+            contents=prompt
+        )
+        if shape != ["no_config"]:
+            MODEL_CAPABILITIES.record_success(provider, model, ["no_config"])
+        return _gemini_text(response)
     
     elif provider == "OpenAI":
-        client = OpenAI(api_key=api_key)
+        client = get_llm_client(provider, api_key)
         model = model.strip()
         print(f"DEBUG: Calling OpenAI with model '{model}'")
         
-        # Determine model type for parameter selection
-        is_reasoning = model.startswith("o1") or model.startswith("o3") or model.startswith("o4")
-        is_gpt5 = model.startswith("gpt-5")
-        
-        # Base parameters
-        params = {
-            "model": model,
-            "messages": [{"role": "user", "content": prompt}],
-        }
-        
-        # GPT-5 series and reasoning models use max_completion_tokens
-        # Reasoning models don't support temperature
-        if is_reasoning:
-            params["max_completion_tokens"] = 10000
-            # No temperature for reasoning models
-        elif is_gpt5:
-            # GPT-5 uses max_completion_tokens (not max_tokens)
-            params["max_completion_tokens"] = 8192
-            params["temperature"] = 0.3 if "mini" in model else 0.7
-        else:
-            # Legacy models (gpt-4o, etc.) use max_tokens
-            params["temperature"] = 0.7
-            params["max_tokens"] = 4096
-
-        try:
-            response = client.chat.completions.create(**params)
-            return response.choices[0].message.content.strip()
-        except Exception as e:
-            error_str = str(e).lower()
-            print(f"DEBUG: OpenAI Error: {error_str}")
+        known_shape = MODEL_CAPABILITIES.working_shape(provider, model)
+        shape = list(known_shape or [])
+        while True:
+            # Base parameters
+            params = {
+                "model": model,
+                "messages": [{"role": "user", "content": prompt}],
+            }
+            params.update(_openai_request_params(model, shape))
             
-            # Catch 1: Temperature unsupported (reasoning model)
-            if "temperature" in error_str and "unsupported" in error_str:
-                print("DEBUG: Retrying without temperature...")
-                params.pop("temperature", None)
-                try:
-                    response = client.chat.completions.create(**params)
-                    return response.choices[0].message.content.strip()
-                except Exception:
-                    pass
-
-            # Catch 2: max_tokens unsupported (needs max_completion_tokens)
-            if "max_tokens" in error_str and "unsupported" in error_str:
-                print("DEBUG: Retrying with max_completion_tokens...")
-                params.pop("max_tokens", None)
-                params["max_completion_tokens"] = 8192
-                try:
-                    response = client.chat.completions.create(**params)
-                    return response.choices[0].message.content.strip()
-                except Exception:
-                    pass
+            try:
+                response = client.chat.completions.create(**params)
+            except Exception as e:
+                error_str = str(e).lower()
+                print(f"DEBUG: OpenAI Error: {error_str}")
+                fix = None if is_retryable(e) else _openai_shape_fix(error_str, shape)
+                # Re-raise if we can't fix it
+                if fix is None:
+                    raise
+                MODEL_CAPABILITIES.record_failure(provider, model, shape)
+                print(f"DEBUG: Retrying with {fix}...")
+                shape = shape + [fix]
+                continue
             
-            # Re-raise if we couldn't fix it
-            raise e
+            if known_shape is None or sorted(shape) != known_shape:
+                MODEL_CAPABILITIES.record_success(provider, model, shape)
+            return response.choices[0].message.content.strip()
     
     elif provider == "Anthropic":
         print(f"DEBUG: Calling Anthropic with model '{model}'")
         
         try:
-            client = anthropic.Anthropic(api_key=api_key)
+            client = get_llm_client(provider, api_key)
             
             # Anthropic Claude API uses messages format
             # max_tokens is required for Claude (controls output length)
@@ -136,11 +333,23 @@ def call_llm(prompt, provider, model, api_key):
     else:
         raise ValueError(f"Unknown provider: {provider}")
 
+@traced("transcript.fetch", on_result=lambda transcript: {'entries': len(transcript) if transcript else 0})
 def get_transcript(video_id):
     """
     Fetches the transcript for a given YouTube video ID.
-    Returns a list of dictionaries with 'text', 'start', and 'duration'.
+    Returns a Transcript (a compact, read-only list of dicts with 'text', 'start', and 'duration').
+    Served from the persistent MEDIA_CACHE (memory-mapped) when the video was fetched before.
     """
+    if MEDIA_CACHE is not None:
+        cached_path = MEDIA_CACHE.lookup(video_id, TRANSCRIPT_CACHE_KIND)
+        if cached_path:
+            try:
+                transcript = Transcript.load(cached_path)
+                print(f"DEBUG: Transcript for {video_id} served from media cache")
+                return transcript
+            except (OSError, ValueError) as e:
+                print(f"DEBUG: Ignoring unreadable cached transcript: {e}")
+    
     try:
         # v1.2.3+ uses instance-based API
         api = YouTubeTranscriptApi()
@@ -154,7 +363,10 @@ def get_transcript(video_id):
                 'start': snippet.start,
                 'duration': getattr(snippet, 'duration', 0)
             })
-        return result
+        transcript = Transcript.from_entries(result)
+        if MEDIA_CACHE is not None and result:
+            MEDIA_CACHE.put_bytes(video_id, TRANSCRIPT_CACHE_KIND, "transcript.bin", transcript.to_bytes())
+        return transcript
         
     except Exception as e:
         print(f"Error fetching transcript: {e}")
@@ -164,8 +376,12 @@ def get_transcript(video_id):
 def get_transcript_text_for_interval(transcript, start, end):
     """
     Extracts the combined text from transcript entries that overlap with [start, end].
+    Uses binary search when given a TranscriptIndex, otherwise scans the list.
     Returns tuple: (combined_text, first_entry_index, last_entry_index)
     """
+    if isinstance(transcript, TranscriptIndex):
+        return transcript.text_for_interval(start, end)
+    
     texts = []
     first_idx = None
     last_idx = None
@@ -184,6 +400,17 @@ def get_transcript_text_for_interval(transcript, start, end):
     return ' '.join(texts), first_idx, last_idx
 
 
+def _clean_json_response(text_response):
+    """
+    Strips a markdown code fence (```json ... ```) if the model added one.
+    """
+    if text_response.startswith("```"):
+        text_response = text_response.split("```")[1]
+        if text_response.startswith("json"):
+            text_response = text_response[4:]
+    return text_response.strip()
+
+
 def validate_clip_completeness(text, api_key, provider="Google Gemini", model="gemini-2.5-flash"):
     """
     Asks LLM if the text is a complete thought.
@@ -205,14 +432,7 @@ def validate_clip_completeness(text, api_key, provider="Google Gemini", model="g
     """
     
     try:
-        text_response = call_llm(prompt, provider, model, api_key)
-        
-        # Clean markdown if present
-        if text_response.startswith("```"):
-            text_response = text_response.split("```")[1]
-            if text_response.startswith("json"):
-                text_response = text_response[4:]
-        text_response = text_response.strip()
+        text_response = _clean_json_response(call_llm(prompt, provider, model, api_key))
         
         result = json.loads(text_response)
         return result.get('complete', True), result.get('issue', None)
@@ -222,82 +442,129 @@ def validate_clip_completeness(text, api_key, provider="Google Gemini", model="g
         return True, None  # Assume complete on error
 
 
-def validate_and_expand_clips(transcript, intervals, api_key, max_clip_seconds, provider="Google Gemini", model="gemini-2.5-flash"):
+def validate_clips_completeness_batch(texts, api_key, provider="Google Gemini", model="gemini-2.5-flash"):
+    """
+    Batched variant of validate_clip_completeness: checks many clips in ONE request.
+    texts: dict of clip_id -> transcript text
+    Returns dict of clip_id -> (is_complete, issue) for every well-formed verdict.
+    Clips with a missing or malformed verdict are left out so the caller can fall back.
+    """
+    clips_json = json.dumps([{"id": clip_id, "text": text} for clip_id, text in texts.items()], ensure_ascii=False)
+    
+    prompt = f"""
+    You are checking if video transcript excerpts are COMPLETE thoughts.
+    
+    CLIPS (JSON list of objects with "id" and "text"):
+    {clips_json}
+    
+    For EACH clip, determine:
+    1. Does it START mid-sentence? (missing beginning)
+    2. Does it END mid-sentence? (cut off)
+    3. Is the main idea/joke/point fully expressed?
+    
+    Respond with ONLY a valid JSON list (no markdown), one object per clip id:
+    - If complete: {{"id": <id>, "complete": true}}
+    - If incomplete: {{"id": <id>, "complete": false, "issue": "starts_mid_sentence" OR "ends_mid_sentence" OR "both"}}
+    """
+    
+    verdicts = {}
+    try:
+        text_response = _clean_json_response(call_llm(prompt, provider, model, api_key))
+        results = json.loads(text_response)
+        if not isinstance(results, list):
+            raise ValueError("Expected a JSON list of verdicts")
+        
+        for result in results:
+            if not isinstance(result, dict) or result.get('id') not in texts:
+                continue
+            complete = result.get('complete')
+            issue = result.get('issue')
+            if complete is True:
+                verdicts[result['id']] = (True, None)
+            elif complete is False and issue in VALID_COMPLETENESS_ISSUES:
+                verdicts[result['id']] = (False, issue)
+                
+    except Exception as e:
+        print(f"Error validating clip batch: {e}")
+    
+    return verdicts
+
+
+@profiled("validate_and_expand_clips")
+def validate_and_expand_clips(transcript, intervals, api_key, max_clip_seconds, provider="Google Gemini", model="gemini-2.5-flash", max_workers=None, batch=True):
     """
     Validates each clip for completeness and expands boundaries if needed.
     Loops up to MAX_EXPANSION_PASSES times per clip to handle multi-entry thoughts.
     DISCARDS clips that cannot be completed within max_clip_seconds (quality over quantity).
+    All clips advance one pass at a time. With batch=True every clip still pending in a
+    pass is checked in a single request (O(passes) LLM calls instead of O(clips x passes));
+    missing or malformed verdicts fall back to per-clip checks, run concurrently
+    (capped per provider by VALIDATION_CONCURRENCY, or by max_workers if given).
+    Output order matches the input.
     Returns a new list of (start, end) tuples with corrected timestamps.
     """
     MAX_EXPANSION_PASSES = 3
-    validated_intervals = []
-    discarded_count = 0
+    transcript = as_transcript_index(transcript)
+    if max_workers is None:
+        max_workers = VALIDATION_CONCURRENCY.get(provider, 4)
+    max_workers = max(1, min(max_workers, len(intervals) or 1))
     
-    for i, (start, end) in enumerate(intervals):
-        current_start = start
-        current_end = end
-        clip_is_valid = True  # Track if clip should be kept
-        
-        for pass_num in range(MAX_EXPANSION_PASSES):
-            # Get the text for this interval
-            text, first_idx, last_idx = get_transcript_text_for_interval(transcript, current_start, current_end)
-            
+    clips = [
+        {'start': start, 'end': end, 'valid': True, 'done': False, 'log': []}
+        for start, end in intervals
+    ]
+    
+    for pass_num in range(MAX_EXPANSION_PASSES):
+        # Gather the text for every clip still being checked
+        pending = {}
+        for i, clip in enumerate(clips):
+            if clip['done']:
+                continue
+            text, first_idx, last_idx = transcript.text_for_interval(clip['start'], clip['end'])
             if not text or first_idx is None:
-                print(f"Clip {i+1}: No transcript text found, discarding")
-                clip_is_valid = False
-                break
-            
-            # Check completeness
-            is_complete, issue = validate_clip_completeness(text, api_key, provider, model)
-            
-            if is_complete:
-                if pass_num == 0:
-                    print(f"Clip {i+1}: Complete ✓")
-                else:
-                    print(f"Clip {i+1}: Complete after {pass_num} expansion(s) ✓")
-                break
-            
-            if pass_num == 0:
-                print(f"Clip {i+1}: Incomplete ({issue}) - expanding...")
-            else:
-                print(f"  Pass {pass_num + 1}: Still incomplete ({issue}) - expanding more...")
-            
-            expanded = False
-            
-            # Expand backwards if starts mid-sentence
-            if issue in ['starts_mid_sentence', 'both']:
-                if first_idx > 0:
-                    prev_entry = transcript[first_idx - 1]
-                    new_start = prev_entry['start']
-                    if new_start < current_start:
-                        print(f"  Expanded start: {current_start:.1f}s -> {new_start:.1f}s")
-                        current_start = new_start
-                        expanded = True
-            
-            # Expand forwards if ends mid-sentence
-            if issue in ['ends_mid_sentence', 'both']:
-                if last_idx < len(transcript) - 1:
-                    next_entry = transcript[last_idx + 1]
-                    new_end = next_entry['start'] + next_entry.get('duration', 3)
-                    if new_end > current_end:
-                        print(f"  Expanded end: {current_end:.1f}s -> {new_end:.1f}s")
-                        current_end = new_end
-                        expanded = True
-            
-            # If we couldn't expand further, stop trying
-            if not expanded:
-                print(f"  Cannot expand further (at transcript boundary) - DISCARDING")
-                clip_is_valid = False
-                break
+                clip['log'].append(f"Clip {i+1}: No transcript text found, discarding")
+                clip['valid'] = False
+                clip['done'] = True
+                continue
+            pending[i] = (text, first_idx, last_idx)
+        
+        if not pending:
+            break
+        
+        # Check completeness - one batched request, then per-clip for anything it missed
+        with span("validation.pass", pass_num=pass_num + 1, clips=len(pending), provider=provider, model=model) as pass_span:
+            verdicts = {}
+            if batch and len(pending) > 1:
+                verdicts = validate_clips_completeness_batch(
+                    {i: text for i, (text, _, _) in pending.items()}, api_key, provider, model
+                )
+                with _validation_stats_lock:
+                    VALIDATION_STATS['batched_calls'] += 1
+                    VALIDATION_STATS['calls_saved'] += max(0, len(verdicts) - 1)
             
-            # Check if we've hit max clip length - DISCARD instead of clamp
-            if current_end - current_start > max_clip_seconds:
-                print(f"  Exceeded max {max_clip_seconds}s and still incomplete - DISCARDING (quality over quantity)")
-                clip_is_valid = False
-                break
+            missing = [i for i in pending if i not in verdicts]
+            if missing:
+                if batch and len(pending) > 1:
+                    print(f"Batch validation missing {len(missing)} verdict(s) - checking individually")
+                with ThreadPoolExecutor(max_workers=min(max_workers, len(missing))) as executor:
+                    results = executor.map(
+                        bind_context(lambda i: validate_clip_completeness(pending[i][0], api_key, provider, model)),
+                        missing
+                    )
+                    verdicts.update(zip(missing, results))
+                with _validation_stats_lock:
+                    VALIDATION_STATS['single_calls'] += len(missing)
+            pass_span.set(single_checks=len(missing))
         
-        if clip_is_valid:
-            validated_intervals.append((current_start, current_end))
+        for i, (text, first_idx, last_idx) in pending.items():
+            _advance_clip(transcript, clips[i], i, pass_num, verdicts[i], first_idx, last_idx, max_clip_seconds)
+    
+    validated_intervals = []
+    discarded_count = 0
+    for clip in clips:
+        print("\n".join(clip['log']))
+        if clip['valid']:
+            validated_intervals.append((clip['start'], clip['end']))
         else:
             discarded_count += 1
     
@@ -306,28 +573,271 @@ def validate_and_expand_clips(transcript, intervals, api_key, max_clip_seconds,
     
     return validated_intervals
 
-def analyze_humor(transcript, api_key, max_clip_seconds=15, max_clips=5, provider="Google Gemini", model="gemini-2.5-flash"):
+
+def _advance_clip(transcript, clip, i, pass_num, verdict, first_idx, last_idx, max_clip_seconds):
     """
-    Sends the transcript to LLM to identify humorous sections.
-    Returns a list of (start, end) tuples.
+    Applies one expansion pass to a clip given its completeness verdict.
+    transcript: TranscriptIndex used for the neighbor lookups.
+    Updates clip['start'/'end'] in place and marks it done (and invalid if discarded).
     """
-    if not api_key:
-        raise ValueError("API Key is required")
+    is_complete, issue = verdict
+    log = clip['log']
+    
+    if is_complete:
+        if pass_num == 0:
+            log.append(f"Clip {i+1}: Complete ✓")
+        else:
+            log.append(f"Clip {i+1}: Complete after {pass_num} expansion(s) ✓")
+        clip['done'] = True
+        return
+    
+    if pass_num == 0:
+        log.append(f"Clip {i+1}: Incomplete ({issue}) - expanding...")
+    else:
+        log.append(f"  Pass {pass_num + 1}: Still incomplete ({issue}) - expanding more...")
+    
+    expanded = False
+    
+    # Expand backwards if starts mid-sentence
+    if issue in ['starts_mid_sentence', 'both']:
+        new_start = transcript.previous_start(first_idx)
+        if new_start is not None:
+            if new_start < clip['start']:
+                log.append(f"  Expanded start: {clip['start']:.1f}s -> {new_start:.1f}s")
+                clip['start'] = new_start
+                expanded = True
+    
+    # Expand forwards if ends mid-sentence
+    if issue in ['ends_mid_sentence', 'both']:
+        new_end = transcript.next_end(last_idx)
+        if new_end is not None:
+            if new_end > clip['end']:
+                log.append(f"  Expanded end: {clip['end']:.1f}s -> {new_end:.1f}s")
+                clip['end'] = new_end
+                expanded = True
+    
+    # If we couldn't expand further, stop trying
+    if not expanded:
+        log.append(f"  Cannot expand further (at transcript boundary) - DISCARDING")
+        clip['valid'] = False
+        clip['done'] = True
+        return
+    
+    # Check if we've hit max clip length - DISCARD instead of clamp
+    if clip['end'] - clip['start'] > max_clip_seconds:
+        log.append(f"  Exceeded max {max_clip_seconds}s and still incomplete - DISCARDING (quality over quantity)")
+        clip['valid'] = False
+        clip['done'] = True
 
-    # Prepare transcript for prompt - include start AND end times with clear labels
-    formatted_transcript = ""
-    for i, entry in enumerate(transcript):
-        start = entry['start']
-        duration = entry.get('duration', 3)  # Default 3s if missing
-        end = start + duration
-        text = entry['text']
-        formatted_transcript += f"LINE {i+1} | START:{start:.2f}s | END:{end:.2f}s | TEXT: \"{text}\"\n"
+def split_transcript_windows(transcript, window_seconds, overlap_seconds):
+    """
+    Splits the transcript into overlapping time windows for chunked analysis.
+    Returns a list of entry-index lists (one per window). A transcript that fits in a
+    single window (or window_seconds=None) yields one window with every entry.
+    """
+    transcript = as_transcript_index(transcript)
+    if len(transcript) == 0:
+        return []
+    all_indices = list(range(len(transcript)))
+    if not window_seconds:
+        return [all_indices]
+    
+    first_start = min(transcript.starts)
+    last_end = max(transcript.ends)
+    if last_end - first_start <= window_seconds:
+        return [all_indices]
+    
+    step = max(1.0, window_seconds - overlap_seconds)
+    windows = []
+    window_start = first_start
+    while True:
+        indices = transcript.starting_between(window_start, window_start + window_seconds)
+        if indices:
+            windows.append(indices)
+        if window_start + window_seconds >= last_end:
+            break
+        window_start += step
+    return windows
 
-    prompt = f"""
+
+def _clip_score(clip, score_field):
+    try:
+        return int(clip.get(score_field, 10))  # Default to 10 if missing
+    except (TypeError, ValueError):
+        return 0
+
+
+def merge_window_clips(window_clips, score_field, min_overlap=0.5):
+    """
+    Merges candidates from overlapping windows. Clips that overlap by at least min_overlap
+    of the shorter clip are treated as the same moment (the higher score wins).
+    Returns the merged clips, best score first, ready for filtering and the max_clips cap.
+    """
+    candidates = []
+    for clips in window_clips:
+        for clip in clips:
+            try:
+                candidates.append((float(clip['start']), float(clip['end']), clip))
+            except (KeyError, TypeError, ValueError):
+                continue
+    candidates.sort(key=lambda c: (c[0], c[1]))
+    
+    merged = []
+    for start, end, clip in candidates:
+        if merged:
+            prev_start, prev_end, prev_clip = merged[-1]
+            overlap = min(end, prev_end) - max(start, prev_start)
+            shorter = max(1e-6, min(end - start, prev_end - prev_start))
+            if overlap / shorter >= min_overlap:
+                if _clip_score(clip, score_field) > _clip_score(prev_clip, score_field):
+                    merged[-1] = (start, end, clip)
+                continue
+        merged.append((start, end, clip))
+    
+    dropped = len(candidates) - len(merged)
+    if dropped:
+        print(f"Merged {dropped} duplicate clip(s) from overlapping windows")
+    
+    # Stable sort keeps chronological order among equal scores
+    return sorted((clip for _, _, clip in merged), key=lambda c: -_clip_score(c, score_field))
+
+
+def plan_analysis_prompts(transcript, build_prompt, window_seconds=ANALYSIS_WINDOW_SECONDS, window_overlap=ANALYSIS_WINDOW_OVERLAP,
+                          token_budget=PROMPT_TOKEN_BUDGET, encoding=PROMPT_ENCODING):
+    """
+    Picks the transcript encoding and windowing so every analysis prompt fits token_budget,
+    using estimated tokens (no prompt is sent). build_prompt(formatted_transcript, encoding).
+    Returns a dict: encoding, window_seconds, windows (entry-index lists), prompt_tokens
+    (estimate per window), total_tokens, fits.
+    """
+    transcript = as_transcript_index(transcript)
+    encodings = ['verbose', 'compact'] if encoding == 'auto' else [encoding]
+    span = (max(transcript.ends) - min(transcript.starts)) if len(transcript) else 0
+    
+    plan = None
+    for enc in encodings:
+        # Per-line estimates are computed once; each candidate windowing is priced by summing
+        line_tokens = line_token_counts(transcript, enc)
+        overhead = estimate_tokens(build_prompt("", enc))
+        seconds = window_seconds
+        while True:
+            overlap = min(window_overlap, seconds / 4) if seconds else window_overlap
+            windows = split_transcript_windows(transcript, seconds, overlap)
+            prompt_tokens = [overhead + sum(line_tokens[i] for i in indices) for indices in windows]
+            plan = {
+                'encoding': enc,
+                'window_seconds': seconds,
+                'windows': windows,
+                'prompt_tokens': prompt_tokens,
+                'total_tokens': sum(prompt_tokens),
+                'fits': max(prompt_tokens, default=0) <= token_budget,
+            }
+            # In 'auto' mode, switch to the compact encoding before shrinking windows
+            if plan['fits'] or enc != encodings[-1]:
+                break
+            current = min(seconds or span, span)
+            if current / 2 < MIN_ANALYSIS_WINDOW_SECONDS:
+                break
+            seconds = current / 2
+        if plan['fits']:
+            break
+    
+    print(f"Prompt plan: {plan['encoding']} encoding, {len(plan['windows'])} call(s), "
+          f"~{max(plan['prompt_tokens'], default=0)} tokens max per prompt, ~{plan['total_tokens']} total "
+          f"(budget {token_budget}{'' if plan['fits'] else ' - EXCEEDED'})")
+    return plan
+
+
+def plan_clip_analysis(transcript, mode, max_clip_seconds, max_clips, window_seconds=ANALYSIS_WINDOW_SECONDS,
+                       window_overlap=ANALYSIS_WINDOW_OVERLAP, token_budget=PROMPT_TOKEN_BUDGET, encoding=PROMPT_ENCODING):
+    """
+    The prompt plan analyze_humor (mode="humor") or analyze_quotes (mode="quotes") will use,
+    so callers can report the prompt size (or pick streaming vs chunked) before sending.
+    """
+    prompt = _humor_prompt if mode == "humor" else _quotes_prompt
+    return plan_analysis_prompts(
+        transcript, lambda formatted_transcript, enc: prompt(formatted_transcript, max_clip_seconds, max_clips, enc),
+        window_seconds, window_overlap, token_budget, encoding
+    )
+
+
+def _collect_clips(transcript, build_prompt, parse_response, score_field, api_key, provider, model,
+                   window_seconds, window_overlap, max_workers, token_budget=PROMPT_TOKEN_BUDGET, encoding=PROMPT_ENCODING):
+    """
+    Runs the analysis prompt over the transcript and returns the raw candidate clip dicts.
+    Short transcripts use a single call; long ones (or ones over the token budget) are
+    analyzed window by window in parallel and the candidates merged (map-reduce).
+    """
+    transcript = as_transcript_index(transcript)
+    plan = plan_analysis_prompts(transcript, build_prompt, window_seconds, window_overlap, token_budget, encoding)
+    windows = plan['windows']
+    enc = plan['encoding']
+    start_pad, end_pad = COMPACT_CLIP_PADDING.get(score_field, (0.0, 0.0))
+    
+    def analyze(indices):
+        formatted_transcript = format_transcript(transcript, indices, enc)
+        clips = parse_response(call_llm(build_prompt(formatted_transcript, enc), provider, model, api_key))
+        # Compact answers carry line numbers - resolve them to exact times
+        return resolve_line_clips(transcript, clips, start_pad, end_pad)
+    
+    if len(windows) <= 1:
+        return analyze(range(len(transcript)))
+    
+    if max_workers is None:
+        max_workers = ANALYSIS_CONCURRENCY.get(provider, 2)
+    print(f"Chunked analysis: {len(windows)} windows of {plan['window_seconds']:.0f}s, {max_workers} in parallel")
+    
+    def analyze_window(indices):
+        try:
+            return analyze(indices)
+        except Exception as e:
+            print(f"Error analyzing window (lines {indices[0]+1}-{indices[-1]+1}): {e}")
+            return []
+    
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(windows)))) as executor:
+        window_clips = list(executor.map(bind_context(analyze_window), windows))
+    
+    return merge_window_clips(window_clips, score_field)
+
+# Timing instructions for the verbose encoding (model answers with times)
+HUMOR_TIMING = """TIMING IS CRITICAL - Each transcript line shows [START_TIME - END_TIME]:
+    - Your clip "end" time MUST be the END_TIME of the last line you want to include, NOT the START_TIME
+    - The END_TIME is when the speaker FINISHES saying that line
+    - If you use a START_TIME as your end, you will CUT OFF their sentence mid-word
+    - Always include an extra 1-2 seconds after the last line's END_TIME for breathing room"""
+QUOTES_TIMING = """TIMING IS CRITICAL - Each transcript line shows [START_TIME - END_TIME]:
+    - Your clip "end" time MUST be the END_TIME of the last line you want to include, NOT the START_TIME
+    - The END_TIME is when the speaker FINISHES saying that line
+    - If you use a START_TIME as your end, you will CUT OFF their sentence mid-word
+    - Always add 2-3 seconds AFTER the last line's END_TIME for breathing room"""
+# Compact encoding: the model answers with line numbers; times (and the breathing room
+# the verbose prompts ask for) are resolved locally - see COMPACT_CLIP_PADDING
+COMPACT_TIMING = """TRANSCRIPT FORMAT - Each line is LINE_NUMBER|START_SECONDS|TEXT:
+    - "start_line" is the LINE_NUMBER where the clip begins; "end_line" is the LINE_NUMBER of the last line to include
+    - The clip ends when the speaker FINISHES the end_line, so pick the line that completes the thought
+    - Use START_SECONDS to keep clips within the length limit; exact times are filled in from the line numbers"""
+
+
+def _prompt_timing_parts(encoding, verbose_timing):
+    """
+    Returns (fields, first example span, second example span, timing instructions)
+    for the analysis prompts in the given transcript encoding.
+    """
+    if encoding == "compact":
+        return '"start_line", "end_line"', '"start_line": 12, "end_line": 15', '"start_line": 40, "end_line": 46', COMPACT_TIMING
+    return '"start", "end"', '"start": 10.5, "end": 20.0', '"start": 45.0, "end": 60.0', verbose_timing
+
+
+def _humor_prompt(formatted_transcript, max_clip_seconds, max_clips, encoding="verbose"):
+    """
+    Builds the humor analysis prompt for a transcript formatted with `encoding`.
+    """
+    fields, first_span, second_span, timing = _prompt_timing_parts(encoding, HUMOR_TIMING)
+    return f"""
     You are an expert video editor and comedian. Your task is to analyze the following transcript of a YouTube video and identify the FUNNIEST sections to create a "gag reel".
     
     CRITICAL INSTRUCTION: You must return valid JSON only. Do not wrap it in markdown code blocks.
-    The JSON should be a list of objects with "start", "end", "humor_score", and "reasoning" fields.
+    The JSON should be a list of objects with {fields}, "humor_score", and "reasoning" fields.
     
     HUMOR SCORE (1-10):
     - 10: Absolutely hilarious, guaranteed laugh-out-loud moment
@@ -338,15 +848,11 @@ def analyze_humor(transcript, api_key, max_clip_seconds=15, max_clips=5, provide
     
     Example: 
     [
-        {{"start": 10.5, "end": 20.0, "humor_score": 9, "reasoning": "Perfect timing on the joke about penguins, followed by genuine laughter."}}, 
-        {{"start": 45.0, "end": 60.0, "humor_score": 8, "reasoning": "Absurd situation that escalates quickly, very unexpected."}}
+        {{{first_span}, "humor_score": 9, "reasoning": "Perfect timing on the joke about penguins, followed by genuine laughter."}}, 
+        {{{second_span}, "humor_score": 8, "reasoning": "Absurd situation that escalates quickly, very unexpected."}}
     ]
     
-    TIMING IS CRITICAL - Each transcript line shows [START_TIME - END_TIME]:
-    - Your clip "end" time MUST be the END_TIME of the last line you want to include, NOT the START_TIME
-    - The END_TIME is when the speaker FINISHES saying that line
-    - If you use a START_TIME as your end, you will CUT OFF their sentence mid-word
-    - Always include an extra 1-2 seconds after the last line's END_TIME for breathing room
+    {timing}
     
     CRITERIA:
     1. Focus ONLY on genuinely HUMOROUS content: jokes, punchlines, funny reactions, laughter, comedic timing, or absurd statements.
@@ -370,35 +876,88 @@ def analyze_humor(transcript, api_key, max_clip_seconds=15, max_clips=5, provide
     {formatted_transcript}
     """
 
+
+def _line_clip_matches(text_response, score_field):
+    """
+    Regex fallback for compact-encoding answers: clips given as "start_line"/"end_line"
+    (optionally followed by the score and reasoning). Returns clip dicts with line
+    numbers - callers resolve them to times with resolve_line_clips like JSON answers.
+    """
+    import re
+    pattern = (r'"start_line"\s*:\s*(\d+)\s*,\s*"end_line"\s*:\s*(\d+)'
+               rf'(?:\s*,\s*"{score_field}"\s*:\s*(\d+))?(?:\s*,\s*"reasoning"\s*:\s*(".*?"))?')
+    clips = []
+    for m in re.findall(pattern, text_response):
+        clip = {"start_line": int(m[0]), "end_line": int(m[1]), score_field: int(m[2]) if m[2] else 10}
+        if m[3]:
+            clip["reasoning"] = m[3].strip('"')
+        clips.append(clip)
+    return clips
+
+def _parse_humor_response(text_response):
+    """
+    Parses the humor analysis response (JSON, with a regex fallback for both the
+    verbose "start"/"end" and the compact "start_line"/"end_line" answers).
+    Returns a list of clip dicts, or [] if nothing could be parsed.
+    """
+    # Cleanup if model adds markdown
+    if text_response.startswith("```json"):
+        text_response = text_response[7:]
+    if text_response.startswith("```"):
+        text_response = text_response[3:]
+    if text_response.endswith("```"):
+        text_response = text_response[:-3]
+    
+    text_response = text_response.strip()
+    
+    # Try to parse as JSON first
     try:
-        text_response = call_llm(prompt, provider, model, api_key)
-        
-        # Cleanup if model adds markdown
-        if text_response.startswith("```json"):
-            text_response = text_response[7:]
-        if text_response.startswith("```"):
-            text_response = text_response[3:]
-        if text_response.endswith("```"):
-            text_response = text_response[:-3]
-        
-        text_response = text_response.strip()
-        
-        # Try to parse as JSON first
-        try:
-            clips = json.loads(text_response)
-        except json.JSONDecodeError:
-            # Fallback: use regex to extract timestamp pairs with optional humor_score
-            import re
-            print(f"JSON parse failed, trying regex fallback...")
-            # Updated regex to handle reasoning (though simple regex might fail on complex reasoning strings, this is a fallback)
-            pattern = r'"start"\s*:\s*([\d.]+)\s*,\s*"end"\s*:\s*([\d.]+)\s*,\s*"humor_score"\s*:\s*(\d+)\s*,\s*"reasoning"\s*:\s*(".*?")'
-            matches = re.findall(pattern, text_response)
-            if matches:
-                # Fallback won't capture reasoning perfectly via regex, so we mock it if needed
-                clips = [{"start": float(m[0]), "end": float(m[1]), "humor_score": int(m[2]), "reasoning": m[3].strip('"')} for m in matches]
-            else:
-                print(f"Regex fallback also failed")
-                return []
+        clips = json.loads(text_response)
+    except json.JSONDecodeError:
+        # Fallback: use regex to extract timestamp pairs with optional humor_score
+        import re
+        print(f"JSON parse failed, trying regex fallback...")
+        # Updated regex to handle reasoning (though simple regex might fail on complex reasoning strings, this is a fallback)
+        pattern = r'"start"\s*:\s*([\d.]+)\s*,\s*"end"\s*:\s*([\d.]+)\s*,\s*"humor_score"\s*:\s*(\d+)\s*,\s*"reasoning"\s*:\s*(".*?")'
+        matches = re.findall(pattern, text_response)
+        if matches:
+            # Fallback won't capture reasoning perfectly via regex, so we mock it if needed
+            clips = [{"start": float(m[0]), "end": float(m[1]), "humor_score": int(m[2]), "reasoning": m[3].strip('"')} for m in matches]
+        else:
+            clips = _line_clip_matches(text_response, "humor_score")
+        if not clips:
+            print(f"Regex fallback also failed")
+            return []
+    
+    return clips
+
+@traced("analysis.humor", on_result=lambda clips: {'clips': len(clips)})
+def analyze_humor(transcript, api_key, max_clip_seconds=15, max_clips=5, provider="Google Gemini", model="gemini-2.5-flash",
+                  window_seconds=ANALYSIS_WINDOW_SECONDS, window_overlap=ANALYSIS_WINDOW_OVERLAP, max_workers=None,
+                  token_budget=PROMPT_TOKEN_BUDGET, encoding=PROMPT_ENCODING, audio_source=None,
+                  audio_coverage=AUDIO_PREFILTER_COVERAGE):
+    """
+    Sends the transcript to LLM to identify humorous sections.
+    Transcripts longer than window_seconds are split into overlapping windows that are
+    analyzed in parallel (max_workers) and merged before filtering; pass window_seconds=None
+    to send the whole transcript in one call when it fits token_budget.
+    encoding: transcript encoding ('compact', 'verbose' or 'auto'), see plan_analysis_prompts.
+    audio_source: video file or YouTube URL - if given, only lines near the loudest /
+    most laughter-like audio (audio_coverage of the timeline) are sent, see prefilter_transcript.
+    Returns a list of (start, end) tuples.
+    """
+    if not api_key:
+        raise ValueError("API Key is required")
+    if audio_source:
+        transcript, _ = prefilter_transcript(transcript, audio_source, audio_coverage, encoding)
+
+    try:
+        clips = _collect_clips(
+            transcript,
+            lambda formatted_transcript, enc: _humor_prompt(formatted_transcript, max_clip_seconds, max_clips, enc),
+            _parse_humor_response, "humor_score", api_key, provider, model,
+            window_seconds, window_overlap, max_workers, token_budget, encoding
+        )
         
         # Process clips: filter by humor_score and enforce max length
         MINIMUM_HUMOR_SCORE = 8
@@ -440,28 +999,16 @@ def analyze_humor(transcript, api_key, max_clip_seconds=15, max_clips=5, provide
         # Return empty list on failure so the app doesn't crash
         return []
 
-def analyze_quotes(transcript, api_key, max_clip_seconds=15, max_clips=5, provider="Google Gemini", model="gemini-2.5-flash"):
+def _quotes_prompt(formatted_transcript, max_clip_seconds, max_clips, encoding="verbose"):
     """
-    Sends the transcript to LLM to identify memorable quotes.
-    Returns a list of (start, end) tuples.
+    Builds the memorable-quotes analysis prompt for a transcript formatted with `encoding`.
     """
-    if not api_key:
-        raise ValueError("API Key is required")
-
-    # Prepare transcript for prompt - include start AND end times with clear labels
-    formatted_transcript = ""
-    for i, entry in enumerate(transcript):
-        start = entry['start']
-        duration = entry.get('duration', 3)  # Default 3s if missing
-        end = start + duration
-        text = entry['text']
-        formatted_transcript += f"LINE {i+1} | START:{start:.2f}s | END:{end:.2f}s | TEXT: \"{text}\"\n"
-
-    prompt = f"""
+    fields, first_span, second_span, timing = _prompt_timing_parts(encoding, QUOTES_TIMING)
+    return f"""
     You are a world-class video editor with impeccable taste. Your job is to find ONLY the most EXCEPTIONAL moments in this transcript - the kind of quotes that would make someone stop scrolling and share the video.
     
     CRITICAL INSTRUCTION: You must return valid JSON only. Do not wrap it in markdown code blocks.
-    The JSON should be a list of objects with "start", "end", "quality_score", and "reasoning" fields.
+    The JSON should be a list of objects with {fields}, "quality_score", and "reasoning" fields.
     
     QUALITY SCORE (1-10):
     - 10: Absolutely legendary quote, instantly shareable
@@ -472,15 +1019,11 @@ def analyze_quotes(transcript, api_key, max_clip_seconds=15, max_clips=5, provid
     
     Example: 
     [
-        {{"start": 10.5, "end": 20.0, "quality_score": 9, "reasoning": "Profound insight about life that resonates universally."}}, 
-        {{"start": 45.0, "end": 60.0, "quality_score": 8, "reasoning": "Very witty remark that perfectly sums up the situation."}}
+        {{{first_span}, "quality_score": 9, "reasoning": "Profound insight about life that resonates universally."}}, 
+        {{{second_span}, "quality_score": 8, "reasoning": "Very witty remark that perfectly sums up the situation."}}
     ]
     
-    TIMING IS CRITICAL - Each transcript line shows [START_TIME - END_TIME]:
-    - Your clip "end" time MUST be the END_TIME of the last line you want to include, NOT the START_TIME
-    - The END_TIME is when the speaker FINISHES saying that line
-    - If you use a START_TIME as your end, you will CUT OFF their sentence mid-word
-    - Always add 2-3 seconds AFTER the last line's END_TIME for breathing room
+    {timing}
     
     ABSOLUTE REQUIREMENTS FOR COMPLETENESS (READ CAREFULLY):
     - **NEVER cut off a sentence mid-thought.**
@@ -529,33 +1072,64 @@ def analyze_quotes(transcript, api_key, max_clip_seconds=15, max_clips=5, provid
     {formatted_transcript}
     """
 
+
+def _parse_quotes_response(text_response):
+    """
+    Parses the quotes analysis response (JSON, with a regex fallback for both the
+    verbose "start"/"end" and the compact "start_line"/"end_line" answers).
+    Returns a list of clip dicts, or [] if nothing could be parsed.
+    """
+    # Cleanup if model adds markdown
+    if text_response.startswith("```json"):
+        text_response = text_response[7:]
+    if text_response.startswith("```"):
+        text_response = text_response[3:]
+    if text_response.endswith("```"):
+        text_response = text_response[:-3]
+    
+    text_response = text_response.strip()
+    
+    # Try to parse as JSON first
     try:
-        text_response = call_llm(prompt, provider, model, api_key)
-        
-        # Cleanup if model adds markdown
-        if text_response.startswith("```json"):
-            text_response = text_response[7:]
-        if text_response.startswith("```"):
-            text_response = text_response[3:]
-        if text_response.endswith("```"):
-            text_response = text_response[:-3]
-        
-        text_response = text_response.strip()
-        
-        # Try to parse as JSON first
-        try:
-            clips = json.loads(text_response)
-        except json.JSONDecodeError:
-            # Fallback: use regex to extract timestamp pairs with optional quality_score
-            import re
-            print(f"JSON parse failed, trying regex fallback...")
-            pattern = r'"start"\s*:\s*([\d.]+)\s*,\s*"end"\s*:\s*([\d.]+)(?:\s*,\s*"quality_score"\s*:\s*(\d+))?'
-            matches = re.findall(pattern, text_response)
-            if matches:
-                clips = [{"start": float(m[0]), "end": float(m[1]), "quality_score": int(m[2]) if m[2] else 10} for m in matches]
-            else:
-                print(f"Regex fallback also failed")
-                return []
+        clips = json.loads(text_response)
+    except json.JSONDecodeError:
+        # Fallback: use regex to extract timestamp pairs with optional quality_score
+        import re
+        print(f"JSON parse failed, trying regex fallback...")
+        pattern = r'"start"\s*:\s*([\d.]+)\s*,\s*"end"\s*:\s*([\d.]+)(?:\s*,\s*"quality_score"\s*:\s*(\d+))?'
+        matches = re.findall(pattern, text_response)
+        if matches:
+            clips = [{"start": float(m[0]), "end": float(m[1]), "quality_score": int(m[2]) if m[2] else 10} for m in matches]
+        else:
+            clips = _line_clip_matches(text_response, "quality_score")
+        if not clips:
+            print(f"Regex fallback also failed")
+            return []
+    
+    return clips
+
+@traced("analysis.quotes", on_result=lambda clips: {'clips': len(clips)})
+def analyze_quotes(transcript, api_key, max_clip_seconds=15, max_clips=5, provider="Google Gemini", model="gemini-2.5-flash",
+                   window_seconds=ANALYSIS_WINDOW_SECONDS, window_overlap=ANALYSIS_WINDOW_OVERLAP, max_workers=None,
+                   token_budget=PROMPT_TOKEN_BUDGET, encoding=PROMPT_ENCODING):
+    """
+    Sends the transcript to LLM to identify memorable quotes.
+    Transcripts longer than window_seconds are split into overlapping windows that are
+    analyzed in parallel (max_workers) and merged before filtering; pass window_seconds=None
+    to send the whole transcript in one call when it fits token_budget.
+    encoding: transcript encoding ('compact', 'verbose' or 'auto'), see plan_analysis_prompts.
+    Returns a list of (start, end) tuples.
+    """
+    if not api_key:
+        raise ValueError("API Key is required")
+
+    try:
+        clips = _collect_clips(
+            transcript,
+            lambda formatted_transcript, enc: _quotes_prompt(formatted_transcript, max_clip_seconds, max_clips, enc),
+            _parse_quotes_response, "quality_score", api_key, provider, model,
+            window_seconds, window_overlap, max_workers, token_budget, encoding
+        )
         
         # Process clips: filter by quality_score and enforce max length
         MINIMUM_QUALITY_SCORE = 8
@@ -594,10 +1168,327 @@ def analyze_quotes(transcript, api_key, max_clip_seconds=15, max_clips=5, provid
         print(f"Error analyzing quotes: {e}")
         return []
 
+def call_llm_stream(prompt, provider, model, api_key, use_cache=True):
+    """
+    Streaming version of call_llm: yields text chunks as the model generates them.
+    Cache hits are yielded as a single chunk. If the stream can't be opened (e.g. the
+    model rejects our parameters) it falls back to call_llm and yields the full text.
+    """
+    cache_key = None
+    if use_cache and LLM_CACHE is not None:
+        cache_key = make_cache_key(provider, model.strip(), prompt, _generation_params(provider, model))
+        cached = LLM_CACHE.get(cache_key)
+        if cached is not None:
+            print(f"DEBUG: LLM cache hit ({provider} '{model}')")
+            yield cached
+            return
+    
+    chunks = []
+    with span("llm.stream", provider=provider, model=model, prompt_chars=len(prompt)) as llm_span:
+        opened = time.perf_counter()
+        try:
+            # Holds one of the provider's in-flight slots for the whole stream (no retries -
+            # a stream that can't be opened falls back to call_llm, which retries)
+            with get_limiter(provider).slot():
+                for chunk in _stream_provider(prompt, provider, model, api_key):
+                    if chunk:
+                        if not chunks:
+                            llm_span.set(first_chunk_seconds=round(time.perf_counter() - opened, 6))
+                        chunks.append(chunk)
+                        yield chunk
+        except Exception as e:
+            if chunks:
+                raise
+            print(f"DEBUG: Streaming failed ({e}), falling back to a blocking call")
+            llm_span.set(fallback=True)
+            text_response = call_llm(prompt, provider, model, api_key, use_cache=use_cache)
+            yield text_response
+            return
+        llm_span.set(response_chars=sum(len(chunk) for chunk in chunks))
+    
+    text_response = "".join(chunks).strip()
+    if cache_key is not None and text_response:
+        LLM_CACHE.set(cache_key, text_response)
+
+
+def _stream_provider(prompt, provider, model, api_key):
+    """
+    Opens a streaming request to the provider and yields raw text chunks.
+    """
+    custom = get_custom_provider(provider)
+    if custom is not None:
+        yield from custom.stream(prompt, model)
+    
+    elif provider == "Google Gemini":
+        client = get_llm_client(provider, api_key)
+        print(f"DEBUG: Streaming Gemini with model '{model}'")
+        shape = MODEL_CAPABILITIES.working_shape(provider, model) or []
+        for chunk in client.models.generate_content_stream(model=model, contents=prompt, **_gemini_request_kwargs(model, shape)):
+            yield chunk.text or ""
+    
+    elif provider == "OpenAI":
+        client = get_llm_client(provider, api_key)
+        model = model.strip()
+        print(f"DEBUG: Streaming OpenAI with model '{model}'")
+        params = {
+            "model": model,
+            "messages": [{"role": "user", "content": prompt}],
+            "stream": True,
+        }
+        params.update(_openai_request_params(model, MODEL_CAPABILITIES.working_shape(provider, model) or []))
+        for chunk in client.chat.completions.create(**params):
+            if chunk.choices:
+                yield chunk.choices[0].delta.content or ""
+    
+    elif provider == "Anthropic":
+        client = get_llm_client(provider, api_key)
+        print(f"DEBUG: Streaming Anthropic with model '{model}'")
+        with client.messages.stream(
+            model=model,
+            max_tokens=8192,
+            messages=[{"role": "user", "content": prompt}]
+        ) as stream:
+            yield from stream.text_stream
+    
+    else:
+        raise ValueError(f"Unknown provider: {provider}")
+
+
+class IncrementalJSONArrayParser:
+    """
+    Incremental parser for a streamed JSON array of objects.
+    feed() returns each top-level object as soon as its closing brace arrives.
+    Text before the opening '[' (e.g. a markdown fence) is ignored.
+    """
+    def __init__(self):
+        self.started = False
+        self.done = False
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._buffer = []
+    
+    def feed(self, text):
+        objects = []
+        for ch in text:
+            if self.done:
+                break
+            if not self.started:
+                if ch == '[':
+                    self.started = True
+                    self._depth = 1
+                continue
+            
+            if self._in_string:
+                self._buffer.append(ch)
+                if self._escape:
+                    self._escape = False
+                elif ch == '\\':
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                continue
+            
+            if ch in '{[':
+                self._depth += 1
+                if self._depth == 2:
+                    self._buffer = []
+                self._buffer.append(ch)
+            elif ch in '}]':
+                self._depth -= 1
+                if self._depth == 0:
+                    self.done = True  # End of the top-level array
+                    continue
+                self._buffer.append(ch)
+                if self._depth == 1:
+                    try:
+                        objects.append(json.loads("".join(self._buffer)))
+                    except ValueError:
+                        pass
+                    self._buffer = []
+            else:
+                if ch == '"':
+                    self._in_string = True
+                if self._depth >= 2:
+                    self._buffer.append(ch)
+        return objects
+
+
+def _stream_clips(transcript, build_prompt, parse_response, score_field, min_score, api_key, max_clip_seconds, max_clips, provider, model,
+                  token_budget=PROMPT_TOKEN_BUDGET, encoding=PROMPT_ENCODING):
+    """
+    Streams the analysis response and yields (start, end) tuples as each clip object
+    closes, applying the score filter, max length and max_clips cap on the fly.
+    If nothing could be parsed incrementally, the full text goes through parse_response
+    (which has the regex fallback).
+    """
+    transcript = as_transcript_index(transcript)
+    # Single call: the plan only picks the encoding ('auto' -> verbose if it fits)
+    enc = plan_analysis_prompts(transcript, build_prompt, None, 0, token_budget, encoding)['encoding']
+    prompt = build_prompt(format_transcript(transcript, range(len(transcript)), enc), enc)
+    start_pad, end_pad = COMPACT_CLIP_PADDING.get(score_field, (0.0, 0.0))
+    parser = IncrementalJSONArrayParser()
+    chunks = []
+    emitted = 0
+    seen_objects = False
+    
+    def accept(clip):
+        resolved = resolve_line_clips(transcript, [clip], start_pad, end_pad)
+        if not resolved:
+            return None
+        clip = resolved[0]
+        try:
+            start = float(clip['start'])
+            end = float(clip['end'])
+        except (KeyError, TypeError, ValueError):
+            return None
+        score = _clip_score(clip, score_field)
+        if score < min_score:
+            print(f"Filtered out clip ({start:.1f}s - {end:.1f}s) Score: {score}. Reason: {clip.get('reasoning', 'No reasoning provided')}")
+            return None
+        print(f"ACCEPTED clip ({start:.1f}s - {end:.1f}s) Score: {score}. Reason: {clip.get('reasoning', 'No reasoning provided')}")
+        # Enforce max clip length
+        if end - start > max_clip_seconds:
+            end = start + max_clip_seconds
+        return (start, end)
+    
+    # Includes the time the consumer spends between clips (e.g. validation submits)
+    with span("analysis.stream", score_field=score_field, prompt_chars=len(prompt)):
+        for chunk in call_llm_stream(prompt, provider, model, api_key):
+            chunks.append(chunk)
+            for clip in parser.feed(chunk):
+                if not isinstance(clip, dict):
+                    continue
+                seen_objects = True
+                interval = accept(clip)
+                if interval and emitted < max_clips:
+                    emitted += 1
+                    yield interval
+    
+    if not seen_objects:
+        # Not a clean JSON array - fall back to the non-streaming parser
+        for clip in parse_response("".join(chunks).strip()):
+            interval = accept(clip)
+            if interval and emitted < max_clips:
+                emitted += 1
+                yield interval
+
+
+def analyze_humor_stream(transcript, api_key, max_clip_seconds=15, max_clips=5, provider="Google Gemini", model="gemini-2.5-flash",
+                         token_budget=PROMPT_TOKEN_BUDGET, encoding=PROMPT_ENCODING, audio_source=None,
+                         audio_coverage=AUDIO_PREFILTER_COVERAGE):
+    """
+    Streaming version of analyze_humor (single call, no windowing): yields (start, end)
+    tuples as soon as each clip arrives, so validation/previews can start early.
+    """
+    if not api_key:
+        raise ValueError("API Key is required")
+    if audio_source:
+        transcript, _ = prefilter_transcript(transcript, audio_source, audio_coverage, encoding)
+    
+    try:
+        yield from _stream_clips(
+            transcript,
+            lambda formatted_transcript, enc: _humor_prompt(formatted_transcript, max_clip_seconds, max_clips, enc),
+            _parse_humor_response, "humor_score", 8, api_key, max_clip_seconds, max_clips, provider, model,
+            token_budget, encoding
+        )
+    except Exception as e:
+        print(f"Error analyzing humor (streaming): {e}")
+
+
+def analyze_quotes_stream(transcript, api_key, max_clip_seconds=15, max_clips=5, provider="Google Gemini", model="gemini-2.5-flash",
+                          token_budget=PROMPT_TOKEN_BUDGET, encoding=PROMPT_ENCODING):
+    """
+    Streaming version of analyze_quotes (single call, no windowing): yields (start, end)
+    tuples as soon as each clip arrives, so validation/previews can start early.
+    """
+    if not api_key:
+        raise ValueError("API Key is required")
+    
+    try:
+        yield from _stream_clips(
+            transcript,
+            lambda formatted_transcript, enc: _quotes_prompt(formatted_transcript, max_clip_seconds, max_clips, enc),
+            _parse_quotes_response, "quality_score", 8, api_key, max_clip_seconds, max_clips, provider, model,
+            token_budget, encoding
+        )
+    except Exception as e:
+        print(f"Error analyzing quotes (streaming): {e}")
+
+
+def validate_clips_as_found(transcript, clip_stream, api_key, max_clip_seconds, provider="Google Gemini", model="gemini-2.5-flash", max_workers=None,
+                            on_found=None, batch_window=VALIDATION_BATCH_WINDOW, batch_max=VALIDATION_BATCH_MAX):
+    """
+    Pipelines validation behind a clip stream (e.g. analyze_humor_stream): clips are
+    validated while later clips are still being generated. Clips arriving within
+    batch_window seconds of each other (up to batch_max) are validated together with
+    batched completeness checks (per-clip checks only as validate_and_expand_clips'
+    fallback); batch_window=0 validates each clip on its own as soon as it arrives.
+    on_found(count, interval) is called for every incoming clip, on the caller's thread.
+    Yields validated (start, end) tuples in arrival order; discarded clips are skipped.
+    """
+    transcript = as_transcript_index(transcript)
+    if max_workers is None:
+        max_workers = VALIDATION_CONCURRENCY.get(provider, 4)
+    
+    # The stream is read on its own thread so clips can be grouped while the model is still writing
+    arrivals = queue.Queue()
+    done = object()
+    
+    def read_stream():
+        try:
+            for interval in clip_stream:
+                arrivals.put(interval)
+        except Exception as e:  # pylint: disable=broad-except
+            arrivals.put(e)
+        arrivals.put(done)
+    
+    reader = threading.Thread(target=bind_context(read_stream), name="clip-stream", daemon=True)
+    reader.start()
+    
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        futures = []
+        found = 0
+        finished = False
+        while not finished:
+            group = []
+            deadline = None
+            while len(group) < max(1, batch_max):
+                timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+                try:
+                    item = arrivals.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if item is done:
+                    finished = True
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                group.append(item)
+                found += 1
+                if on_found:
+                    on_found(found, item)
+                if deadline is None:
+                    deadline = time.monotonic() + batch_window
+            
+            if group:
+                futures.append(executor.submit(
+                    bind_context(validate_and_expand_clips), transcript, group, api_key, max_clip_seconds, provider, model,
+                    None, len(group) > 1
+                ))
+            # Hand back anything already finished, in order
+            while futures and futures[0].done():
+                yield from futures.pop(0).result()
+        
+        for future in futures:
+            yield from future.result()
+
+@traced("transcript.parse", on_result=lambda transcript: {'entries': len(transcript)})
 def parse_manual_transcript(text):
     """
     Parses a manually pasted transcript string into the expected format:
-    [{'start': 0.0, 'text': 'words', 'duration': 5.0}, ...]
+    [{'start': 0.0, 'text': 'words', 'duration': 5.0}, ...] (returned as a compact Transcript)
     
     Supports:
     [00:12] Hello world
@@ -667,4 +1558,4 @@ def parse_manual_transcript(text):
         if entries[i]['duration'] < 2.0:
             entries[i]['duration'] = 2.0
         
-    return entries
+    return Transcript.from_entries(entries)
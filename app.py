@@ -1,21 +1,24 @@
 import streamlit as st
 import os
-import re
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
 from dotenv import load_dotenv
-from analysis_utils import get_transcript, analyze_humor, analyze_quotes, validate_and_expand_clips
-from video_utils import download_video, create_gag_reel, create_single_clip, PRE_ROLL_BUFFER, POST_ROLL_BUFFER
+from analysis_utils import (get_transcript, analyze_humor, analyze_quotes, validate_and_expand_clips,
+                            analyze_humor_stream, analyze_quotes_stream, validate_clips_as_found,
+                            plan_clip_analysis)
+from audio_utils import AUDIO_PREFILTER, AUDIO_PREFILTER_COVERAGE, prefilter_transcript
+from cache_utils import MEDIA_CACHE
+from llm_utils import CLIENT_POOL, HEDGE_MAX_FRACTION, HEDGE_PERCENTILE, LLM_HEDGE, HedgePolicy, set_hedge_policy
+from metrics_utils import MEMORY_SINK, add_sink, bind_context, instrumentation_enabled, set_trace_attributes, stage_breakdown, trace_context
+from profiling_utils import PROFILE_DIR, PROFILING_ENABLED, profile_stage, profiling_requested
+from transcript_utils import TranscriptIndex
+from video_utils import (BackgroundDownload, extract_video_id, download_video, download_video_sections, prefetch_video_info, source_covers, create_gag_reel, create_preview_clips, stitch_preview_clips,
+                         PRE_ROLL_BUFFER, POST_ROLL_BUFFER, PREVIEW_WORKERS)
 
 # Load env vars
 load_dotenv()
 
-def extract_video_id(url):
-    """Extracts the video ID from a YouTube URL."""
-    regex = r"(?:v=|\/)([0-9A-Za-z_-]{11}).*"
-    match = re.search(regex, url)
-    if match:
-        return match.group(1)
-    return None
-
 def run_clip_analysis(transcript, extraction_mode, api_key, max_clip_seconds, max_clips, provider, model):
     """
     Runs the appropriate analysis (humor or quotes) based on extraction_mode.
@@ -26,6 +29,148 @@ def run_clip_analysis(transcript, extraction_mode, api_key, max_clip_seconds, ma
     else:
         return analyze_quotes(transcript, api_key, max_clip_seconds, max_clips, provider, model)
 
+def fetch_video(url, intervals, ranges_only, info=None):
+    """
+    Downloads the video - only the clip ranges if ranges_only, otherwise the whole file.
+    info: optional yt-dlp info dict for range downloads (see prefetch_video_info)
+    Returns the local video path (or segment manifest path), or None on failure.
+    """
+    video_id = extract_video_id(url)
+    if ranges_only:
+        return download_video_sections(url, intervals, video_id=video_id, info=info)
+    return download_video(url, video_id=video_id)
+
+def set_cached_video(video_path):
+    """
+    Stores the session's video path, moving its media cache lease to the new file
+    so the file can't be evicted while this session uses it.
+    """
+    if MEDIA_CACHE is not None:
+        MEDIA_CACHE.release(st.session_state.get('video_lease'))
+        st.session_state.video_lease = MEDIA_CACHE.acquire(video_path) if video_path else None
+    st.session_state.cached_video_path = video_path
+
+def show_download_progress(download, placeholder):
+    """
+    Renders a BackgroundDownload's progress into a st.empty() placeholder.
+    """
+    if download is None:
+        return
+    fraction = download.progress()
+    if download.done():
+        placeholder.progress(1.0, text="Video downloaded")
+    elif fraction is None:
+        placeholder.progress(0.0, text="Downloading video in the background...")
+    else:
+        placeholder.progress(fraction, text=f"Downloading video in the background... {fraction:.0%}")
+
+def wait_for_download(download, placeholder):
+    """
+    Blocks until a BackgroundDownload finishes, updating its progress bar.
+    Returns the downloaded path, or None on failure.
+    """
+    while not download.done():
+        show_download_progress(download, placeholder)
+        time.sleep(0.25)
+    show_download_progress(download, placeholder)
+    return download.result()
+
+def run_with_progress(on_progress, func, *args, **kwargs):
+    """
+    Runs func(*args, **kwargs) on a worker thread, calling on_progress() on this thread
+    every 0.25s until it returns (Streamlit elements can only be updated from here).
+    Returns func's result.
+    """
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        future = executor.submit(bind_context(func), *args, **kwargs)
+        while True:
+            try:
+                return future.result(timeout=0.25)
+            except TimeoutError:
+                if on_progress:
+                    on_progress()
+
+def find_clips(transcript, extraction_mode, api_key, max_clip_seconds, max_clips, provider, model, on_progress=None,
+               audio_source=None, audio_coverage=AUDIO_PREFILTER_COVERAGE):
+    """
+    Runs analysis + completeness validation.
+    Transcripts that fit in one analysis window are streamed: each clip is validated as
+    soon as the model emits it. Longer ones use chunked analysis, then batched validation.
+    on_progress(): optional, called every 0.25s while waiting (e.g. to refresh other progress bars)
+    audio_source: YouTube URL or video file; for funny moments, only transcript lines near
+    the liveliest audio are analyzed (validation still sees the whole transcript)
+    Returns (number of clips found, list of validated (start, end) tuples).
+    """
+    analysis_transcript = transcript
+    if audio_source and extraction_mode == "😂 Funny Moments":
+        with st.spinner("Scanning audio for laughs..."):
+            analysis_transcript, report = run_with_progress(on_progress, prefilter_transcript, transcript, audio_source, audio_coverage)
+        if report:
+            st.caption(f"Audio prefilter: {report['lines_kept']:,}/{report['lines_total']:,} lines "
+                       f"({report['coverage']:.0%} of the audio), ~{report['tokens_saved']:,} prompt tokens saved")
+        else:
+            st.caption("Audio prefilter: audio unavailable, analyzing the whole transcript")
+    
+    # Report the prompt size before anything is sent
+    plan = plan_clip_analysis(analysis_transcript, "humor" if extraction_mode == "😂 Funny Moments" else "quotes", max_clip_seconds, max_clips)
+    st.caption(f"Prompt: {plan['encoding']} transcript, {len(plan['windows'])} call(s), "
+               f"~{max(plan['prompt_tokens'], default=0):,} tokens each (~{plan['total_tokens']:,} total)")
+    
+    if len(plan['windows']) > 1:
+        with st.spinner("Analyzing transcript..."):
+            intervals = run_with_progress(on_progress, run_clip_analysis, analysis_transcript, extraction_mode, api_key,
+                                          max_clip_seconds, max_clips, provider, model)
+        if not intervals:
+            return 0, []
+        with st.spinner(f"Validating {len(intervals)} clips for completeness..."):
+            return len(intervals), run_with_progress(on_progress, validate_and_expand_clips, transcript, intervals, api_key,
+                                                     max_clip_seconds, provider, model)
+    
+    status = st.empty()
+    status.info("Analyzing transcript...")
+    found = {'count': 0}
+    
+    def on_found(count, interval):
+        # Runs on the worker thread - the status line is redrawn by refresh()
+        found['count'] = count
+    
+    def refresh():
+        if found['count']:
+            status.info(f"Found {found['count']} clip(s) so far - validating each as it arrives...")
+        if on_progress:
+            on_progress()
+    
+    if extraction_mode == "😂 Funny Moments":
+        clip_stream = analyze_humor_stream(analysis_transcript, api_key, max_clip_seconds, max_clips, provider, model)
+    else:
+        clip_stream = analyze_quotes_stream(transcript, api_key, max_clip_seconds, max_clips, provider, model)
+    
+    intervals = run_with_progress(refresh, lambda: list(validate_clips_as_found(transcript, clip_stream, api_key, max_clip_seconds,
+                                                                                provider, model, on_found=on_found)))
+    status.empty()
+    return found['count'], intervals
+
+def show_stage_timings(session_id, video_id):
+    """
+    Sidebar table of where the time went for this session's current video.
+    """
+    records = MEMORY_SINK.recent(session=session_id, video_id=video_id) if video_id else []
+    if not records:
+        st.caption("No timings recorded yet for this video.")
+        return
+    st.table([
+        {'Stage': row['stage'], 'Seconds': f"{row['seconds']:.1f}", 'CPU (s)': f"{row['cpu']:.1f}",
+         'Runs': row['calls'], 'Share': f"{row['share']:.0%}"}
+        for row in stage_breakdown(records)
+    ])
+    llm_calls = [r for r in records if r['span'] in ("llm.call", "llm.stream")]
+    ffmpeg_runs = [r for r in records if r['span'] == "ffmpeg.run"]
+    if llm_calls:
+        st.caption(f"LLM: {len(llm_calls)} call(s), {sum(r['wall'] for r in llm_calls):.1f}s, "
+                   f"{sum(r.get('prompt_chars', 0) for r in llm_calls):,} prompt chars")
+    if ffmpeg_runs:
+        st.caption(f"FFmpeg: {len(ffmpeg_runs)} run(s), {sum(r['cpu_children'] for r in ffmpeg_runs):.1f}s CPU")
+
 def main():
     st.set_page_config(page_title="Video Highlight Extractor", page_icon="🎬", layout="wide")
     
@@ -92,6 +237,7 @@ def main():
                 os.environ["GEMINI_API_KEY"] = gemini_key
                 os.environ["OPENAI_API_KEY"] = openai_key
                 os.environ["ANTHROPIC_API_KEY"] = anthropic_key
+                CLIENT_POOL.invalidate()  # Drop clients built with the old keys
                 st.success("API Keys saved!")
         
         # Get the active API key based on provider
@@ -102,14 +248,60 @@ def main():
         else:  # Anthropic
             api_key = anthropic_key
         
+        # Hedging: slow calls are also sent to a backup model, the first answer wins
+        provider_keys = {"Google Gemini": gemini_key, "OpenAI": openai_key, "Anthropic": anthropic_key}
+        provider_models = {"Google Gemini": GEMINI_MODELS, "OpenAI": OPENAI_MODELS, "Anthropic": ANTHROPIC_MODELS}
+        backup_choices = ["Off"] + [f"{p}: {m}" for p, models in provider_models.items() if provider_keys[p]
+                                    for m in models if (p, m) != (provider, model)]
+        default_backup = ": ".join(part.strip() for part in LLM_HEDGE.split(":", 1)) if LLM_HEDGE else "Off"
+        backup = st.selectbox("🛡️ Backup model for slow calls", backup_choices,
+                              index=backup_choices.index(default_backup) if default_backup in backup_choices else 0,
+                              help=f"Calls slower than the usual {HEDGE_PERCENTILE:g}th percentile for this model are also sent to the backup; "
+                                   f"the first answer is used. At most {HEDGE_MAX_FRACTION:.0%} of calls are duplicated.")
+        if backup == "Off":
+            set_hedge_policy(None)
+        else:
+            backup_provider, backup_model = backup.split(": ", 1)
+            policy = st.session_state.get('hedge_policy')
+            # Keep the policy (and its hedging budget) across reruns while the choice is unchanged
+            if policy is None or (policy.provider, policy.model, policy.api_key) != (backup_provider, backup_model, provider_keys[backup_provider]):
+                policy = st.session_state.hedge_policy = HedgePolicy(backup_provider, backup_model, provider_keys[backup_provider])
+            set_hedge_policy(policy)
+            if policy.stats['hedged']:
+                st.caption(f"Hedged {policy.stats['hedged']} of {policy.stats['calls']} calls, backup answered first {policy.stats['backup_wins']}×")
+        
         st.divider()
         st.subheader("Extraction Mode")
         extraction_mode = st.radio("What to extract:", ["😂 Funny Moments", "💬 Memorable Quotes"], index=0)
+        audio_prefilter = st.checkbox("🎧 Audio prefilter", value=AUDIO_PREFILTER, disabled=extraction_mode != "😂 Funny Moments",
+                                      help="Scan the audio track (locally, CPU only) for loud, lively and laughter-like moments and only send "
+                                           "the transcript around them to the model. Cuts prompt tokens on long streams.")
+        audio_coverage = AUDIO_PREFILTER_COVERAGE
+        if audio_prefilter and extraction_mode == "😂 Funny Moments":
+            audio_coverage = st.slider("Audio coverage", min_value=0.1, max_value=0.9, value=AUDIO_PREFILTER_COVERAGE, step=0.05,
+                                       help="Share of the timeline (best-scoring audio first) whose transcript is analyzed.")
         
         st.divider()
         st.subheader("Clip Settings")
         max_clip_seconds = st.slider("Max Clip Length (seconds)", min_value=5, max_value=60, value=15, step=5)
         max_clips = st.slider("Max Number of Clips", min_value=3, max_value=50, value=10, step=1)
+        preview_workers = st.slider("Parallel Preview Renders", min_value=1, max_value=max(8, os.cpu_count() or 1), value=PREVIEW_WORKERS, step=1,
+                                    help="Number of preview clips rendered at the same time. FFmpeg threads are split evenly between them.")
+        final_previews = st.checkbox("🚀 Final-quality previews", value=True,
+                                     help="Render previews at final quality so the reel is stitched from them in seconds (no re-encode). Previews take a little longer to create.")
+        ranges_only = st.checkbox("⚡ Download only clip ranges", value=True,
+                                  help="Fetch just the time ranges around each clip instead of the whole video. The ranges are only known once the clips are, so they download after analysis (only the video lookup overlaps with it); turn this off to download the whole video during analysis. Re-analyzing may download again if new clips fall outside them.")
+        
+        st.divider()
+        if st.checkbox("📊 Stage timings", value=instrumentation_enabled(),
+                       help="Record per-stage timings (transcript, LLM calls, validation, download, renders) and show them here."):
+            add_sink(MEMORY_SINK)
+            if st.session_state.cached_url:
+                set_trace_attributes(video_id=extract_video_id(st.session_state.cached_url))
+            with st.expander("📊 Stage Timings", expanded=True):
+                show_stage_timings(st.session_state.trace_session, extract_video_id(st.session_state.cached_url or ""))
+        st.checkbox("🔬 Profile runs", value=PROFILING_ENABLED, key="profile_runs", disabled=PROFILING_ENABLED,
+                    help=f"Sample where the time goes (app runs, reel rendering, clip validation) and write flamegraph-ready collapsed stacks to {PROFILE_DIR}/.")
         
         st.divider()
         if st.button("🔄 Start Over"):
@@ -140,7 +332,7 @@ def main():
                 if st.button("🗑️ Start Fresh / New Video", use_container_width=True):
                     # Clear session state
                     st.session_state.cached_url = None
-                    st.session_state.cached_video_path = None
+                    set_cached_video(None)
                     st.session_state.cached_transcript = None
                     st.session_state.found_intervals = None
                     st.session_state.selected_clips = {}
@@ -155,31 +347,28 @@ def main():
                 transcript = st.session_state.cached_transcript
                 input_url = st.session_state.cached_url
                 
-                # Analyze for clips using helper function
-                with st.spinner("Analyzing transcript..."):
-                    intervals = run_clip_analysis(transcript, extraction_mode, api_key, max_clip_seconds, max_clips, provider, model)
+                # Analyze for clips and validate them for completeness
+                found_count, intervals = find_clips(transcript, extraction_mode, api_key, max_clip_seconds, max_clips, provider, model,
+                                                    audio_source=input_url if audio_prefilter else None, audio_coverage=audio_coverage)
                 
-                if not intervals:
+                if not found_count:
                     st.warning("No clips found with current settings. Try adjusting the slider or changing modes.")
                     return
                 
-                # Validate and expand clips for completeness
-                with st.spinner(f"Validating {len(intervals)} clips for completeness..."):
-                    intervals = validate_and_expand_clips(transcript, intervals, api_key, max_clip_seconds, provider, model)
-                
                 if not intervals:
                     st.warning("All clips were discarded during validation. Try increasing the max clip length.")
                     return
                 
                 # Ensure video is downloaded (may be missing if session expired or file deleted)
+                # (or if the new clips fall outside the previously downloaded ranges)
                 video_path = st.session_state.cached_video_path
-                if not video_path or not os.path.exists(video_path):
+                if not video_path or not source_covers(video_path, intervals):
                     with st.spinner("Downloading video..."):
-                        video_path = download_video(input_url)
+                        video_path = fetch_video(input_url, intervals, ranges_only)
                         if not video_path:
                             st.error("Failed to download video.")
                             return
-                        st.session_state.cached_video_path = video_path
+                        set_cached_video(video_path)
                 
                 st.success(f"Found {len(intervals)} validated clips!")
                 st.session_state.found_intervals = intervals
@@ -210,6 +399,14 @@ def main():
                 if not video_id:
                     st.error("Invalid YouTube URL.")
                     return
+                set_trace_attributes(video_id=video_id)
+                
+                # Start the full download now so it overlaps with transcript analysis
+                # (range downloads need the clip times, so only their format lookup starts now)
+                download = None if ranges_only else BackgroundDownload(url, video_id)
+                video_info = prefetch_video_info(url) if ranges_only else None
+                download_status = st.empty()
+                show_download_progress(download, download_status)
                 
                 # Fetch/parse transcript
                 transcript = None
@@ -218,43 +415,51 @@ def main():
                     with st.spinner("Parsing transcript..."):
                         transcript = parse_manual_transcript(manual_transcript)
                         if not transcript:
+                            if download:
+                                download.cancel()
                             st.error("Could not parse timestamps. Use format: '0:05 Hello'")
                             return
                 else:
                     with st.spinner("Fetching transcript..."):
                         transcript = get_transcript(video_id)
                         if not transcript:
+                            if download:
+                                download.cancel()
                             st.error("No transcript found. Try pasting one manually.")
                             return
                 
+                # Build the interval index once; it stands in for the transcript list everywhere
+                transcript = TranscriptIndex(transcript)
                 st.session_state.cached_transcript = transcript
                 st.session_state.cached_url = url
                 
-                # Analyze for clips FIRST (before downloading)
-                with st.spinner("Analyzing transcript..."):
-                    intervals = run_clip_analysis(transcript, extraction_mode, api_key, max_clip_seconds, max_clips, provider, model)
+                # Analyze for clips while the video downloads, validating each as it streams in
+                found_count, intervals = find_clips(transcript, extraction_mode, api_key, max_clip_seconds, max_clips, provider, model,
+                                                    on_progress=lambda: show_download_progress(download, download_status),
+                                                    audio_source=url if audio_prefilter else None, audio_coverage=audio_coverage)
                 
-                if not intervals:
-                    st.warning("No clips found in this video. Try a different video or adjust settings.")
+                if not found_count or not intervals:
+                    # Nothing to cut - don't keep downloading
+                    if download:
+                        download.cancel()
+                        download_status.empty()
+                    if not found_count:
+                        st.warning("No clips found in this video. Try a different video or adjust settings.")
+                    else:
+                        st.warning("All clips were discarded during validation. Try increasing the max clip length.")
                     return
                 
-                # Validate and expand clips for completeness
-                with st.spinner(f"Validating {len(intervals)} clips for completeness..."):
-                    intervals = validate_and_expand_clips(transcript, intervals, api_key, max_clip_seconds, provider, model)
+                st.success(f"Found {len(intervals)} validated clips!")
                 
-                if not intervals:
-                    st.warning("All clips were discarded during validation. Try increasing the max clip length.")
+                if download:
+                    video_path = wait_for_download(download, download_status)
+                else:
+                    with st.spinner("Downloading clip ranges..."):
+                        video_path = fetch_video(url, intervals, ranges_only, info=video_info.result())
+                if not video_path:
+                    st.error("Failed to download video.")
                     return
-                
-                st.success(f"Found {len(intervals)} validated clips! Downloading video...")
-                
-                # Download video ONLY if clips were found
-                with st.spinner("Downloading video..."):
-                    video_path = download_video(url)
-                    if not video_path:
-                        st.error("Failed to download video.")
-                        return
-                    st.session_state.cached_video_path = video_path
+                set_cached_video(video_path)
 
                 st.session_state.found_intervals = intervals
                 st.session_state.selected_clips = {i: True for i in range(len(intervals))}
@@ -285,18 +490,18 @@ def main():
         # Create preview clips if not already done
         if not st.session_state.preview_clips:
             st.info("Generating preview clips... This may take a moment.")
-            progress_bar = st.progress(0)
+            progress_bar = st.progress(0, text=f"Creating {len(intervals)} previews...")
             
-            for i, (start, end) in enumerate(intervals):
-                progress_bar.progress((i + 1) / len(intervals), text=f"Creating preview {i+1} of {len(intervals)}...")
-                try:
-                    preview_path = create_single_clip(video_path, start, end, i)
-                    if preview_path and os.path.exists(preview_path):
-                        st.session_state.preview_clips[i] = preview_path
-                    else:
-                        print(f"Preview clip {i} creation returned: {preview_path}")
-                except Exception as e:
-                    print(f"Error creating preview {i}: {e}")
+            def on_preview_done(done, total, index, path):
+                progress_bar.progress(done / total, text=f"Created preview {done} of {total}...")
+            
+            preview_quality = "final" if final_previews else "preview"
+            preview_paths = create_preview_clips(video_path, intervals, max_workers=preview_workers,
+                                                 progress_callback=on_preview_done, quality=preview_quality)
+            for i, preview_path in enumerate(preview_paths):
+                if preview_path:
+                    st.session_state.preview_clips[i] = preview_path
+            st.session_state.preview_quality = preview_quality
             
             progress_bar.empty()
             st.rerun()  # Rerun to show the previews
@@ -338,10 +543,16 @@ def main():
         with col2:
             if st.button("🎬 Stitch Selected Clips", type="primary", disabled=(num_selected == 0)):
                 # Get selected intervals
-                selected_intervals = [intervals[i] for i, selected in st.session_state.selected_clips.items() if selected]
+                selected = [i for i, is_selected in st.session_state.selected_clips.items() if is_selected]
+                selected_intervals = [intervals[i] for i in selected]
                 
                 with st.spinner("Creating final reel..."):
-                    output_file = create_gag_reel(video_path, selected_intervals)
+                    output_file = None
+                    if st.session_state.get('preview_quality') == "final":
+                        # Join the final-quality previews directly (falls back to a full render)
+                        output_file = stitch_preview_clips([st.session_state.preview_clips.get(i) for i in selected])
+                    if not output_file:
+                        output_file = create_gag_reel(video_path, selected_intervals)
                     if output_file:
                         st.session_state.final_reel = output_file
                         st.session_state.step = 3
@@ -375,4 +586,12 @@ def main():
             st.rerun()
 
 if __name__ == "__main__":
-    main()
+    # Spans recorded during this run are tagged with the session (and video, once known)
+    if 'trace_session' not in st.session_state:
+        st.session_state.trace_session = uuid.uuid4().hex[:8]
+    # Run phases are named after the step the run starts in (the toggle applies from the next run)
+    phase = {1: "input", 2: "preview", 3: "done"}.get(st.session_state.get('step', 1), "run")
+    with trace_context(session=st.session_state.trace_session), \
+            profiling_requested(st.session_state.get('profile_runs', False)), \
+            profile_stage(f"main-{phase}"):
+        main()
@@ -0,0 +1,255 @@
+import io
+import os
+import subprocess
+import threading
+import time
+
+import numpy as np
+
+from cache_utils import MEDIA_CACHE
+from metrics_utils import span
+from prompt_utils import TRANSCRIPT_ENCODERS, line_token_counts
+from transcript_utils import Transcript, TranscriptIndex, as_transcript_index
+
+# Audio prefilter for humor analysis: the audio track is decoded once (mono, low sample
+# rate) and scored in windows by loudness, onsets and laughter-like bursts; only
+# transcript lines near the best windows (AUDIO_PREFILTER_COVERAGE of the timeline)
+# are sent to the LLM. Opt-in: AUDIO_PREFILTER=1 or the app's sidebar toggle.
+AUDIO_PREFILTER = os.getenv("AUDIO_PREFILTER", "") not in ("", "0")
+AUDIO_PREFILTER_COVERAGE = float(os.getenv("AUDIO_PREFILTER_COVERAGE", "0.35"))
+AUDIO_SAMPLE_RATE = 8000
+AUDIO_FRAME_SECONDS = 0.05      # 20 feature frames per second
+AUDIO_WINDOW_SECONDS = 10.0
+AUDIO_WINDOW_HOP = 5.0
+AUDIO_CHUNK_SECONDS = 60        # PCM read from FFmpeg per step (bounds memory on long streams)
+# Transcript kept around each selected window (counted towards the coverage): setups come before the laugh
+AUDIO_CONTEXT_BEFORE = 20.0
+AUDIO_CONTEXT_AFTER = 5.0
+# Feature weights: loudness, onset rate, laughter-like bursts (3-8 Hz energy modulation)
+AUDIO_SCORE_WEIGHTS = (0.35, 0.25, 0.4)
+ONSET_DB = 6.0                  # Frame-to-frame rise counted as an onset
+BURST_BAND_HZ = (3.0, 8.0)
+
+# Counters over all prefilter runs (tokens_saved = estimated prompt tokens not sent)
+AUDIO_PREFILTER_STATS = {'runs': 0, 'tokens_full': 0, 'tokens_sent': 0, 'tokens_saved': 0}
+_stats_lock = threading.Lock()
+
+
+def _audio_input(source):
+    """
+    Resolves `source` (a local video/audio file or a YouTube URL) to
+    (ffmpeg input, HTTP headers, video_id for caching or None).
+    Range-download manifests don't cover the whole timeline, so they can't be used.
+    """
+    from video_utils import SEGMENT_MANIFEST_SUFFIX, audio_stream_url, extract_video_id
+
+    if os.path.exists(source):
+        if source.endswith(SEGMENT_MANIFEST_SUFFIX):
+            raise ValueError("Segment manifests only cover the clip ranges")
+        return source, {}, None
+    video_id = extract_video_id(source)
+    if not video_id:
+        raise ValueError(f"Not a file or YouTube URL: {source}")
+    stream_url, headers = audio_stream_url(source)
+    return stream_url, headers, video_id
+
+
+def decode_audio_features(source, headers=None, sample_rate=AUDIO_SAMPLE_RATE, frame_seconds=AUDIO_FRAME_SECONDS):
+    """
+    Decodes the audio track with FFmpeg (mono, sample_rate, 16-bit) and reduces it
+    chunk by chunk to per-frame features, so a multi-hour stream never sits in memory.
+    Returns (loudness_db, zero_crossing_rate) float32 arrays, one value per frame.
+    """
+    cmd = ['ffmpeg', '-nostdin', '-v', 'error']
+    if headers:
+        cmd += ['-headers', "".join(f"{key}: {value}\r\n" for key, value in headers.items())]
+    cmd += ['-i', source, '-vn', '-ac', '1', '-ar', str(sample_rate), '-f', 's16le', '-acodec', 'pcm_s16le', '-']
+
+    frame_len = int(sample_rate * frame_seconds)
+    chunk_bytes = frame_len * 2 * int(AUDIO_CHUNK_SECONDS / frame_seconds)
+    energies = []
+    crossings = []
+    with span("ffmpeg.run", tool="audio-decode") as decode_span:
+        process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        try:
+            pending = b""
+            while True:
+                data = process.stdout.read(chunk_bytes)
+                if not data:
+                    break
+                data = pending + data
+                usable = len(data) - len(data) % (frame_len * 2)
+                pending = data[usable:]
+                if not usable:
+                    continue
+                samples = np.frombuffer(data[:usable], dtype='<i2').astype(np.float32) / 32768.0
+                frames = samples.reshape(-1, frame_len)
+                energies.append(np.einsum('ij,ij->i', frames, frames) / frame_len)
+                signs = np.signbit(frames)
+                crossings.append(np.count_nonzero(signs[:, 1:] != signs[:, :-1], axis=1) / (frame_len - 1))
+            stderr = process.stderr.read()
+            if process.wait() != 0:
+                raise RuntimeError(f"FFmpeg failed: {stderr.decode(errors='replace').strip()[-300:]}")
+        finally:
+            if process.poll() is None:
+                process.kill()
+                process.wait()
+        decode_span.set(frames=sum(len(e) for e in energies))
+
+    if not energies:
+        raise RuntimeError("No audio decoded")
+    energy = np.concatenate(energies)
+    loudness = (10.0 * np.log10(energy + 1e-10)).astype(np.float32)
+    return loudness, np.concatenate(crossings).astype(np.float32)
+
+
+def load_audio_features(source):
+    """
+    Per-frame features for `source`, decoded once per YouTube video and kept in the
+    MEDIA_CACHE. Returns (loudness_db, zero_crossing_rate).
+    """
+    ffmpeg_input, headers, video_id = _audio_input(source)
+    cache_kind = f"audio-features-{AUDIO_SAMPLE_RATE}-{int(AUDIO_FRAME_SECONDS * 1000)}"
+    if MEDIA_CACHE is not None and video_id:
+        cached = MEDIA_CACHE.lookup(video_id, cache_kind)
+        if cached:
+            try:
+                with np.load(cached) as features:
+                    return features['loudness'], features['zcr']
+            except (OSError, ValueError, KeyError) as e:
+                print(f"DEBUG: Ignoring unreadable audio features for {video_id}: {e}")
+
+    loudness, zcr = decode_audio_features(ffmpeg_input, headers)
+    if MEDIA_CACHE is not None and video_id:
+        buffer = io.BytesIO()
+        np.savez(buffer, loudness=loudness, zcr=zcr)
+        MEDIA_CACHE.put_bytes(video_id, cache_kind, "features.npz", buffer.getvalue())
+    return loudness, zcr
+
+
+def _robust_z(values):
+    """
+    (values - median) / MAD, so a few very loud windows don't flatten the rest.
+    """
+    median = np.median(values)
+    mad = np.median(np.abs(values - median)) * 1.4826
+    return (values - median) / (mad + 1e-6)
+
+
+def score_windows(loudness, zcr, frame_seconds=AUDIO_FRAME_SECONDS, window_seconds=AUDIO_WINDOW_SECONDS,
+                  hop_seconds=AUDIO_WINDOW_HOP, weights=AUDIO_SCORE_WEIGHTS):
+    """
+    Scores overlapping windows of the per-frame features (all windows at once):
+    - loudness: mean level in dB
+    - onsets: share of frames rising by ONSET_DB or more (reactions, punchy delivery)
+    - bursts: power of the loudness envelope's 3-8 Hz modulation, i.e. "ha-ha-ha"
+      rhythm, weighted up for noisy (high zero-crossing) audio like laughter and applause
+    Each feature is robust-z-scored across windows before weighting.
+    Returns (window start times in seconds, scores).
+    """
+    win = max(2, int(round(window_seconds / frame_seconds)))
+    hop = max(1, int(round(hop_seconds / frame_seconds)))
+    if len(loudness) < win:
+        pad = win - len(loudness)
+        loudness = np.pad(loudness, (0, pad), constant_values=float(loudness.min()))
+        zcr = np.pad(zcr, (0, pad))
+
+    levels = np.lib.stride_tricks.sliding_window_view(loudness, win)[::hop]
+    noise = np.lib.stride_tricks.sliding_window_view(zcr, win)[::hop].mean(axis=1)
+    rises = np.diff(levels, axis=1)
+    onset_rate = (rises >= ONSET_DB).mean(axis=1)
+
+    envelope = (levels - levels.mean(axis=1, keepdims=True)) * np.hanning(win)
+    spectrum = np.abs(np.fft.rfft(envelope, axis=1)) ** 2
+    freqs = np.fft.rfftfreq(win, d=frame_seconds)
+    band = (freqs >= BURST_BAND_HZ[0]) & (freqs <= BURST_BAND_HZ[1])
+    bursts = np.log10(spectrum[:, band].sum(axis=1) + 1e-6) + _robust_z(noise) * 0.1
+
+    scores = (weights[0] * _robust_z(levels.mean(axis=1)) + weights[1] * _robust_z(onset_rate)
+              + weights[2] * _robust_z(bursts))
+    starts = np.arange(len(scores)) * hop * frame_seconds
+    return starts, scores
+
+
+def select_windows(starts, scores, duration, coverage=AUDIO_PREFILTER_COVERAGE, window_seconds=AUDIO_WINDOW_SECONDS,
+                   before=AUDIO_CONTEXT_BEFORE, after=AUDIO_CONTEXT_AFTER):
+    """
+    Takes windows best-first, each widened by `before`/`after` seconds of context,
+    until they cover `coverage` of the timeline.
+    Returns merged (start, end) intervals in time order.
+    """
+    seconds = max(1, int(np.ceil(duration)))
+    covered = np.zeros(seconds, dtype=bool)
+    target = coverage * seconds
+    for i in np.argsort(-scores, kind='stable'):
+        first = int(starts[i])
+        covered[max(0, first - int(before)):first + int(window_seconds + after)] = True
+        if covered.sum() >= target:
+            break
+    # Runs of covered seconds -> intervals
+    edges = np.flatnonzero(np.diff(np.concatenate(([0], covered.view(np.int8), [0]))))
+    return [(float(start), float(end)) for start, end in zip(edges[::2], edges[1::2])]
+
+
+def prefilter_transcript(transcript, source, coverage=AUDIO_PREFILTER_COVERAGE, encoding="compact"):
+    """
+    Keeps only the transcript lines near the audio windows most likely to be funny.
+    source: local video file or YouTube URL (audio is decoded once per video).
+    Returns (TranscriptIndex of the kept lines, report). The report has the audio
+    coverage, lines kept, estimated prompt tokens before/after/saved and how much
+    faster than real time the audio was scored. If the audio can't be read, the
+    transcript is returned unchanged with a None report.
+    """
+    transcript = as_transcript_index(transcript)
+    if not len(transcript) or coverage >= 1:
+        return transcript, None
+
+    with span("audio.prefilter", coverage=coverage) as prefilter_span:
+        started = time.perf_counter()
+        try:
+            loudness, zcr = load_audio_features(source)
+        except Exception as e:
+            print(f"DEBUG: Audio prefilter skipped ({e})")
+            prefilter_span.set(skipped=True)
+            return transcript, None
+
+        audio_seconds = len(loudness) * AUDIO_FRAME_SECONDS
+        starts, scores = score_windows(loudness, zcr)
+        windows = select_windows(starts, scores, audio_seconds, coverage)
+
+        keep = set()
+        for start, end in windows:
+            keep.update(transcript.overlapping(start, end))
+        # Lines past the end of the audio (mismatched transcript) are kept, not guessed at
+        keep.update(transcript.starting_between(audio_seconds, float('inf')))
+        keep = sorted(keep)
+        elapsed = time.perf_counter() - started
+
+        counts = line_token_counts(transcript, encoding if encoding in TRANSCRIPT_ENCODERS else "compact")
+        tokens_full = sum(counts)
+        tokens_sent = sum(counts[i] for i in keep)
+        report = {
+            'coverage': round(sum(end - start for start, end in windows) / audio_seconds, 3) if audio_seconds else 0.0,
+            'windows': len(windows),
+            'lines_kept': len(keep),
+            'lines_total': len(transcript),
+            'tokens_full': tokens_full,
+            'tokens_sent': tokens_sent,
+            'tokens_saved': tokens_full - tokens_sent,
+            'audio_seconds': round(audio_seconds, 1),
+            'realtime_factor': round(audio_seconds / elapsed, 1) if elapsed > 0 else None,
+        }
+        prefilter_span.set(**report)
+
+    with _stats_lock:
+        AUDIO_PREFILTER_STATS['runs'] += 1
+        for key in ('tokens_full', 'tokens_sent', 'tokens_saved'):
+            AUDIO_PREFILTER_STATS[key] += report[key]
+    print(f"DEBUG: Audio prefilter kept {len(keep)}/{len(transcript)} lines "
+          f"({report['coverage']:.0%} of {audio_seconds:.0f}s audio), ~{report['tokens_saved']:,} prompt tokens saved")
+
+    if isinstance(transcript.transcript, Transcript):
+        entries = Transcript.from_entries(transcript.transcript[i] for i in keep)
+    else:
+        entries = [transcript[i] for i in keep]
+    return TranscriptIndex(entries), report
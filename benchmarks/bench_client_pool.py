@@ -0,0 +1,50 @@
+"""
+Per-call overhead of call_llm with a fresh SDK client per call (the old behavior)
+vs the pooled, keep-alive clients, against a local stub server.
+
+Usage: python benchmarks/bench_client_pool.py [--calls 200] [--provider OpenAI]
+"""
+import argparse
+import os
+import time
+
+import common  # noqa: F401  (adds the repo root to sys.path)
+from stub_llm_server import StubLLMServer
+
+import analysis_utils
+import llm_utils
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--calls", type=int, default=200, help="Calls per mode")
+    parser.add_argument("--provider", default="OpenAI", choices=["OpenAI", "Anthropic"])
+    args = parser.parse_args()
+
+    model = "gpt-5-mini" if args.provider == "OpenAI" else "claude-sonnet-4-5-20250929"
+
+    with StubLLMServer(responder=lambda prompt: '{"complete": true}') as server:
+        os.environ["OPENAI_BASE_URL"] = f"{server.url}/v1"
+        os.environ["ANTHROPIC_BASE_URL"] = server.url
+
+        results = []
+        for mode in ("fresh client", "pooled client"):
+            llm_utils.CLIENT_POOL.invalidate()
+            connections_before = server.connections
+            start = time.perf_counter()
+            for i in range(args.calls):
+                if mode == "fresh client":
+                    # Old behavior: a brand-new client (and connection pool) every call
+                    llm_utils.CLIENT_POOL.invalidate()
+                analysis_utils.call_llm(f"bench prompt {i}", args.provider, model, "sk-bench", use_cache=False)
+            elapsed = time.perf_counter() - start
+            results.append((mode, elapsed / args.calls * 1e3, server.connections - connections_before))
+
+    print(f"\n{args.provider}: {args.calls} calls per mode against {server.url}")
+    print(f"{'mode':<15} {'ms/call':>9} {'TCP connections':>16}")
+    for mode, per_call, connections in results:
+        print(f"{mode:<15} {per_call:>9.2f} {connections:>16}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,214 @@
+"""
+End-to-end pipeline benchmark: synthetic source (ffmpeg testsrc + sine), synthetic
+manual transcript and a deterministic stub LLM, with every stage timed on its own:
+transcript parsing, prompt building, analysis, validation, preview clips and the reel.
+Results are written as JSON so runs of different versions can be compared.
+
+Usage: python benchmarks/bench_pipeline.py [--duration 600] [--latency 0.2] [--output bench_pipeline.json]
+"""
+import argparse
+import json
+import os
+import platform
+import re
+import statistics
+import subprocess
+import time
+
+from common import REPO_ROOT, Measurement, make_test_source
+
+import analysis_utils
+import video_utils
+from llm_utils import StubProvider, register_provider
+from transcript_utils import TranscriptIndex
+
+STUB_PROVIDER = "Benchmark Stub"
+STUB_MODEL = "stub-1"
+
+# Line references in the two transcript encodings the analysis prompts use
+VERBOSE_LINE = re.compile(r"LINE (\d+) \| START:([\d.]+)s \| END:([\d.]+)s")
+COMPACT_LINE = re.compile(r"^\s*(\d+)\|", re.MULTILINE)
+
+
+def make_manual_transcript(duration, line_seconds=3):
+    """
+    Synthetic transcript in the app's manual format ("[HH:MM:SS] text" per line).
+    """
+    lines = []
+    for i, t in enumerate(range(0, int(duration), line_seconds)):
+        hours, rest = divmod(t, 3600)
+        lines.append(f"[{hours:02d}:{rest // 60:02d}:{rest % 60:02d}] synthetic caption number {i} with a few more words")
+    return "\n".join(lines)
+
+
+def stub_responder(clips_per_prompt, clip_lines):
+    """
+    Canned but prompt-dependent answers: every batch validation verdict is "complete",
+    and analysis prompts get `clips_per_prompt` evenly spread clips of `clip_lines` lines
+    (in line numbers or seconds, whichever the prompt's encoding asks for).
+    """
+    def respond(prompt, model):
+        if "CLIPS (JSON list" in prompt:
+            ids = re.findall(r'"id": (\d+)', prompt)
+            return json.dumps([{"id": int(clip_id), "complete": True} for clip_id in ids])
+        if "COMPLETE thought" in prompt:
+            return '{"complete": true}'
+
+        verbose = VERBOSE_LINE.findall(prompt)
+        line_numbers = [int(m[0]) for m in verbose] or [int(n) for n in COMPACT_LINE.findall(prompt)]
+        if len(line_numbers) <= clip_lines:
+            return "[]"
+        step = max(1, (len(line_numbers) - clip_lines) // clips_per_prompt)
+        clips = []
+        for first in range(0, len(line_numbers) - clip_lines, step)[:clips_per_prompt]:
+            last = first + clip_lines - 1
+            if verbose:
+                span = {"start": float(verbose[first][1]), "end": float(verbose[last][2])}
+            else:
+                span = {"start_line": line_numbers[first], "end_line": line_numbers[last]}
+            clips.append(dict(span, humor_score=9, quality_score=9, reasoning="benchmark clip"))
+        return json.dumps(clips)
+    return respond
+
+
+def _version():
+    """
+    Commit of the benchmarked tree (so results can be matched to versions), or None.
+    """
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _ffmpeg_version():
+    try:
+        output = subprocess.run(['ffmpeg', '-version'], capture_output=True, text=True).stdout
+        return output.splitlines()[0] if output else None
+    except OSError:
+        return None
+
+
+def run_pipeline(source, transcript_text, args):
+    """
+    Runs every stage once. Returns ({stage: {'wall', 'cpu'}}, counters).
+    """
+    stages = {}
+    counters = {}
+
+    def timed(name, func):
+        with Measurement() as m:
+            result = func()
+        stages[name] = {'wall': round(m.wall, 4), 'cpu': round(m.cpu, 4)}
+        return result
+
+    transcript = timed('parse_transcript', lambda: analysis_utils.parse_manual_transcript(transcript_text))
+    index = TranscriptIndex(transcript)
+    counters['transcript_entries'] = len(transcript)
+
+    for mode in ("humor", "quotes"):
+        plan = timed(f'prompt_build_{mode}', lambda mode=mode: analysis_utils.plan_clip_analysis(
+            index, mode, args.max_clip_seconds, args.max_clips, encoding=args.encoding))
+        counters[f'{mode}_prompts'] = len(plan['windows'])
+        counters[f'{mode}_prompt_tokens'] = plan['total_tokens']
+
+    options = dict(api_key="stub", max_clip_seconds=args.max_clip_seconds, max_clips=args.max_clips,
+                   provider=STUB_PROVIDER, model=STUB_MODEL, encoding=args.encoding)
+    intervals = timed('analyze_humor', lambda: analysis_utils.analyze_humor(index, **options))
+    quotes = timed('analyze_quotes', lambda: analysis_utils.analyze_quotes(index, **options))
+    counters['humor_clips'] = len(intervals)
+    counters['quote_clips'] = len(quotes)
+
+    intervals = timed('validate_and_expand', lambda: analysis_utils.validate_and_expand_clips(
+        index, intervals, "stub", args.max_clip_seconds, STUB_PROVIDER, STUB_MODEL))
+    counters['validated_clips'] = len(intervals)
+    if not intervals:
+        return stages, counters
+
+    def previews():
+        return [video_utils.create_single_clip(source, start, end, i, quality=args.preview_quality)
+                for i, (start, end) in enumerate(intervals)]
+    preview_paths = timed('create_single_clip', previews)
+    stages['create_single_clip']['per_clip'] = round(stages['create_single_clip']['wall'] / len(intervals), 4)
+    counters['previews_ok'] = sum(1 for path in preview_paths if path)
+
+    reel_path = timed('create_gag_reel', lambda: video_utils.create_gag_reel(source, intervals, args.slug_duration, args.engine))
+    counters['reel_ok'] = bool(reel_path)
+
+    for path in preview_paths + [reel_path]:
+        if path and os.path.exists(path):
+            os.remove(path)
+    return stages, counters
+
+
+def summarize(runs):
+    """
+    Per-stage min/median/max wall time and median CPU over all runs.
+    """
+    summary = {}
+    for name in runs[0]['stages']:
+        walls = [run['stages'][name]['wall'] for run in runs if name in run['stages']]
+        cpus = [run['stages'][name]['cpu'] for run in runs if name in run['stages']]
+        summary[name] = {'wall_min': min(walls), 'wall_median': round(statistics.median(walls), 4),
+                         'wall_max': max(walls), 'cpu_median': round(statistics.median(cpus), 4)}
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--duration", type=float, default=600, help="Source length in seconds")
+    parser.add_argument("--size", default="1280x720", help="Source resolution")
+    parser.add_argument("--fps", type=int, default=30, help="Source frame rate")
+    parser.add_argument("--source", help="Synthetic source path (default: derived from duration/size, reused if present)")
+    parser.add_argument("--latency", type=float, default=0.2, help="Stub LLM seconds before the first token")
+    parser.add_argument("--token-delay", type=float, default=0.0, help="Stub LLM seconds per streamed chunk")
+    parser.add_argument("--clips-per-prompt", type=int, default=4, help="Clips the stub returns per analysis prompt")
+    parser.add_argument("--clip-lines", type=int, default=3, help="Transcript lines per stub clip")
+    parser.add_argument("--max-clip-seconds", type=int, default=15)
+    parser.add_argument("--max-clips", type=int, default=10)
+    parser.add_argument("--slug-duration", type=float, default=2.0)
+    parser.add_argument("--encoding", choices=["compact", "verbose", "auto"], default=analysis_utils.PROMPT_ENCODING)
+    parser.add_argument("--engine", choices=["smart", "filtergraph", "moviepy"], default="smart", help="Reel renderer")
+    parser.add_argument("--preview-quality", choices=["preview", "final"], default="preview")
+    parser.add_argument("--repeat", type=int, default=1, help="Pipeline runs (stats are over all runs)")
+    parser.add_argument("--output", default="bench_pipeline.json", help="JSON results file")
+    args = parser.parse_args()
+
+    source = args.source or f"bench_source_{int(args.duration)}s_{args.size}.mp4"
+    with Measurement() as m:
+        make_test_source(source, duration=args.duration, size=args.size, fps=args.fps)
+    print(f"Source: {source} ({args.duration:.0f}s, {args.size}) ready in {m.wall:.1f}s")
+    transcript_text = make_manual_transcript(args.duration)
+
+    # Stub LLM, and no LLM cache: every run must pay for its calls
+    register_provider(STUB_PROVIDER, StubProvider(stub_responder(args.clips_per_prompt, args.clip_lines),
+                                                  latency=args.latency, token_delay=args.token_delay))
+    analysis_utils.LLM_CACHE = None
+
+    runs = []
+    for n in range(args.repeat):
+        stages, counters = run_pipeline(source, transcript_text, args)
+        runs.append({'stages': stages, 'counters': counters})
+        total = sum(stage['wall'] for stage in stages.values())
+        print(f"Run {n + 1}/{args.repeat}: {total:.2f}s total")
+        for name, stage in stages.items():
+            print(f"  {name:<22} {stage['wall']:>9.3f}s wall {stage['cpu']:>9.3f}s cpu")
+
+    results = {
+        'benchmark': 'pipeline',
+        'version': _version(),
+        'timestamp': time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        'environment': {'python': platform.python_version(), 'platform': platform.platform(),
+                        'cpus': os.cpu_count(), 'ffmpeg': _ffmpeg_version()},
+        'config': {k: v for k, v in vars(args).items() if k != 'output'},
+        'summary': summarize(runs),
+        'runs': runs,
+    }
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""
+Analysis prompt size and build time: the original `+=` verbose formatting vs the
+verbose and compact encoders, plus what the budget planner picks at each length.
+
+Usage: python benchmarks/bench_prompt_encoding.py [--budget 30000]
+"""
+import argparse
+import random
+import timeit
+
+import common  # noqa: F401  (adds the repo root to sys.path)
+from bench_transcript_index import make_transcript
+
+import analysis_utils
+from prompt_utils import estimate_tokens, format_transcript
+from transcript_utils import Transcript, TranscriptIndex
+
+
+def format_concat(transcript):
+    """
+    The original prompt formatting: string += per line, end times recomputed per entry.
+    """
+    formatted_transcript = ""
+    for i, entry in enumerate(transcript):
+        start = entry['start']
+        end = start + entry.get('duration', 3)
+        formatted_transcript += f"LINE {i+1} | START:{start:.2f}s | END:{end:.2f}s | TEXT: \"{entry['text']}\"\n"
+    return formatted_transcript
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--budget", type=int, default=analysis_utils.PROMPT_TOKEN_BUDGET, help="Token budget per prompt")
+    args = parser.parse_args()
+
+    random.seed(0)
+    instructions = estimate_tokens(analysis_utils._humor_prompt("", 15, 10))
+    print(f"Static humor instructions: ~{instructions} tokens per prompt\n")
+    print(f"{'entries':>8} {'encoding':<9} {'tokens':>9} {'tok/line':>9} {'build (ms)':>11}   plan at budget {args.budget}")
+
+    for entries in (500, 2_000, 10_000, 50_000):
+        transcript = make_transcript(entries)
+        index = TranscriptIndex(Transcript.from_entries(transcript))
+        indices = range(entries)
+
+        rows = [("+= (old)", format_concat(transcript), lambda: format_concat(transcript))]
+        for encoding in ("verbose", "compact"):
+            rows.append((encoding, format_transcript(index, indices, encoding),
+                         lambda encoding=encoding: format_transcript(index, indices, encoding)))
+
+        for name, text, build in rows:
+            tokens = estimate_tokens(text)
+            build_ms = timeit.timeit(build, number=3) / 3 * 1e3
+            plan_note = ""
+            if name in ("verbose", "compact"):
+                plan = analysis_utils.plan_clip_analysis(index, "humor", 15, 10, token_budget=args.budget, encoding=name)
+                plan_note = (f"{len(plan['windows'])} call(s), ~{max(plan['prompt_tokens'])} max, "
+                             f"~{plan['total_tokens']} total{'' if plan['fits'] else ' (over budget)'}")
+            print(f"{entries:>8} {name:<9} {tokens:>9} {tokens / entries:>9.1f} {build_ms:>11.2f}   {plan_note}")
+        print()
+
+
+if __name__ == "__main__":
+    main()
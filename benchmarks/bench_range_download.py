@@ -0,0 +1,101 @@
+"""
+Full download vs range download (download_video_sections) from a local HTTP server
+serving a synthetic MP4 - no network needed. Reports bytes served and wall time.
+
+Usage: python benchmarks/bench_range_download.py [--duration 600] [--clips 5]
+"""
+import argparse
+import os
+import re
+import threading
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+from common import Measurement, make_test_source, spread_intervals
+
+import video_utils
+
+
+class RangeRequestHandler(SimpleHTTPRequestHandler):
+    """
+    Static file handler with HTTP Range support (needed for ffmpeg to seek remotely).
+    Counts the bytes it serves on the server object.
+    """
+    def log_message(self, *args):
+        pass
+
+    def send_head(self):
+        path = self.translate_path(self.path)
+        if not os.path.isfile(path):
+            return super().send_head()
+
+        size = os.path.getsize(path)
+        match = re.match(r"bytes=(\d*)-(\d*)", self.headers.get("Range", ""))
+        f = open(path, "rb")
+        if match:
+            start = int(match.group(1) or 0)
+            end = int(match.group(2)) if match.group(2) else size - 1
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+        else:
+            start, end = 0, size - 1
+            self.send_response(200)
+        self.send_header("Content-Type", "video/mp4")
+        self.send_header("Accept-Ranges", "bytes")
+        self.send_header("Content-Length", str(end - start + 1))
+        self.end_headers()
+        f.seek(start)
+        self._remaining = end - start + 1
+        return f
+
+    def copyfile(self, source, outputfile):
+        while self._remaining > 0:
+            chunk = source.read(min(64 * 1024, self._remaining))
+            if not chunk:
+                break
+            try:
+                outputfile.write(chunk)
+            except (BrokenPipeError, ConnectionResetError):
+                break  # Client stopped reading (e.g. ffmpeg seeking)
+            self._remaining -= len(chunk)
+            with self.server.lock:
+                self.server.bytes_served += len(chunk)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--duration", type=float, default=600, help="Source length in seconds")
+    parser.add_argument("--clips", type=int, default=5, help="Number of clips to fetch")
+    parser.add_argument("--clip-seconds", type=float, default=12, help="Length of each clip")
+    parser.add_argument("--source", default="bench_source_long.mp4", help="Synthetic source path (reused if present)")
+    args = parser.parse_args()
+
+    source = os.path.abspath(make_test_source(args.source, duration=args.duration))
+    intervals = spread_intervals(args.duration, args.clips, args.clip_seconds)
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), lambda *a: RangeRequestHandler(*a, directory=os.path.dirname(source)))
+    server.lock = threading.Lock()
+    server.bytes_served = 0
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}/{os.path.basename(source)}"
+
+    print(f"Serving {source} ({os.path.getsize(source) / 1e6:.1f} MB) at {url}")
+    print(f"{'mode':<8} {'MB served':>10} {'wall (s)':>9}  result")
+    try:
+        for mode in ("full", "ranges"):
+            server.bytes_served = 0
+            with Measurement() as m:
+                if mode == "full":
+                    path = video_utils.download_video(url)
+                else:
+                    path = video_utils.download_video_sections(url, intervals)
+            print(f"{mode:<8} {server.bytes_served / 1e6:>10.1f} {m.wall:>9.2f}  {path}")
+            if path and mode == "ranges":
+                preview = video_utils.create_single_clip(path, *intervals[0], 0)
+                print(f"         preview from segments: {preview}")
+    finally:
+        server.shutdown()
+        video_utils.cleanup_old_files()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+Concurrent LLM calls against a provider with a quota (max requests in flight) and
+random 503s: plain requests with no limiter or retries (the old behavior) vs call_llm
+with the adaptive per-provider limiter and jittered backoff. Reports successes,
+failures, rejected requests (429s) and throughput.
+
+Usage: python benchmarks/bench_rate_limit.py [--calls 200] [--threads 32] [--quota 8] [--transport inprocess]
+"""
+import argparse
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import common  # noqa: F401  (adds the repo root to sys.path)
+from stub_llm_server import StubLLMServer
+
+import analysis_utils
+import llm_utils
+
+STUB_PROVIDER = "Rate Limit Stub"
+
+
+def run_calls(call, calls, threads):
+    """
+    Runs call(i) `calls` times on `threads` threads. Returns (successes, failures, seconds).
+    """
+    def attempt(i):
+        try:
+            call(i)
+            return True
+        except Exception:  # pylint: disable=broad-except
+            return False
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        results = list(executor.map(attempt, range(calls)))
+    return sum(results), len(results) - sum(results), time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--calls", type=int, default=200)
+    parser.add_argument("--threads", type=int, default=32, help="Concurrent callers")
+    parser.add_argument("--quota", type=int, default=8, help="Requests the provider serves at once (more get 429)")
+    parser.add_argument("--fault-rate", type=float, default=0.02, help="Share of requests failing with 503")
+    parser.add_argument("--retry-after", type=float, default=None, help="Retry-After seconds sent with errors")
+    parser.add_argument("--latency", type=float, default=0.05, help="Seconds per served request")
+    parser.add_argument("--rps", type=float, default=200, help="Limiter token rate (requests per second)")
+    parser.add_argument("--max-in-flight", type=int, default=32, help="Limiter's starting/maximum in-flight limit")
+    parser.add_argument("--transport", choices=["inprocess", "http"], default="inprocess",
+                        help="StubProvider in this process, or the HTTP stub through the OpenAI SDK")
+    args = parser.parse_args()
+
+    faults = dict(fault_rate=args.fault_rate, fault_statuses=(503,), max_in_flight=args.quota, retry_after=args.retry_after)
+    analysis_utils.LLM_CACHE = None
+    if args.transport == "inprocess":
+        stub = llm_utils.StubProvider('{"complete": true}', latency=args.latency, **faults)
+        llm_utils.register_provider(STUB_PROVIDER, stub)
+        provider, model, server = STUB_PROVIDER, "stub-1", None
+    else:
+        server = StubLLMServer(latency=args.latency, responder=lambda prompt: '{"complete": true}', **faults).__enter__()
+        os.environ["OPENAI_BASE_URL"] = f"{server.url}/v1"
+        provider, model = "OpenAI", "gpt-5-mini"
+    llm_utils.PROVIDER_RATE_LIMITS[provider] = (args.rps, max(1, int(args.rps)), args.max_in_flight)
+
+    def rejected():
+        return sum(server.errors.values()) if server else stub.faults
+
+    print(f"{args.calls} calls from {args.threads} threads, quota {args.quota} in flight, "
+          f"{args.fault_rate:.0%} 503s, {args.latency * 1000:.0f} ms/request ({args.transport})")
+    print(f"{'mode':<12} {'ok':>5} {'failed':>7} {'429/503s':>9} {'seconds':>8} {'ok/s':>7}  limiter")
+    try:
+        modes = (
+            ("no limiter", lambda i: analysis_utils._call_provider(f"prompt {i}", provider, model, "sk-bench")),
+            ("adaptive", lambda i: analysis_utils.call_llm(f"prompt {i}", provider, model, "sk-bench", use_cache=False)),
+        )
+        for name, call in modes:
+            llm_utils.reset_limiters()
+            before = rejected()
+            ok, failed, seconds = run_calls(call, args.calls, args.threads)
+            limiter = llm_utils.get_limiter(provider)
+            note = f"limit {limiter.limit:.1f}, {limiter.stats}" if name == "adaptive" else ""
+            print(f"{name:<12} {ok:>5} {failed:>7} {rejected() - before:>9} {seconds:>8.2f} {ok / seconds:>7.1f}  {note}")
+    finally:
+        if server:
+            server.__exit__(None, None, None)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+Compares the reel engines: smart render (stream copy), the single-pass FFmpeg
+filter graph, the MoviePy path and stitching final-quality previews (only the
+stitch is timed - in the app the previews already exist by then). Each engine
+runs in a fresh process so its peak RSS (Python process and FFmpeg children)
+is measured on its own.
+
+Usage: python benchmarks/bench_stitch.py [--duration 300] [--clips 10] [--clip-seconds 12]
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+
+from common import Measurement, make_test_source, spread_intervals
+
+import video_utils
+
+ENGINES = {
+    "smart": video_utils.create_gag_reel_smart,
+    "filtergraph": video_utils.create_gag_reel_filtergraph,
+    "moviepy": video_utils.create_gag_reel_moviepy,
+    "previews": None,  # stitch_preview_clips over final-quality previews
+}
+
+
+def run_engine(name, source, intervals):
+    """
+    Renders once with one engine (in this process) and prints the measurements as JSON.
+    """
+    previews = []
+    if name == "previews":
+        previews = video_utils.create_preview_clips(source, intervals, quality="final")
+        with Measurement() as m:
+            output = video_utils.stitch_preview_clips(previews)
+    else:
+        with Measurement() as m:
+            output = ENGINES[name](source, intervals)
+    for preview in previews:
+        if preview and os.path.exists(preview):
+            os.remove(preview)
+    # ru_maxrss is in KB on Linux; children = the largest FFmpeg process
+    print(json.dumps({
+        'ok': bool(output),
+        'wall': m.wall,
+        'cpu': m.cpu,
+        'rss_self_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        'rss_children_mb': resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024,
+    }))
+    if output and os.path.exists(output):
+        os.remove(output)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--duration", type=float, default=300, help="Source length in seconds")
+    parser.add_argument("--size", default="1280x720", help="Source resolution")
+    parser.add_argument("--clips", type=int, default=10, help="Number of intervals to cut")
+    parser.add_argument("--clip-seconds", type=float, default=12, help="Length of each interval")
+    parser.add_argument("--source", default="bench_source.mp4", help="Synthetic source path (reused if present)")
+    parser.add_argument("--engines", default=",".join(ENGINES), help="Comma-separated engines to compare")
+    parser.add_argument("--run-engine", choices=list(ENGINES), help=argparse.SUPPRESS)  # Child process mode
+    args = parser.parse_args()
+
+    source = make_test_source(args.source, duration=args.duration, size=args.size)
+    intervals = spread_intervals(args.duration, args.clips, args.clip_seconds)
+
+    if args.run_engine:
+        run_engine(args.run_engine, source, intervals)
+        return
+
+    print(f"Source: {source} ({args.duration:.0f}s, {args.size}), {len(intervals)} clips of {args.clip_seconds:.0f}s")
+    print(f"{'engine':<12} {'wall (s)':>10} {'cpu (s)':>10} {'RSS py (MB)':>12} {'RSS ffmpeg (MB)':>16}")
+
+    for name in args.engines.split(","):
+        child = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--run-engine", name, "--source", source,
+             "--duration", str(args.duration), "--size", args.size,
+             "--clips", str(args.clips), "--clip-seconds", str(args.clip_seconds)],
+            capture_output=True, text=True
+        )
+        try:
+            result = json.loads(child.stdout.strip().splitlines()[-1])
+        except (IndexError, ValueError):
+            print(f"{name:<12} failed: {child.stderr.strip()[-200:]}")
+            continue
+        status = "" if result['ok'] else "  (failed)"
+        print(f"{name:<12} {result['wall']:>10.2f} {result['cpu']:>10.2f} "
+              f"{result['rss_self_mb']:>12.1f} {result['rss_children_mb']:>16.1f}{status}")
+
+
+if __name__ == "__main__":
+    main()
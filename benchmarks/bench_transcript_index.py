@@ -0,0 +1,76 @@
+"""
+Per-query cost of transcript interval lookups: linear scan vs TranscriptIndex.
+
+Usage: python benchmarks/bench_transcript_index.py [--queries 2000]
+"""
+import argparse
+import random
+import timeit
+
+import common  # noqa: F401  (adds the repo root to sys.path)
+
+from transcript_utils import TranscriptIndex
+
+
+def make_transcript(entries):
+    """
+    Synthetic caption list: ~3s entries with small gaps, like YouTube auto-captions.
+    """
+    transcript = []
+    t = 0.0
+    for i in range(entries):
+        duration = random.uniform(1.5, 4.5)
+        transcript.append({'text': f"caption line {i}", 'start': t, 'duration': duration})
+        t += duration * random.uniform(0.8, 1.1)
+    return transcript
+
+
+def linear_lookup(transcript, start, end):
+    """
+    The original full-list scan from get_transcript_text_for_interval.
+    """
+    texts = []
+    first_idx = None
+    last_idx = None
+    for i, entry in enumerate(transcript):
+        entry_start = entry['start']
+        entry_end = entry_start + entry.get('duration', 3)
+        if entry_end >= start and entry_start <= end:
+            texts.append(entry['text'])
+            if first_idx is None:
+                first_idx = i
+            last_idx = i
+    return ' '.join(texts), first_idx, last_idx
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--queries", type=int, default=2000, help="Lookups per size")
+    args = parser.parse_args()
+
+    random.seed(0)
+    print(f"{'entries':>8} {'build (ms)':>11} {'linear (us/q)':>14} {'index (us/q)':>13} {'speedup':>8}")
+
+    for entries in (1_000, 10_000, 100_000):
+        transcript = make_transcript(entries)
+        total = transcript[-1]['start']
+        queries = []
+        for _ in range(args.queries):
+            start = random.uniform(0, total)
+            queries.append((start, start + random.uniform(5, 30)))
+
+        build = timeit.timeit(lambda: TranscriptIndex(transcript), number=1)
+        index = TranscriptIndex(transcript)
+
+        # Fewer linear queries at large sizes so the run stays short
+        linear_queries = queries[:max(20, args.queries * 1_000 // entries)]
+        linear = timeit.timeit(lambda: [linear_lookup(transcript, s, e) for s, e in linear_queries], number=1)
+        indexed = timeit.timeit(lambda: [index.text_for_interval(s, e) for s, e in queries], number=1)
+
+        linear_us = linear / len(linear_queries) * 1e6
+        indexed_us = indexed / len(queries) * 1e6
+        print(f"{entries:>8} {build * 1e3:>11.1f} {linear_us:>14.1f} {indexed_us:>13.2f} {linear_us / indexed_us:>7.0f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""
+Memory held by a transcript as a list of dicts vs the compact Transcript
+(and the TranscriptIndex built on each), plus the cost of reloading a saved
+Transcript with and without mmap.
+
+Usage: python benchmarks/bench_transcript_memory.py
+"""
+import gc
+import os
+import random
+import tempfile
+import timeit
+import tracemalloc
+
+import common  # noqa: F401  (adds the repo root to sys.path)
+from bench_transcript_index import make_transcript
+
+from transcript_utils import Transcript, TranscriptIndex
+
+
+def allocated(build):
+    """
+    Returns (object, bytes still allocated after build() returns).
+    """
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    obj = build()
+    gc.collect()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return obj, after - before
+
+
+def main():
+    random.seed(0)
+    print(f"{'entries':>8} {'representation':<22} {'MB':>8} {'bytes/entry':>12}")
+
+    for entries in (10_000, 100_000):
+        # Build from JSON-like data each time so the list's strings are counted too
+        source = [(f"caption line {i}", start, duration) for i, (start, duration) in
+                  enumerate((e['start'], e['duration']) for e in make_transcript(entries))]
+        as_dicts = lambda: [{'text': text, 'start': start, 'duration': duration} for text, start, duration in source]
+
+        dicts, dicts_bytes = allocated(as_dicts)
+        compact, compact_bytes = allocated(lambda: Transcript.from_entries(as_dicts()))
+        _, dict_index_bytes = allocated(lambda: TranscriptIndex(dicts))
+        _, compact_index_bytes = allocated(lambda: TranscriptIndex(compact))
+
+        rows = [
+            ("list of dicts", dicts_bytes),
+            ("Transcript", compact_bytes),
+            ("list + TranscriptIndex", dicts_bytes + dict_index_bytes),
+            ("Transcript + Index", compact_bytes + compact_index_bytes),
+        ]
+        for name, size in rows:
+            print(f"{entries:>8} {name:<22} {size / 1e6:>8.2f} {size / entries:>12.1f}")
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "transcript.bin")
+            compact.save(path)
+            _, mmap_bytes = allocated(lambda: Transcript.load(path))
+            load_mmap = timeit.timeit(lambda: Transcript.load(path), number=20) / 20
+            load_read = timeit.timeit(lambda: Transcript.load(path, use_mmap=False), number=20) / 20
+            print(f"{entries:>8} {'file':<22} {os.path.getsize(path) / 1e6:>8.2f}   "
+                  f"load: mmap {load_mmap * 1e3:.2f} ms ({mmap_bytes / 1e3:.1f} KB heap), read {load_read * 1e3:.2f} ms")
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""
+Shared helpers for the benchmark scripts: synthetic media and timing.
+"""
+import os
+import resource
+import subprocess
+import sys
+import time
+
+# Make the app modules importable when running `python benchmarks/<script>.py`
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+
+def make_test_source(path, duration=60, size="1280x720", fps=30, gop=60):
+    """
+    Generates a synthetic H.264/AAC source with ffmpeg testsrc + sine.
+    Skips generation if the file already exists.
+    """
+    if os.path.exists(path):
+        return path
+
+    cmd = [
+        'ffmpeg', '-y',
+        '-f', 'lavfi', '-i', f"testsrc=size={size}:rate={fps}",
+        '-f', 'lavfi', '-i', "sine=frequency=440:sample_rate=44100",
+        '-t', str(duration),
+        '-c:v', 'libx264', '-preset', 'veryfast', '-g', str(gop),
+        '-pix_fmt', 'yuv420p',
+        '-c:a', 'aac', '-b:a', '128k',
+        '-loglevel', 'error',
+        path
+    ]
+    subprocess.run(cmd, check=True)
+    return path
+
+
+def spread_intervals(duration, count, clip_seconds):
+    """
+    Returns `count` evenly spaced (start, end) intervals across the source.
+    """
+    step = duration / (count + 1)
+    return [(step * (i + 1), step * (i + 1) + clip_seconds) for i in range(count)]
+
+
+class Measurement:
+    """
+    Context manager recording wall time and CPU seconds (this process + children).
+    """
+    def __enter__(self):
+        self._wall = time.perf_counter()
+        self._self = resource.getrusage(resource.RUSAGE_SELF)
+        self._children = resource.getrusage(resource.RUSAGE_CHILDREN)
+        return self
+
+    def __exit__(self, *exc):
+        self.wall = time.perf_counter() - self._wall
+        usage_self = resource.getrusage(resource.RUSAGE_SELF)
+        usage_children = resource.getrusage(resource.RUSAGE_CHILDREN)
+        self.cpu = (
+            (usage_self.ru_utime + usage_self.ru_stime) - (self._self.ru_utime + self._self.ru_stime)
+            + (usage_children.ru_utime + usage_children.ru_stime) - (self._children.ru_utime + self._children.ru_stime)
+        )
+        return False
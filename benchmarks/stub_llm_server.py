@@ -0,0 +1,149 @@
+"""
+Local HTTP server that speaks just enough of the OpenAI and Anthropic APIs
+for offline benchmarks. Point the SDKs at it with OPENAI_BASE_URL / ANTHROPIC_BASE_URL.
+"""
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class StubLLMServer:
+    """
+    Context manager running the stub on a background thread.
+    latency: seconds to sleep before answering each request
+    responder(prompt) -> str: canned response text (defaults to an empty JSON list)
+    Fault injection: fault_rate of requests fail with a status from fault_statuses,
+    and requests beyond max_in_flight concurrent ones get a 429 (a simulated quota);
+    errors carry Retry-After: retry_after when it is set.
+    """
+    def __init__(self, latency=0.0, responder=None, host="127.0.0.1", port=0,
+                 fault_rate=0.0, fault_statuses=(429, 503), max_in_flight=None, retry_after=None, seed=0):
+        self.latency = latency
+        self.responder = responder or (lambda prompt: "[]")
+        self.fault_rate = fault_rate
+        self.fault_statuses = fault_statuses
+        self.max_in_flight = max_in_flight
+        self.retry_after = retry_after
+        self.requests = 0
+        self.connections = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.errors = {}  # status -> count of injected errors
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._make_handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._server.shutdown()
+        self._server.server_close()
+        return False
+
+    def _count(self, field):
+        with self._lock:
+            setattr(self, field, getattr(self, field) + 1)
+
+    def _admit(self):
+        """
+        Returns None to serve the request (counted as in flight), or the error status to inject.
+        """
+        with self._lock:
+            status = None
+            if self.max_in_flight is not None and self.in_flight >= self.max_in_flight:
+                status = 429
+            elif self.fault_rate and self._random.random() < self.fault_rate:
+                status = self._random.choice(self.fault_statuses)
+            if status is not None:
+                self.errors[status] = self.errors.get(status, 0) + 1
+                return status
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+            return None
+
+    def _finish(self):
+        with self._lock:
+            self.in_flight -= 1
+
+    def _make_handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # Keep-alive, so connection reuse is visible
+
+            def setup(self):
+                super().setup()
+                stub._count('connections')
+
+            def log_message(self, *args):
+                pass
+
+            def _send_json(self, status, payload, headers=None):
+                body = json.dumps(payload).encode('utf-8')
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_POST(self):
+                stub._count('requests')
+                length = int(self.headers.get("Content-Length", 0))
+                request = json.loads(self.rfile.read(length) or b"{}")
+                messages = request.get("messages", [])
+                prompt = messages[-1].get("content", "") if messages else ""
+
+                status = stub._admit()
+                if status is not None:
+                    headers = {"Retry-After": str(stub.retry_after)} if stub.retry_after is not None else {}
+                    kind = "rate_limit_error" if status == 429 else "overloaded_error"
+                    self._send_json(status, {"type": "error", "error": {"type": kind, "message": f"Injected {status}"}}, headers)
+                    return
+                try:
+                    if stub.latency:
+                        time.sleep(stub.latency)
+                    text = stub.responder(prompt)
+                finally:
+                    stub._finish()
+
+                if self.path.endswith("/chat/completions"):
+                    self._send_json(200, {
+                        "id": "chatcmpl-stub",
+                        "object": "chat.completion",
+                        "created": int(time.time()),
+                        "model": request.get("model", "stub"),
+                        "choices": [{
+                            "index": 0,
+                            "message": {"role": "assistant", "content": text},
+                            "finish_reason": "stop",
+                        }],
+                        "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+                    })
+                elif self.path.endswith("/messages"):
+                    self._send_json(200, {
+                        "id": "msg_stub",
+                        "type": "message",
+                        "role": "assistant",
+                        "model": request.get("model", "stub"),
+                        "content": [{"type": "text", "text": text}],
+                        "stop_reason": "end_turn",
+                        "usage": {"input_tokens": 0, "output_tokens": 0},
+                    })
+                else:
+                    self._send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+
+        return Handler
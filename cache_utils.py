@@ -0,0 +1,435 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+
+try:
+    import fcntl  # POSIX only - used to keep evictions from overlapping across processes
+except ImportError:
+    fcntl = None
+
+
+def make_cache_key(*parts):
+    """
+    Content-addressed key: SHA-256 of the JSON encoding of `parts`.
+    """
+    payload = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def atomic_write(path, data):
+    """
+    Writes bytes to `path` via a temp file + os.replace, so readers (in any process)
+    see either the old file or the complete new one, never a partial write.
+    """
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(temp_path, path)
+    except Exception:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
+
+
+class DiskCache:
+    """
+    Persistent key -> JSON value cache stored as one file per key.
+    Safe to share between threads and between processes using the same directory:
+    writes are atomic renames and readers treat missing/corrupt files as misses.
+    Entries expire after max_age seconds; when the directory grows past max_bytes
+    the least recently used entries are evicted.
+    """
+    def __init__(self, directory, max_bytes=100 * 1024 * 1024, max_age=7 * 24 * 3600, evict_every=50):
+        self.directory = os.path.abspath(directory)  # Stable even if the process changes directory
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.evict_every = evict_every
+        self.hits = 0
+        self.misses = 0
+        self._writes = 0
+        self._lock = threading.Lock()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], f"{key}.json")
+
+    def get(self, key):
+        """
+        Returns the cached value for `key`, or None on a miss or expired entry.
+        """
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                record = json.loads(f.read())
+            if self.max_age and time.time() - record['created'] > self.max_age:
+                raise KeyError("expired")
+            # Bump mtime so eviction is least-recently-used rather than oldest-written
+            os.utime(path, None)
+        except (OSError, ValueError, KeyError, TypeError):
+            with self._lock:
+                self.misses += 1
+            return None
+
+        with self._lock:
+            self.hits += 1
+        return record['value']
+
+    def set(self, key, value):
+        """
+        Stores a JSON-serializable value. Errors are logged, never raised.
+        """
+        record = {'created': time.time(), 'value': value}
+        try:
+            atomic_write(self._path(key), json.dumps(record, ensure_ascii=False).encode('utf-8'))
+        except Exception as e:
+            print(f"DEBUG: Cache write failed: {e}")
+            return
+
+        with self._lock:
+            self._writes += 1
+            should_evict = self.evict_every and self._writes % self.evict_every == 0
+        if should_evict:
+            self.evict()
+
+    def evict(self):
+        """
+        Deletes expired entries, then least recently used ones until under max_bytes.
+        Skips the sweep if another process is already evicting the same directory.
+        """
+        if not os.path.isdir(self.directory):
+            return
+
+        lock_file = None
+        try:
+            if fcntl is not None:
+                lock_file = open(os.path.join(self.directory, ".evict.lock"), "w")
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except OSError:
+                    return  # Someone else is evicting
+
+            now = time.time()
+            entries = []
+            for root, _, files in os.walk(self.directory):
+                for name in files:
+                    if not name.endswith(".json"):
+                        continue
+                    path = os.path.join(root, name)
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    # created <= mtime, so anything untouched for max_age has expired
+                    if self.max_age and now - stat.st_mtime > self.max_age:
+                        self._remove(path)
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, path))
+
+            total = sum(size for _, size, _ in entries)
+            if self.max_bytes and total > self.max_bytes:
+                entries.sort()  # Oldest access first
+                for _, size, path in entries:
+                    if total <= self.max_bytes:
+                        break
+                    self._remove(path)
+                    total -= size
+        finally:
+            if lock_file:
+                lock_file.close()
+
+    def clear(self):
+        """
+        Removes every entry and resets the counters.
+        """
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if name.endswith(".json"):
+                    self._remove(os.path.join(root, name))
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        """
+        Returns a dict of hit/miss counters for this process.
+        """
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses}
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+class MediaCache:
+    """
+    Persistent cache of downloaded media and fetched transcripts, keyed by video ID and kind
+    (e.g. "full", "sections-<hash>", "transcript"). Each entry is a directory that is
+    built elsewhere and moved into place with one atomic rename.
+    Entries are evicted least-recently-used once the cache exceeds max_bytes, except
+    entries holding a live lease (acquire/release) - those are in use by a session.
+    Leases are files, so they also protect entries used by other worker processes.
+    """
+    META_FILE = "meta.json"
+
+    def __init__(self, directory, max_bytes=20 * 1024 ** 3, lease_ttl=12 * 3600, min_age=60):
+        self.directory = os.path.abspath(directory)  # Stable even if the process changes directory
+        self.max_bytes = max_bytes
+        self.lease_ttl = lease_ttl
+        self.min_age = min_age  # Never evict entries stored/used this recently
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _safe(name):
+        return "".join(c if c.isalnum() or c in "-_" else "_" for c in str(name))
+
+    def entry_dir(self, video_id, kind):
+        return os.path.join(self.directory, self._safe(video_id), self._safe(kind))
+
+    def new_work_dir(self):
+        """
+        Returns a fresh scratch directory inside the cache (same filesystem, so
+        store() can move it into place atomically).
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        return tempfile.mkdtemp(dir=self.directory, prefix=".tmp-")
+
+    def lookup(self, video_id, kind):
+        """
+        Returns the path of the entry's primary file, or None on a miss.
+        """
+        entry = self.entry_dir(video_id, kind)
+        meta_path = os.path.join(entry, self.META_FILE)
+        try:
+            with open(meta_path) as f:
+                meta = json.load(f)
+            path = os.path.join(entry, meta['primary'])
+            if not os.path.exists(path):
+                raise FileNotFoundError(path)
+            os.utime(meta_path, None)  # Mark as recently used
+        except (OSError, ValueError, KeyError):
+            with self._lock:
+                self.misses += 1
+            return None
+
+        with self._lock:
+            self.hits += 1
+        return path
+
+    def store(self, video_id, kind, work_dir, primary, metadata=None):
+        """
+        Moves a fully written work_dir into the cache as (video_id, kind).
+        primary: file name (inside work_dir) that lookup() returns.
+        If another process stored the same entry first, theirs is kept.
+        Returns the cached path of the primary file, or None on failure.
+        """
+        size = 0
+        for root, _, files in os.walk(work_dir):
+            for name in files:
+                size += os.path.getsize(os.path.join(root, name))
+        meta = {'video_id': video_id, 'kind': kind, 'primary': primary, 'bytes': size, 'created': time.time()}
+        meta.update(metadata or {})
+
+        entry = self.entry_dir(video_id, kind)
+        try:
+            atomic_write(os.path.join(work_dir, self.META_FILE), json.dumps(meta, indent=2).encode('utf-8'))
+            os.makedirs(os.path.dirname(entry), exist_ok=True)
+            try:
+                os.rename(work_dir, entry)
+            except OSError:
+                # Entry already exists (concurrent store) - keep the existing one
+                shutil.rmtree(work_dir, ignore_errors=True)
+        except Exception as e:
+            print(f"DEBUG: Media cache store failed: {e}")
+            shutil.rmtree(work_dir, ignore_errors=True)
+            return None
+
+        self.evict()
+        return self.lookup(video_id, kind)
+
+    def discard(self, video_id, kind):
+        """
+        Removes the entry (e.g. one that failed validation). Missing entries are ignored.
+        """
+        entry = self.entry_dir(video_id, kind)
+        doomed = f"{entry}.evicting-{uuid.uuid4().hex[:8]}"
+        try:
+            os.rename(entry, doomed)
+        except OSError:
+            return
+        shutil.rmtree(doomed, ignore_errors=True)
+
+    def get_json(self, video_id, kind):
+        """
+        Returns the JSON document stored as (video_id, kind), or None.
+        """
+        path = self.lookup(video_id, kind)
+        if path is None:
+            return None
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def put_bytes(self, video_id, kind, filename, data, metadata=None):
+        """
+        Stores a single file with the given contents as (video_id, kind).
+        """
+        work_dir = self.new_work_dir()
+        try:
+            with open(os.path.join(work_dir, filename), "wb") as f:
+                f.write(data)
+        except Exception as e:
+            print(f"DEBUG: Media cache write failed: {e}")
+            shutil.rmtree(work_dir, ignore_errors=True)
+            return None
+        return self.store(video_id, kind, work_dir, filename, metadata)
+
+    def put_json(self, video_id, kind, value, metadata=None):
+        """
+        Stores a JSON document as (video_id, kind).
+        """
+        return self.put_bytes(video_id, kind, f"{kind}.json", json.dumps(value).encode('utf-8'), metadata)
+
+    def _entry_of(self, path):
+        """
+        Returns the entry directory containing `path`, or None if it isn't cached.
+        """
+        root = os.path.abspath(self.directory)
+        path = os.path.abspath(path)
+        if not path.startswith(root + os.sep):
+            return None
+        parts = os.path.relpath(path, root).split(os.sep)
+        if len(parts) < 3:
+            return None
+        return os.path.join(root, parts[0], parts[1])
+
+    def acquire(self, path):
+        """
+        Takes a lease on the cache entry holding `path` so it can't be evicted.
+        Returns a lease token for release(), or None if the path isn't cached.
+        """
+        entry = self._entry_of(path)
+        if entry is None:
+            return None
+        token = os.path.join(entry, f".lease-{os.getpid()}-{uuid.uuid4().hex[:8]}")
+        try:
+            with open(token, "w"):
+                pass
+        except OSError:
+            return None
+        return token
+
+    def release(self, token):
+        """
+        Drops a lease taken with acquire(). Safe to call with None.
+        """
+        if token:
+            try:
+                os.remove(token)
+            except OSError:
+                pass
+
+    def _has_live_lease(self, entry, now):
+        leased = False
+        for name in os.listdir(entry):
+            if not name.startswith(".lease-"):
+                continue
+            lease = os.path.join(entry, name)
+            try:
+                pid = int(name.split("-")[1])
+                age = now - os.path.getmtime(lease)
+            except (ValueError, IndexError, OSError):
+                continue
+            if age > self.lease_ttl or not _pid_alive(pid):
+                self.release(lease)  # Stale lease (session expired or process gone)
+                continue
+            leased = True
+        return leased
+
+    def evict(self):
+        """
+        Removes least recently used entries until the cache fits in max_bytes.
+        Leased and very recently used entries are skipped.
+        """
+        if not os.path.isdir(self.directory):
+            return
+
+        now = time.time()
+        entries = []
+        for video_dir in os.listdir(self.directory):
+            video_path = os.path.join(self.directory, video_dir)
+            if video_dir.startswith(".") or not os.path.isdir(video_path):
+                continue
+            for kind in os.listdir(video_path):
+                entry = os.path.join(video_path, kind)
+                meta_path = os.path.join(entry, self.META_FILE)
+                try:
+                    with open(meta_path) as f:
+                        size = json.load(f).get('bytes', 0)
+                    last_used = os.path.getmtime(meta_path)
+                except (OSError, ValueError):
+                    continue
+                entries.append((last_used, size, entry))
+
+        total = sum(size for _, size, _ in entries)
+        if total <= self.max_bytes:
+            return
+
+        entries.sort()  # Least recently used first
+        for last_used, size, entry in entries:
+            if total <= self.max_bytes:
+                break
+            if now - last_used < self.min_age or self._has_live_lease(entry, now):
+                continue
+            # Rename first so readers never see a half-deleted entry
+            doomed = f"{entry}.evicting-{uuid.uuid4().hex[:8]}"
+            try:
+                os.rename(entry, doomed)
+            except OSError:
+                continue
+            shutil.rmtree(doomed, ignore_errors=True)
+            try:
+                os.rmdir(os.path.dirname(entry))  # Drop the video's directory once empty
+            except OSError:
+                pass
+            total -= size
+            print(f"DEBUG: Evicted {entry} ({size / 1e6:.1f} MB) from media cache")
+
+    def stats(self):
+        """
+        Returns a dict of hit/miss counters for this process.
+        """
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses}
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        return True  # Exists but owned by someone else (or not checkable on this OS)
+    return True
+
+
+# Shared media/transcript cache (set MEDIA_CACHE_DISABLED=1 to turn it off)
+MEDIA_CACHE_DIR = os.getenv("MEDIA_CACHE_DIR", ".media_cache")
+MEDIA_CACHE_MAX_BYTES = int(float(os.getenv("MEDIA_CACHE_MAX_GB", "20")) * 1024 ** 3)
+MEDIA_CACHE = None if os.getenv("MEDIA_CACHE_DISABLED") else MediaCache(MEDIA_CACHE_DIR, max_bytes=MEDIA_CACHE_MAX_BYTES)
@@ -0,0 +1,289 @@
+"""
+Headless batch mode: runs the transcript -> analysis -> validation -> download -> stitch
+pipeline for many videos across a pool of worker processes.
+
+Usage:
+    python cli.py urls.txt --mode humor --provider "Google Gemini" --model gemini-2.5-flash
+
+Each line of the input file is a YouTube URL, optionally followed by the path of a
+manual transcript file (same format as the app's "Manual Transcript" box). Blank lines
+and lines starting with # are ignored.
+
+Results go to --output-dir: <video_id>.mp4 (the gag reel) and <video_id>.json (a summary
+with the clips, per-stage timings and any error). Videos whose summary says "done" or
+"no_clips" are skipped on the next run, so an interrupted batch can simply be restarted.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import shutil
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from dotenv import load_dotenv
+
+from analysis_utils import (get_transcript, parse_manual_transcript, analyze_humor, analyze_quotes,
+                            validate_and_expand_clips, GEMINI_MODELS, OPENAI_MODELS, ANTHROPIC_MODELS)
+from audio_utils import AUDIO_PREFILTER, AUDIO_PREFILTER_COVERAGE, prefilter_transcript
+from cache_utils import atomic_write
+from metrics_utils import trace_context
+from transcript_utils import TranscriptIndex
+from video_utils import extract_video_id, download_video, download_video_sections, create_gag_reel
+
+# Environment variable holding each provider's API key (same names the app saves to .env)
+API_KEY_ENV = {
+    "Google Gemini": "GEMINI_API_KEY",
+    "OpenAI": "OPENAI_API_KEY",
+    "Anthropic": "ANTHROPIC_API_KEY",
+}
+DEFAULT_MODELS = {
+    "Google Gemini": GEMINI_MODELS[1],
+    "OpenAI": OPENAI_MODELS[2],
+    "Anthropic": ANTHROPIC_MODELS[1],
+}
+# Summary statuses that count as finished when resuming
+FINISHED_STATUSES = ("done", "no_clips")
+# Videos allowed in the LLM stages (analysis + validation) at once, across all workers
+DEFAULT_LLM_JOBS = 2
+
+# Set in each worker by _init_worker
+_llm_slots = None
+
+
+def read_jobs(path):
+    """
+    Parses the input file into a list of {'url', 'transcript_path'} dicts.
+    """
+    jobs = []
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            parts = line.split(None, 1)
+            jobs.append({'url': parts[0], 'transcript_path': parts[1].strip() if len(parts) > 1 else None})
+    return jobs
+
+
+def summary_path(output_dir, video_id):
+    return os.path.join(output_dir, f"{video_id}.json")
+
+
+def is_finished(output_dir, video_id):
+    """
+    True if a previous run already finished this video (its summary says so).
+    """
+    try:
+        with open(summary_path(output_dir, video_id)) as f:
+            return json.load(f).get('status') in FINISHED_STATUSES
+    except (OSError, ValueError):
+        return False
+
+
+def _init_worker(llm_slots, work_root):
+    """
+    Process pool initializer: shares the LLM semaphore and gives each worker its own
+    scratch directory (downloads and renders clean up by glob in the working directory).
+    """
+    global _llm_slots
+    _llm_slots = llm_slots
+    work_dir = os.path.join(work_root, f"worker-{os.getpid()}")
+    os.makedirs(work_dir, exist_ok=True)
+    os.chdir(work_dir)
+
+
+def process_video(job, options):
+    """
+    Runs the full pipeline for one video and writes its JSON summary.
+    Returns the summary dict. Never raises - failures are recorded in the summary.
+    Instrumentation spans (INSTRUMENTATION_SINKS) recorded meanwhile carry the video_id.
+    """
+    with trace_context(video_id=extract_video_id(job['url'])):
+        return _process_video(job, options)
+
+
+def _process_video(job, options):
+    url = job['url']
+    video_id = extract_video_id(url)
+    summary = {'url': url, 'video_id': video_id, 'status': 'failed', 'mode': options['mode'],
+               'provider': options['provider'], 'model': options['model'], 'clips': [], 'found': 0,
+               'output': None, 'error': None, 'timings': {}}
+    timings = summary['timings']
+
+    def stage(name, started):
+        timings[name] = round(time.perf_counter() - started, 3)
+
+    try:
+        if not video_id:
+            raise ValueError("Invalid YouTube URL")
+
+        started = time.perf_counter()
+        if job['transcript_path']:
+            with open(job['transcript_path']) as f:
+                transcript = parse_manual_transcript(f.read())
+        else:
+            transcript = get_transcript(video_id)
+        stage('transcript', started)
+        if not transcript:
+            raise ValueError("No transcript found")
+        transcript = TranscriptIndex(transcript)
+
+        # Optional audio prefilter (humor only): analysis sees just the lively parts,
+        # validation still gets the whole transcript. Runs before taking an LLM slot.
+        analysis_transcript = transcript
+        if options['audio_prefilter'] and options['mode'] == "humor":
+            started = time.perf_counter()
+            analysis_transcript, summary['audio_prefilter'] = prefilter_transcript(
+                transcript, job['url'], options['audio_coverage'])
+            stage('audio_prefilter', started)
+
+        # LLM stages are throttled separately from the CPU-bound FFmpeg stages
+        started = time.perf_counter()
+        with _llm_slots:
+            stage('llm_wait', started)
+            started = time.perf_counter()
+            analyze = analyze_humor if options['mode'] == "humor" else analyze_quotes
+            intervals = analyze(analysis_transcript, options['api_key'], options['max_clip_seconds'], options['max_clips'],
+                                options['provider'], options['model'])
+            stage('analysis', started)
+            summary['found'] = len(intervals)
+
+            started = time.perf_counter()
+            if intervals:
+                intervals = validate_and_expand_clips(transcript, intervals, options['api_key'], options['max_clip_seconds'],
+                                                      options['provider'], options['model'])
+            stage('validation', started)
+
+        summary['clips'] = [{'start': start, 'end': end} for start, end in intervals]
+        if not intervals:
+            summary['status'] = 'no_clips'
+            return summary
+
+        started = time.perf_counter()
+        if options['ranges_only']:
+            video_path = download_video_sections(url, intervals, video_id=video_id)
+        else:
+            video_path = download_video(url, video_id=video_id)
+        stage('download', started)
+        if not video_path:
+            raise RuntimeError("Failed to download video")
+
+        started = time.perf_counter()
+        reel_path = create_gag_reel(video_path, intervals, options['slug_duration'], options['engine'])
+        stage('render', started)
+        if not reel_path:
+            raise RuntimeError("Failed to create gag reel")
+
+        output_path = os.path.join(options['output_dir'], f"{video_id}.mp4")
+        shutil.move(reel_path, output_path)
+        summary['output'] = output_path
+        summary['status'] = 'done'
+        return summary
+
+    except Exception as e:
+        print(f"Error processing {url}: {e}")
+        summary['error'] = str(e)
+        return summary
+
+    finally:
+        summary['timings']['total'] = round(sum(v for k, v in timings.items() if k != 'total'), 3)
+        if video_id:
+            atomic_write(summary_path(options['output_dir'], video_id), json.dumps(summary, indent=2).encode('utf-8'))
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Batch gag reel generation (headless).",
+                                     formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument("input", help="File with one YouTube URL per line (optionally followed by a transcript file path)")
+    parser.add_argument("--mode", choices=["humor", "quotes"], default="humor", help="What to extract")
+    parser.add_argument("--provider", choices=list(API_KEY_ENV), default="Google Gemini")
+    parser.add_argument("--model", help="Model name (defaults to a fast model of the provider)")
+    parser.add_argument("--api-key", help=f"API key (defaults to {', '.join(API_KEY_ENV.values())} from the environment/.env)")
+    parser.add_argument("--max-clip-seconds", type=int, default=15)
+    parser.add_argument("--max-clips", type=int, default=10)
+    parser.add_argument("--slug-duration", type=float, default=2.0, help="Black slug between clips (seconds)")
+    parser.add_argument("--engine", choices=["smart", "filtergraph", "moviepy"], default="smart", help="Reel renderer")
+    parser.add_argument("--audio-prefilter", action="store_true", default=AUDIO_PREFILTER,
+                        help="Humor mode: only analyze the transcript around lively / laughter-like audio")
+    parser.add_argument("--audio-coverage", type=float, default=AUDIO_PREFILTER_COVERAGE,
+                        help="Share of the timeline kept by --audio-prefilter")
+    parser.add_argument("--full-download", action="store_true", help="Download whole videos instead of just the clip ranges")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Worker processes (download/render scale with these)")
+    parser.add_argument("--llm-jobs", type=int, default=DEFAULT_LLM_JOBS, help="Videos in the LLM stages at once, across all workers")
+    parser.add_argument("--output-dir", default="batch_output")
+    parser.add_argument("--force", action="store_true", help="Reprocess videos that already have a finished summary")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    load_dotenv()
+    args = parse_args(argv)
+
+    api_key = args.api_key or os.getenv(API_KEY_ENV[args.provider], "")
+    if not api_key:
+        print(f"No API key: pass --api-key or set {API_KEY_ENV[args.provider]}")
+        return 2
+
+    output_dir = os.path.abspath(args.output_dir)
+    os.makedirs(output_dir, exist_ok=True)
+    options = {
+        'mode': args.mode,
+        'provider': args.provider,
+        'model': args.model or DEFAULT_MODELS[args.provider],
+        'api_key': api_key,
+        'max_clip_seconds': args.max_clip_seconds,
+        'max_clips': args.max_clips,
+        'slug_duration': args.slug_duration,
+        'engine': args.engine,
+        'ranges_only': not args.full_download,
+        'audio_prefilter': args.audio_prefilter,
+        'audio_coverage': args.audio_coverage,
+        'output_dir': output_dir,
+    }
+
+    jobs = []
+    skipped = 0
+    for job in read_jobs(args.input):
+        if job['transcript_path']:
+            job['transcript_path'] = os.path.abspath(job['transcript_path'])
+        video_id = extract_video_id(job['url'])
+        if video_id and not args.force and is_finished(output_dir, video_id):
+            skipped += 1
+            continue
+        jobs.append(job)
+
+    print(f"{len(jobs)} video(s) to process ({skipped} already done), {args.workers} worker(s), {args.llm_jobs} in LLM stages at once")
+    if not jobs:
+        return 0
+
+    work_root = os.path.join(output_dir, ".work")
+    llm_slots = multiprocessing.Semaphore(max(1, args.llm_jobs))
+    results = []
+    started = time.perf_counter()
+    try:
+        with ProcessPoolExecutor(max_workers=max(1, args.workers), initializer=_init_worker,
+                                 initargs=(llm_slots, work_root)) as executor:
+            futures = {executor.submit(process_video, job, options): job for job in jobs}
+            for n, future in enumerate(as_completed(futures), 1):
+                summary = future.result()
+                results.append(summary)
+                detail = f"{len(summary['clips'])} clip(s)" if summary['status'] == 'done' else (summary['error'] or summary['status'])
+                print(f"[{n}/{len(jobs)}] {summary['video_id'] or summary['url']}: {summary['status']} - {detail} "
+                      f"({summary['timings'].get('total', 0):.1f}s)")
+    finally:
+        shutil.rmtree(work_root, ignore_errors=True)
+
+    counts = {}
+    for summary in results:
+        counts[summary['status']] = counts.get(summary['status'], 0) + 1
+    elapsed = time.perf_counter() - started
+    print(f"Finished {len(results)} video(s) in {elapsed:.1f}s: " + ", ".join(f"{v} {k}" for k, v in sorted(counts.items())))
+    atomic_write(os.path.join(output_dir, "batch_summary.json"),
+                 json.dumps({'elapsed': round(elapsed, 3), 'counts': counts, 'skipped': skipped, 'videos': results}, indent=2).encode('utf-8'))
+    return 1 if counts.get('failed') else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,794 @@
+import contextvars
+import email.utils
+import hashlib
+import math
+import os
+import queue
+import random
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from google import genai
+from openai import OpenAI
+import anthropic
+import httpx
+
+from cache_utils import DiskCache, make_cache_key
+from metrics_utils import bind_context
+
+# Connection pool limits for each provider client (shared by all threads using it)
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "16"))
+LLM_KEEPALIVE_SECONDS = 60
+# Clients kept alive at once (one per provider/API key pair)
+MAX_POOLED_CLIENTS = 8
+
+# Per-provider request limits: (requests per second, burst, max requests in flight).
+# The in-flight limit adapts: halved on every 429, grown back by ~1 per limit's worth
+# of successes. Providers not listed are only retried, not throttled.
+PROVIDER_RATE_LIMITS = {
+    "Google Gemini": (float(os.getenv("GEMINI_RPS", "10")), 10, 16),
+    "OpenAI": (float(os.getenv("OPENAI_RPS", "10")), 10, 16),
+    "Anthropic": (float(os.getenv("ANTHROPIC_RPS", "4")), 4, 8),
+}
+# Retries for rate limits (429), overload (529) and transient server/connection errors
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "5"))
+LLM_BACKOFF_BASE = 1.0   # Seconds; attempt n waits up to base * 2**n (full jitter)
+LLM_BACKOFF_MAX = 60.0
+RETRYABLE_STATUSES = (408, 409, 429, 500, 502, 503, 504, 529)
+THROTTLE_STATUSES = (429, 529)
+
+# Hedged requests: a call still running after HEDGE_PERCENTILE of recent latencies (same
+# provider, model and prompt size) gets a duplicate sent to the backup "Provider:model";
+# the first answer wins. At most HEDGE_MAX_FRACTION of calls are hedged.
+LLM_HEDGE = os.getenv("LLM_HEDGE", "")
+HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", "95"))
+HEDGE_MAX_FRACTION = float(os.getenv("LLM_HEDGE_MAX_FRACTION", "0.1"))
+HEDGE_MIN_SAMPLES = 20     # Latencies needed before a deadline is trusted
+HEDGE_WORKERS = 16         # Threads for backup requests only (primaries get their own thread)
+LATENCY_WINDOW = 500       # Recent latencies kept per provider/model/prompt size
+# Environment variable holding each provider's API key (for an env-configured backup)
+PROVIDER_API_KEY_ENV = {
+    "Google Gemini": "GEMINI_API_KEY",
+    "OpenAI": "OPENAI_API_KEY",
+    "Anthropic": "ANTHROPIC_API_KEY",
+}
+
+# Model capability cache: the request shape (parameter adjustments, e.g. no temperature)
+# each provider/model accepted, so later calls skip the failing first attempt. Records
+# expire after MODEL_CAPABILITY_TTL_HOURS so models that change get re-probed.
+# An empty MODEL_CAPABILITY_DIR keeps them in memory only.
+MODEL_CAPABILITY_DIR = os.getenv("MODEL_CAPABILITY_DIR", ".capability_cache")
+MODEL_CAPABILITY_TTL = float(os.getenv("MODEL_CAPABILITY_TTL_HOURS", "24")) * 3600
+CAPABILITY_RECHECK_SECONDS = 60  # How long "no record" is trusted before looking on disk again
+
+
+def _httpx_limits():
+    return httpx.Limits(
+        max_connections=LLM_MAX_CONNECTIONS,
+        max_keepalive_connections=LLM_MAX_CONNECTIONS,
+        keepalive_expiry=LLM_KEEPALIVE_SECONDS,
+    )
+
+
+def _build_client(provider, api_key):
+    """
+    Creates a provider SDK client with a bounded keep-alive connection pool.
+    """
+    # SDK-level retries are off: call_with_limits owns retries, backoff and throttling
+    if provider == "Google Gemini":
+        try:
+            return genai.Client(api_key=api_key, http_options={'client_args': {'limits': _httpx_limits()}})
+        except Exception as e:
+            # Older google-genai versions don't accept client_args
+            print(f"DEBUG: Gemini client without custom limits ({e})")
+            return genai.Client(api_key=api_key)
+    elif provider == "OpenAI":
+        return OpenAI(api_key=api_key, max_retries=0, http_client=httpx.Client(limits=_httpx_limits(), timeout=600))
+    elif provider == "Anthropic":
+        return anthropic.Anthropic(api_key=api_key, max_retries=0, http_client=httpx.Client(limits=_httpx_limits(), timeout=600))
+    else:
+        raise ValueError(f"Unknown provider: {provider}")
+
+
+class ClientPool:
+    """
+    Process-wide pool of provider clients keyed by (provider, api_key).
+    Clients (and their keep-alive HTTP connections) are reused across calls, threads
+    and Streamlit reruns. A new API key gets a fresh client; the least recently used
+    clients beyond max_clients are dropped from the pool.
+    Dropped clients are never closed here: another thread or session may be in the
+    middle of a request with one. Their connections are released when the last user
+    lets go of them (garbage collection).
+    """
+    def __init__(self, max_clients=MAX_POOLED_CLIENTS):
+        self.max_clients = max_clients
+        self._clients = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(provider, api_key):
+        # Never keep raw API keys as dict keys
+        return (provider, hashlib.sha256((api_key or "").encode('utf-8')).hexdigest())
+
+    def get(self, provider, api_key):
+        """
+        Returns the pooled client for (provider, api_key), building it on first use.
+        """
+        key = self._key(provider, api_key)
+        with self._lock:
+            client = self._clients.get(key)
+            if client is not None:
+                self._clients.move_to_end(key)
+                return client
+
+            client = _build_client(provider, api_key)
+            self._clients[key] = client
+            while len(self._clients) > self.max_clients:
+                self._clients.popitem(last=False)
+            return client
+
+    def invalidate(self, provider=None, api_key=None):
+        """
+        Drops pooled clients - all of them, one provider's, or one (provider, key).
+        Requests already using them finish normally; later calls get fresh clients.
+        """
+        with self._lock:
+            if provider is not None and api_key is not None:
+                keys = [self._key(provider, api_key)]
+            else:
+                keys = [k for k in self._clients if provider is None or k[0] == provider]
+            for key in keys:
+                self._clients.pop(key, None)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._clients)
+
+
+CLIENT_POOL = ClientPool()
+
+
+def get_llm_client(provider, api_key):
+    """
+    Returns a reusable client for the provider from the process-wide CLIENT_POOL.
+    """
+    return CLIENT_POOL.get(provider, api_key)
+
+
+def error_status(error):
+    """
+    HTTP status of a provider SDK error (OpenAI/Anthropic status_code, Gemini code,
+    httpx responses), or None.
+    """
+    for attr in ('status_code', 'code', 'status'):
+        value = getattr(error, attr, None)
+        if isinstance(value, int):
+            return value
+    response = getattr(error, 'response', None)
+    value = getattr(response, 'status_code', None)
+    return value if isinstance(value, int) else None
+
+
+def retry_after_seconds(error):
+    """
+    Delay requested by the provider (Retry-After / retry-after-ms headers), or None.
+    """
+    headers = getattr(error, 'headers', None) or getattr(getattr(error, 'response', None), 'headers', None)
+    if not headers:
+        return None
+    try:
+        value = headers.get('retry-after-ms')
+        if value is not None:
+            return max(0.0, float(value) / 1000)
+        value = headers.get('retry-after')
+        if value is None:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            # HTTP-date form
+            return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError, AttributeError):
+        return None
+
+
+def is_retryable(error, status=None):
+    """
+    True for rate limits, overload and transient server/connection errors.
+    """
+    status = error_status(error) if status is None else status
+    if status is not None:
+        return status in RETRYABLE_STATUSES
+    name = type(error).__name__
+    return isinstance(error, (ConnectionError, TimeoutError, httpx.TransportError)) or "Timeout" in name or "Connection" in name
+
+
+class AdaptiveLimiter:
+    """
+    Token bucket (rate/burst) plus an in-flight limit that adapts AIMD-style:
+    halved on every throttled response, grown by 1/limit on every success, so it
+    settles just under the provider's quota. pause() stops all new requests until
+    a Retry-After deadline has passed.
+    rate: requests per second (None = no rate limit)
+    """
+    def __init__(self, name, rate=None, burst=1, max_in_flight=64, min_in_flight=1):
+        self.name = name
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.max_in_flight = max_in_flight
+        self.min_in_flight = min_in_flight
+        self.limit = float(max_in_flight)
+        self.in_flight = 0
+        self.stats = {'calls': 0, 'throttled': 0, 'errors': 0, 'retries': 0}
+        self._tokens = float(self.burst)
+        self._refilled = time.monotonic()
+        self._paused_until = 0.0
+        self._cond = threading.Condition()
+
+    def acquire(self):
+        """
+        Blocks until a request may start, then takes a token and an in-flight slot.
+        """
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                if self.rate:
+                    self._tokens = min(self.burst, self._tokens + (now - self._refilled) * self.rate)
+                    self._refilled = now
+                if now < self._paused_until:
+                    wait = self._paused_until - now
+                elif self.in_flight >= int(self.limit):
+                    wait = None  # Until a release
+                elif self.rate and self._tokens < 1:
+                    wait = (1 - self._tokens) / self.rate
+                else:
+                    if self.rate:
+                        self._tokens -= 1
+                    self.in_flight += 1
+                    self.stats['calls'] += 1
+                    return
+                self._cond.wait(wait)
+
+    def release(self, outcome="ok"):
+        """
+        Frees the slot. outcome: "ok", "throttled" (shrinks the limit) or "error".
+        """
+        with self._cond:
+            self.in_flight -= 1
+            if outcome == "throttled":
+                self.stats['throttled'] += 1
+                self.limit = max(self.min_in_flight, self.limit / 2)
+            elif outcome == "ok":
+                self.limit = min(self.max_in_flight, self.limit + 1 / self.limit)
+            else:
+                self.stats['errors'] += 1
+            self._cond.notify_all()
+
+    def note_retry(self):
+        with self._cond:
+            self.stats['retries'] += 1
+
+    def pause(self, seconds):
+        """
+        Holds back every new request for `seconds` (a provider-wide Retry-After).
+        """
+        with self._cond:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            # Drain the bucket so requests don't burst the moment the pause ends
+            self._tokens = min(self._tokens, 1.0)
+
+    def slot(self):
+        """
+        Context manager holding one slot (e.g. for a streaming response).
+        """
+        return _LimiterSlot(self)
+
+
+class _LimiterSlot:
+    def __init__(self, limiter):
+        self.limiter = limiter
+
+    def __enter__(self):
+        self.limiter.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.limiter.release("ok")
+        else:
+            self.limiter.release("throttled" if error_status(exc) in THROTTLE_STATUSES else "error")
+        return False
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def get_limiter(provider):
+    """
+    The process-wide AdaptiveLimiter for a provider (built from PROVIDER_RATE_LIMITS).
+    """
+    with _limiters_lock:
+        limiter = _limiters.get(provider)
+        if limiter is None:
+            rate, burst, max_in_flight = PROVIDER_RATE_LIMITS.get(provider, (None, 1, 64))
+            limiter = AdaptiveLimiter(provider, rate, burst, max_in_flight)
+            _limiters[provider] = limiter
+        return limiter
+
+
+def reset_limiters():
+    """
+    Drops all limiters (they are rebuilt from PROVIDER_RATE_LIMITS on next use).
+    """
+    with _limiters_lock:
+        _limiters.clear()
+
+
+def backoff_delay(attempt, base=LLM_BACKOFF_BASE, cap=LLM_BACKOFF_MAX):
+    """
+    Full-jitter exponential backoff for retry number `attempt` (0-based).
+    """
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+def call_with_limits(provider, func, max_retries=None, on_retry=None):
+    """
+    Runs func() (one provider request) under the provider's limiter, retrying
+    retryable failures with jittered exponential backoff. A Retry-After from the
+    provider is honored (on a 429 it pauses the whole provider). Non-retryable
+    errors, and the last failure once retries run out, are raised.
+    on_retry(attempt, status, delay) is called before each backoff sleep.
+    """
+    limiter = get_limiter(provider)
+    max_retries = LLM_MAX_RETRIES if max_retries is None else max_retries
+    for attempt in range(max_retries + 1):
+        limiter.acquire()
+        try:
+            result = func()
+        except Exception as e:
+            status = error_status(e)
+            throttled = status in THROTTLE_STATUSES
+            limiter.release("throttled" if throttled else "error")
+            if attempt >= max_retries or not is_retryable(e, status):
+                raise
+            retry_after = retry_after_seconds(e)
+            if retry_after is not None:
+                delay = retry_after + random.uniform(0, 0.1 * retry_after + 0.05)
+                if throttled:
+                    limiter.pause(retry_after)
+            else:
+                delay = backoff_delay(attempt)
+            limiter.note_retry()
+            print(f"DEBUG: {provider} {status or type(e).__name__}, retry {attempt + 1}/{max_retries} in {delay:.1f}s "
+                  f"(in-flight limit {limiter.limit:.1f})")
+            if on_retry:
+                on_retry(attempt, status, delay)
+            time.sleep(delay)
+            continue
+        limiter.release("ok")
+        return result
+
+
+class CapabilityCache:
+    """
+    Remembers per (provider, model) which request shape worked and which failed.
+    A shape is a sorted list of adjustments to the default parameters ([] = defaults).
+    Records live in memory and in a DiskCache shared with other processes, and expire
+    after `ttl` seconds. Unchanged successes don't touch the disk.
+    """
+    def __init__(self, directory=MODEL_CAPABILITY_DIR, ttl=MODEL_CAPABILITY_TTL):
+        self.ttl = ttl
+        self.disk = DiskCache(directory, max_bytes=1024 * 1024, max_age=ttl) if directory else None
+        self.stats = {'known': 0, 'probed': 0, 'failures': 0}
+        self._records = {}  # (provider, model) -> (checked_at, record or None)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(provider, model):
+        return make_cache_key('model-capability', provider, model.strip())
+
+    def get(self, provider, model):
+        """
+        The record {'working': shape or None, 'failed': [shape, ...], 'updated': time}, or None.
+        """
+        now = time.time()
+        with self._lock:
+            checked_at, record = self._records.get((provider, model), (0.0, None))
+        if record is not None and now - record['updated'] <= self.ttl:
+            return record
+        if record is None and now - checked_at < CAPABILITY_RECHECK_SECONDS:
+            return None
+        record = self.disk.get(self._key(provider, model)) if self.disk else None
+        if record is not None and now - record.get('updated', 0) > self.ttl:
+            record = None
+        with self._lock:
+            self._records[(provider, model)] = (now, record)
+        return record
+
+    def working_shape(self, provider, model):
+        """
+        The shape that last worked for this model, or None if unknown (probe with the defaults).
+        """
+        record = self.get(provider, model)
+        shape = record.get('working') if record else None
+        with self._lock:
+            self.stats['known' if shape is not None else 'probed'] += 1
+        return shape
+
+    def _update(self, provider, model, change):
+        record = dict(self.get(provider, model) or {'working': None, 'failed': []})
+        record['failed'] = list(record['failed'])
+        if not change(record):
+            return
+        record['updated'] = time.time()
+        with self._lock:
+            self._records[(provider, model)] = (record['updated'], record)
+        if self.disk:
+            self.disk.set(self._key(provider, model), record)
+
+    def record_success(self, provider, model, shape):
+        shape = sorted(shape)
+        
+        def change(record):
+            if record['working'] == shape:
+                return False
+            record['working'] = shape
+            record['failed'] = [failed for failed in record['failed'] if failed != shape]
+            return True
+        self._update(provider, model, change)
+
+    def record_failure(self, provider, model, shape):
+        shape = sorted(shape)
+        with self._lock:
+            self.stats['failures'] += 1
+        
+        def change(record):
+            if shape in record['failed'] and record['working'] != shape:
+                return False
+            record['failed'].append(shape)
+            if record['working'] == shape:
+                record['working'] = None
+            return True
+        self._update(provider, model, change)
+
+    def invalidate(self, provider, model):
+        with self._lock:
+            self._records.pop((provider, model), None)
+        if self.disk:
+            self.disk.set(self._key(provider, model), None)
+
+
+MODEL_CAPABILITIES = CapabilityCache()
+
+
+class LatencyHistogram:
+    """
+    Latencies of recent successful calls (a sliding window, so it follows drift)
+    for one provider/model/prompt size class.
+    """
+    # Bucket upper bounds in seconds, for reporting
+    BUCKETS = (0.25, 0.5, 1, 2, 4, 8, 15, 30, 60, 120, float('inf'))
+
+    def __init__(self, window=LATENCY_WINDOW):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def __len__(self):
+        return len(self._samples)
+
+    def percentile(self, p):
+        """
+        The p-th percentile (0-100) of the recent latencies, or None without samples.
+        """
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return None
+        return samples[min(len(samples) - 1, int(math.ceil(p / 100 * len(samples))) - 1)]
+
+    def histogram(self):
+        """
+        Counts per bucket: [(upper bound, count), ...].
+        """
+        with self._lock:
+            samples = list(self._samples)
+        counts = [0] * len(self.BUCKETS)
+        for seconds in samples:
+            counts[next(i for i, bound in enumerate(self.BUCKETS) if seconds <= bound)] += 1
+        return list(zip(self.BUCKETS, counts))
+
+
+LATENCY_HISTOGRAMS = {}
+_latency_lock = threading.Lock()
+
+
+def prompt_size_class(prompt):
+    """
+    Coarse prompt size bucket (doubling every ~2k characters), so small validation
+    calls and large analysis calls get separate latency histograms.
+    """
+    return min(8, int(math.log2(1 + len(prompt) / 2000)))
+
+
+def latency_histogram(provider, model, size_class):
+    key = (provider, model, size_class)
+    with _latency_lock:
+        histogram = LATENCY_HISTOGRAMS.get(key)
+        if histogram is None:
+            histogram = LATENCY_HISTOGRAMS[key] = LatencyHistogram()
+        return histogram
+
+
+def record_latency(provider, model, prompt, seconds):
+    latency_histogram(provider, model, prompt_size_class(prompt)).record(seconds)
+
+
+class HedgePolicy:
+    """
+    Where and when to hedge: the backup (provider, model, api_key), the latency
+    percentile used as deadline and the max share of calls that may be hedged.
+    """
+    def __init__(self, provider, model, api_key, percentile=HEDGE_PERCENTILE, max_fraction=HEDGE_MAX_FRACTION,
+                 min_samples=HEDGE_MIN_SAMPLES):
+        self.provider = provider
+        self.model = model
+        self.api_key = api_key
+        self.percentile = percentile
+        self.max_fraction = max_fraction
+        self.min_samples = min_samples
+        self.stats = {'calls': 0, 'hedged': 0, 'backup_wins': 0}
+        self._lock = threading.Lock()
+
+    def deadline(self, provider, model, prompt):
+        """
+        Seconds after which a call should be hedged, or None (warming up, or the call
+        already targets the backup). Counts the call towards the hedging budget.
+        """
+        with self._lock:
+            self.stats['calls'] += 1
+        if (provider, model) == (self.provider, self.model):
+            return None
+        histogram = latency_histogram(provider, model, prompt_size_class(prompt))
+        if len(histogram) < self.min_samples:
+            return None
+        return histogram.percentile(self.percentile)
+
+    def allow(self):
+        """
+        Takes one hedge from the budget (max_fraction of all calls), if there is one left.
+        """
+        with self._lock:
+            if self.stats['hedged'] + 1 > self.max_fraction * self.stats['calls']:
+                return False
+            self.stats['hedged'] += 1
+            return True
+
+    def note_backup_win(self):
+        with self._lock:
+            self.stats['backup_wins'] += 1
+
+
+def _policy_from_env():
+    if not LLM_HEDGE:
+        return None
+    provider, _, model = LLM_HEDGE.partition(":")
+    provider, model = provider.strip(), model.strip()
+    api_key = os.getenv(PROVIDER_API_KEY_ENV.get(provider, ""), "")
+    if not model or (provider in PROVIDER_API_KEY_ENV and not api_key):
+        print(f"DEBUG: Ignoring LLM_HEDGE='{LLM_HEDGE}' (expected 'Provider:model' with an API key set)")
+        return None
+    return HedgePolicy(provider, model, api_key)
+
+
+_hedge_policy = contextvars.ContextVar("hedge_policy", default=_policy_from_env())
+
+
+def get_hedge_policy():
+    return _hedge_policy.get()
+
+
+def set_hedge_policy(policy):
+    """
+    Sets the hedging policy (None = off) for the rest of the current context, e.g. a
+    Streamlit run. Carried into thread pools by bind_context.
+    """
+    _hedge_policy.set(policy)
+
+
+@contextmanager
+def hedging(policy):
+    """
+    Uses `policy` (None = off) for calls inside the block.
+    """
+    token = _hedge_policy.set(policy)
+    try:
+        yield policy
+    finally:
+        _hedge_policy.reset(token)
+
+
+_hedge_pool = None
+_hedge_pool_lock = threading.Lock()
+
+
+def _get_hedge_pool():
+    global _hedge_pool
+    with _hedge_pool_lock:
+        if _hedge_pool is None:
+            _hedge_pool = ThreadPoolExecutor(max_workers=HEDGE_WORKERS, thread_name_prefix="llm-hedge")
+        return _hedge_pool
+
+
+_ATTEMPT = object()  # hedged_call queue marker: a call sent a request
+
+
+def hedged_call(primary, backup, deadline, policy):
+    """
+    Runs primary(on_attempt); if the request it has in flight hasn't answered after
+    `deadline` seconds and the policy's budget allows, runs backup(on_attempt) too.
+    Calls report each request they send with on_attempt(), so the deadline runs from
+    the primary's latest request, not from when it started queueing in its limiter.
+    The first non-empty answer wins. Returns (answer, "primary" or "backup").
+    The primary runs on a thread of its own (never queued behind other calls);
+    backups use the separate hedge pool. The loser is cancelled if it hasn't started.
+    A request already in flight can't be interrupted through the blocking SDKs, so it
+    is abandoned and its answer dropped.
+    Without a non-empty answer the result is the primary's, as if unhedged: its
+    error is raised, or its (empty) answer returned.
+    """
+    results = queue.Queue()
+
+    def run(role, func):
+        try:
+            results.put((role, func(lambda: results.put((role, _ATTEMPT, None))), None))
+        except Exception as e:  # pylint: disable=broad-except
+            results.put((role, None, e))
+
+    threading.Thread(target=bind_context(run), args=("primary", primary), name="llm-primary", daemon=True).start()
+    launched = 1
+    backup_future = None
+    attempt_started = None  # When the primary's current request went out
+    hedge_decided = False
+    outcomes = {}
+    while True:
+        timeout = None
+        if attempt_started is not None and not hedge_decided:
+            timeout = max(0.0, attempt_started + deadline - time.monotonic())
+        try:
+            role, answer, error = results.get(timeout=timeout)
+        except queue.Empty:
+            hedge_decided = True
+            if policy.allow():
+                print(f"DEBUG: No answer after {deadline:.2f}s, hedging with {policy.provider} '{policy.model}'")
+                backup_future = _get_hedge_pool().submit(bind_context(run), "backup", backup)
+                launched = 2
+            continue
+        if answer is _ATTEMPT:
+            if role == "primary":
+                attempt_started = time.monotonic()
+            continue
+
+        outcomes[role] = (answer, error)
+        if error is None and answer:
+            if role == "primary" and backup_future is not None:
+                backup_future.cancel()
+            if role == "backup":
+                policy.note_backup_win()
+            return answer, role
+        if len(outcomes) == launched:
+            break
+
+    answer, error = outcomes["primary"]
+    if error is not None:
+        raise error
+    return answer, "primary"
+
+
+class StubProviderError(Exception):
+    """
+    Error raised by StubProvider fault injection; looks like an SDK status error.
+    """
+    def __init__(self, status_code, headers=None):
+        super().__init__(f"Stub provider error {status_code}")
+        self.status_code = status_code
+        self.headers = headers or {}
+
+
+class StubProvider:
+    """
+    Deterministic offline provider for tests and benchmarks.
+    responder: canned response string, or callable(prompt, model) -> str
+    latency: seconds before the first token; token_delay: seconds between streamed chunks
+    Fault injection: fault_rate of calls fail with a status from fault_statuses, and
+    calls beyond max_in_flight concurrent ones get a 429 (a quota); both carry a
+    Retry-After of retry_after seconds if set.
+    """
+    def __init__(self, responder="[]", latency=0.0, token_delay=0.0, chunk_size=16,
+                 fault_rate=0.0, fault_statuses=(429, 503), max_in_flight=None, retry_after=None, seed=0):
+        self.responder = responder
+        self.latency = latency
+        self.token_delay = token_delay
+        self.chunk_size = chunk_size
+        self.fault_rate = fault_rate
+        self.fault_statuses = fault_statuses
+        self.max_in_flight = max_in_flight
+        self.retry_after = retry_after
+        self.calls = 0
+        self.faults = 0
+        self.in_flight = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def _respond(self, prompt, model):
+        with self._lock:
+            self.calls += 1
+            status = None
+            if self.max_in_flight is not None and self.in_flight >= self.max_in_flight:
+                status = 429
+            elif self.fault_rate and self._random.random() < self.fault_rate:
+                status = self._random.choice(self.fault_statuses)
+            if status is not None:
+                self.faults += 1
+                headers = {'retry-after': str(self.retry_after)} if self.retry_after is not None else {}
+                raise StubProviderError(status, headers)
+            self.in_flight += 1
+        if callable(self.responder):
+            return self.responder(prompt, model)
+        return self.responder
+
+    def _done(self):
+        with self._lock:
+            self.in_flight -= 1
+
+    def complete(self, prompt, model):
+        """
+        Returns the full response after `latency` (+ the time streaming it would take).
+        """
+        text = self._respond(prompt, model)
+        try:
+            chunks = max(1, -(-len(text) // self.chunk_size))
+            time.sleep(self.latency + self.token_delay * chunks)
+            return text
+        finally:
+            self._done()
+
+    def stream(self, prompt, model):
+        """
+        Yields the response in chunk_size pieces, token_delay apart.
+        """
+        text = self._respond(prompt, model)
+        try:
+            time.sleep(self.latency)
+            for i in range(0, len(text), self.chunk_size):
+                if self.token_delay:
+                    time.sleep(self.token_delay)
+                yield text[i:i + self.chunk_size]
+        finally:
+            self._done()
+
+
+# Extra providers (e.g. StubProvider) usable anywhere a provider name is accepted
+CUSTOM_PROVIDERS = {}
+
+
+def register_provider(name, provider):
+    """
+    Registers an object with complete(prompt, model) and stream(prompt, model) methods
+    under `name`, so call_llm/call_llm_stream route that provider name to it.
+    """
+    CUSTOM_PROVIDERS[name] = provider
+
+
+def get_custom_provider(name):
+    """
+    Returns the registered custom provider for `name`, or None.
+    """
+    return CUSTOM_PROVIDERS.get(name)
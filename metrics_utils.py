@@ -0,0 +1,361 @@
+import atexit
+import contextvars
+import functools
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Windows: no child CPU accounting
+    resource = None
+
+from cache_utils import atomic_write
+
+# Sinks enabled at startup, e.g. "jsonl:metrics/spans.jsonl,prometheus:metrics/gagreel.prom"
+# (empty = instrumentation off; span() is then a shared no-op)
+INSTRUMENTATION_SINKS = os.getenv("INSTRUMENTATION_SINKS", "")
+PROMETHEUS_PREFIX = "gagreel"
+# Span name prefixes that run inside other stages (left out of stage_breakdown)
+NESTED_SPAN_PREFIXES = ("llm", "ffmpeg", "moviepy")
+
+# Copy-on-write list so span() can check it without a lock
+_sinks = []
+_sinks_lock = threading.Lock()
+# Attributes (video_id, session, ...) added to every span recorded in this context
+_trace_context = contextvars.ContextVar("trace_context", default={})
+
+
+def _children_cpu():
+    """
+    CPU seconds of finished child processes (FFmpeg) of this process, or 0 where unsupported.
+    """
+    if resource is None:
+        return 0.0
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+class Span:
+    """
+    One timed stage: wall time, CPU time of the calling thread, CPU time of child
+    processes that finished meanwhile (approximate when renders overlap) and any
+    attributes. Emitted to every sink when the block exits. Use via span().
+    """
+    __slots__ = ('name', 'attributes', 'started', '_wall', '_cpu', '_children')
+
+    def __init__(self, name, attributes):
+        self.name = name
+        self.attributes = attributes
+
+    def set(self, **attributes):
+        """
+        Adds attributes (sizes, counts, ...) known only while the stage runs.
+        """
+        self.attributes.update(attributes)
+
+    def __enter__(self):
+        self.started = time.time()
+        self._wall = time.perf_counter()
+        self._cpu = time.thread_time()
+        self._children = _children_cpu()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        wall = time.perf_counter() - self._wall
+        record = {
+            'span': self.name,
+            'start': round(self.started, 3),
+            'wall': round(wall, 6),
+            'cpu': round(time.thread_time() - self._cpu, 6),
+            'cpu_children': round(_children_cpu() - self._children, 6),
+        }
+        record.update(_trace_context.get())
+        record.update(self.attributes)
+        if exc_type is not None:
+            record['error'] = exc_type.__name__
+        if record.get('bytes') and wall > 0:
+            record['bytes_per_second'] = round(record['bytes'] / wall)
+        emit(record)
+        return False
+
+
+class _NoopSpan:
+    """
+    Returned by span() while no sink is registered.
+    """
+    __slots__ = ()
+
+    def set(self, **attributes):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+def instrumentation_enabled():
+    return bool(_sinks)
+
+
+def span(name, **attributes):
+    """
+    Context manager timing a stage: `with span("download.full") as s: ... s.set(bytes=n)`.
+    Costs one list check when instrumentation is off.
+    """
+    if not _sinks:
+        return _NOOP_SPAN
+    return Span(name, attributes)
+
+
+def traced(name, on_result=None):
+    """
+    Decorator running the function inside span(name).
+    on_result(result) -> dict of attributes to add (e.g. output size), optional.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _sinks:
+                return func(*args, **kwargs)
+            with Span(name, {}) as s:
+                result = func(*args, **kwargs)
+                if on_result is not None:
+                    s.set(**on_result(result))
+                return result
+        return wrapper
+    return decorator
+
+
+@contextmanager
+def trace_context(**attributes):
+    """
+    Adds attributes (e.g. video_id) to every span recorded inside the block, in this
+    thread and in work handed to other threads through bind_context().
+    """
+    token = _trace_context.set({**_trace_context.get(), **attributes})
+    try:
+        yield
+    finally:
+        _trace_context.reset(token)
+
+
+def get_trace_attributes():
+    """
+    The attributes of the current trace context (a dict; don't modify it).
+    """
+    return _trace_context.get()
+
+
+def set_trace_attributes(**attributes):
+    """
+    Adds attributes for the rest of the current context - e.g. the video_id once a
+    Streamlit run knows it. Scoped by an enclosing trace_context(), which restores
+    the previous attributes when it exits.
+    """
+    _trace_context.set({**_trace_context.get(), **attributes})
+
+
+def bind_context(func):
+    """
+    Wraps func so it runs with the caller's context variables (trace attributes, the
+    profiling switch) - for thread pools and threads, which don't inherit them.
+    """
+    context = contextvars.copy_context()
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        # A context can only be entered by one thread at a time
+        return context.copy().run(func, *args, **kwargs)
+    return wrapper
+
+
+def emit(record):
+    """
+    Sends a finished span record to every sink. Sink errors never reach the caller.
+    """
+    for sink in _sinks:
+        try:
+            sink.emit(record)
+        except Exception as e:  # pylint: disable=broad-except
+            print(f"DEBUG: Instrumentation sink {type(sink).__name__} failed: {e}")
+
+
+def add_sink(sink):
+    """
+    Registers a sink (any object with emit(record)). Adding the same sink twice is a no-op.
+    """
+    global _sinks
+    with _sinks_lock:
+        if sink not in _sinks:
+            _sinks = _sinks + [sink]
+    return sink
+
+
+def remove_sink(sink):
+    global _sinks
+    with _sinks_lock:
+        _sinks = [s for s in _sinks if s is not sink]
+    close = getattr(sink, 'close', None)
+    if close:
+        close()
+
+
+class JsonLinesSink:
+    """
+    Appends one JSON object per span to a file (safe to share between threads).
+    """
+    def __init__(self, path):
+        self.path = path
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._file = open(path, "a", buffering=1, encoding="utf-8")
+        self._lock = threading.Lock()
+
+    def emit(self, record):
+        line = json.dumps(record, default=str) + "\n"
+        with self._lock:
+            self._file.write(line)
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+class PrometheusSink:
+    """
+    Aggregates spans into per-span counters and rewrites them as a Prometheus
+    text-format file (e.g. for node_exporter's textfile collector), at most every
+    min_interval seconds and on close. "{pid}" in the path is replaced with the
+    process id, so batch workers don't overwrite each other's files.
+    """
+    # (metric suffix, record field, help text)
+    METRICS = (
+        ("span_seconds_total", "wall", "Wall time spent in the stage"),
+        ("span_cpu_seconds_total", "cpu", "Python CPU time spent in the stage"),
+        ("span_child_cpu_seconds_total", "cpu_children", "CPU time of FFmpeg child processes during the stage"),
+        ("span_bytes_total", "bytes", "Bytes downloaded or written by the stage"),
+        ("span_calls_total", None, "Number of times the stage ran"),
+        ("span_errors_total", "error", "Number of times the stage raised"),
+    )
+
+    def __init__(self, path, prefix=PROMETHEUS_PREFIX, min_interval=1.0):
+        self.path = path
+        self.prefix = prefix
+        self.min_interval = min_interval
+        self._totals = {}
+        self._last_write = 0.0
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    def emit(self, record):
+        with self._lock:
+            for suffix, field, _ in self.METRICS:
+                if field is None:
+                    value = 1
+                elif field == "error":
+                    value = 1 if record.get('error') else 0
+                else:
+                    value = record.get(field) or 0
+                key = (suffix, record['span'])
+                self._totals[key] = self._totals.get(key, 0) + value
+            if time.time() - self._last_write >= self.min_interval:
+                self._write()
+
+    def _write(self):
+        lines = []
+        for suffix, _, help_text in self.METRICS:
+            name = f"{self.prefix}_{suffix}"
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} counter")
+            for (metric, span_name), value in sorted(self._totals.items()):
+                if metric == suffix:
+                    lines.append(f'{name}{{span="{span_name}"}} {value:g}')
+        atomic_write(self.path.replace("{pid}", str(os.getpid())), ("\n".join(lines) + "\n").encode('utf-8'))
+        self._last_write = time.time()
+
+    def close(self):
+        with self._lock:
+            if self._totals:
+                self._write()
+
+
+class MemorySink:
+    """
+    Keeps the most recent spans in memory (e.g. for the Streamlit sidebar).
+    """
+    def __init__(self, max_spans=5000):
+        self.spans = deque(maxlen=max_spans)
+
+    def emit(self, record):
+        self.spans.append(record)
+
+    def recent(self, **filters):
+        """
+        Returns the stored spans whose attributes match all filters (oldest first).
+        """
+        return [r for r in list(self.spans) if all(r.get(k) == v for k, v in filters.items())]
+
+
+# In-process sink behind the app's "Stage timings" sidebar (registered on demand)
+MEMORY_SINK = MemorySink()
+
+
+def stage_breakdown(records):
+    """
+    Totals span records by stage (the span name before the first '.'), leaving out
+    spans nested inside other stages (LLM calls, FFmpeg and MoviePy runs). Parallel work (e.g.
+    preview renders) adds up, so a stage's seconds can exceed its elapsed time.
+    Returns a list of {'stage', 'seconds', 'cpu', 'calls', 'share'}, largest first.
+    """
+    totals = {}
+    for record in records:
+        stage = record['span'].split('.', 1)[0]
+        if stage in NESTED_SPAN_PREFIXES:
+            continue
+        entry = totals.setdefault(stage, {'stage': stage, 'seconds': 0.0, 'cpu': 0.0, 'calls': 0})
+        entry['seconds'] += record['wall']
+        entry['cpu'] += record['cpu'] + record.get('cpu_children', 0)
+        entry['calls'] += 1
+    overall = sum(entry['seconds'] for entry in totals.values()) or 1.0
+    for entry in totals.values():
+        entry['share'] = entry['seconds'] / overall
+    return sorted(totals.values(), key=lambda entry: entry['seconds'], reverse=True)
+
+
+def configure_sinks(spec):
+    """
+    Registers the sinks in a comma-separated spec: "jsonl:<path>", "prometheus:<path>", "memory".
+    """
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        kind, _, path = item.partition(":")
+        if kind == "jsonl":
+            add_sink(JsonLinesSink(path or "metrics/spans.jsonl"))
+        elif kind == "prometheus":
+            add_sink(PrometheusSink(path or f"metrics/{PROMETHEUS_PREFIX}.prom"))
+        elif kind == "memory":
+            add_sink(MEMORY_SINK)
+        else:
+            print(f"DEBUG: Unknown instrumentation sink '{item}'")
+
+
+def _close_sinks():
+    for sink in list(_sinks):
+        close = getattr(sink, 'close', None)
+        if close:
+            try:
+                close()
+            except Exception:  # pylint: disable=broad-except
+                pass
+
+
+configure_sinks(INSTRUMENTATION_SINKS)
+atexit.register(_close_sinks)
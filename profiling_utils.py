@@ -0,0 +1,211 @@
+import contextvars
+import functools
+import os
+import re
+import sys
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from metrics_utils import get_trace_attributes
+
+# Opt-in sampling profiler: PROFILE_SAMPLING=1 profiles every run (or use the app's
+# sidebar toggle per session). Each profiled stage writes a collapsed-stacks file
+# (flamegraph.pl / speedscope / inferno compatible) to PROFILE_DIR.
+PROFILING_ENABLED = os.getenv("PROFILE_SAMPLING", "") not in ("", "0")
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL_MS", "10")) / 1000
+# Sample every thread, not just the one running the stage (e.g. to see worker pools)
+PROFILE_ALL_THREADS = os.getenv("PROFILE_ALL_THREADS", "") not in ("", "0")
+
+# Per-context switch used by the sidebar toggle (carried into pools by bind_context)
+_profiling_requested = contextvars.ContextVar("profiling_requested", default=False)
+# Code object -> frame label, so each sample only walks frames
+_frame_labels = {}
+
+
+def _frame_label(code):
+    label = _frame_labels.get(code)
+    if label is None:
+        label = f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+        _frame_labels[code] = label
+    return label
+
+
+class StageProfile:
+    """
+    Sample counts of the collapsed call stacks seen while one stage ran.
+    thread_id: the thread to sample, or None for every thread (stacks are then
+    rooted at the thread name).
+    """
+    def __init__(self, stage, session, thread_id=None):
+        self.stage = stage
+        self.session = session
+        self.thread_id = thread_id
+        self.counts = {}
+        self.samples = 0
+        self.path = None
+
+    def sample(self, frames, thread_names):
+        for ident, frame in frames.items():
+            if self.thread_id is not None and ident != self.thread_id:
+                continue
+            if thread_names is not None and ident not in thread_names:
+                continue  # The sampler itself, or a thread that just ended
+            stack = []
+            while frame is not None:
+                stack.append(_frame_label(frame.f_code))
+                frame = frame.f_back
+            if thread_names is not None:
+                stack.append(thread_names[ident])
+            stack.reverse()
+            key = ";".join(stack)
+            self.counts[key] = self.counts.get(key, 0) + 1
+        self.samples += 1
+
+    def write(self, directory=PROFILE_DIR):
+        """
+        Writes the collapsed stacks ("frame;frame;frame count" per line) and returns the path.
+        """
+        os.makedirs(directory, exist_ok=True)
+        name = f"{self.session}-{self.stage}-{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:4]}"
+        self.path = os.path.join(directory, re.sub(r"[^\w.-]", "_", name) + ".collapsed")
+        with open(self.path, "w", encoding="utf-8") as f:
+            for stack, count in sorted(self.counts.items(), key=lambda item: item[1], reverse=True):
+                f.write(f"{stack} {count}\n")
+        return self.path
+
+
+class Sampler:
+    """
+    One daemon thread serving every active StageProfile: it sleeps while none are
+    active and otherwise grabs all thread stacks once per interval.
+    """
+    def __init__(self, interval=PROFILE_INTERVAL):
+        self.interval = interval
+        self.sampling_seconds = 0.0  # Time spent taking samples (the profiler's own cost)
+        self._active = []
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+
+    def register(self, profile):
+        with self._lock:
+            self._active = self._active + [profile]
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+                self._thread.start()
+        self._wake.set()
+
+    def unregister(self, profile):
+        # Waits for a sample in progress, so the profile can be written safely afterwards
+        with self._lock:
+            self._active = [p for p in self._active if p is not profile]
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while True:
+            active = self._active
+            if not active:
+                self._wake.wait()
+                self._wake.clear()
+                continue
+            time.sleep(self.interval)
+            with self._lock:
+                started = time.perf_counter()
+                frames = sys._current_frames()
+                frames.pop(own_id, None)
+                thread_names = None
+                if any(profile.thread_id is None for profile in self._active):
+                    thread_names = {t.ident: t.name for t in threading.enumerate()}
+                for profile in self._active:
+                    profile.sample(frames, thread_names if profile.thread_id is None else None)
+                self.sampling_seconds += time.perf_counter() - started
+
+
+SAMPLER = Sampler()
+
+
+class _NoProfile:
+    """
+    Returned by profile_stage() when profiling is off.
+    """
+    __slots__ = ()
+
+    def __enter__(self):
+        return None
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NO_PROFILE = _NoProfile()
+
+
+def profiling_active():
+    return PROFILING_ENABLED or _profiling_requested.get()
+
+
+class _ProfiledStage:
+    def __init__(self, stage, session, all_threads):
+        self.profile = StageProfile(stage, session, None if all_threads else threading.get_ident())
+
+    def __enter__(self):
+        self._started = time.perf_counter()
+        self._sampling = SAMPLER.sampling_seconds
+        SAMPLER.register(self.profile)
+        return self.profile
+
+    def __exit__(self, *exc):
+        SAMPLER.unregister(self.profile)
+        if self.profile.samples:
+            try:
+                path = self.profile.write()
+                elapsed = time.perf_counter() - self._started
+                print(f"DEBUG: Profile {path}: {self.profile.samples} samples over {elapsed:.1f}s "
+                      f"(sampling cost ~{(SAMPLER.sampling_seconds - self._sampling) * 1000:.0f}ms, all profiles)")
+            except OSError as e:
+                print(f"DEBUG: Could not write profile for {self.profile.stage}: {e}")
+        return False
+
+
+def profile_stage(stage, session=None, all_threads=PROFILE_ALL_THREADS):
+    """
+    Context manager sampling the calling thread (or all threads) while the block runs
+    and writing <session>-<stage>-<time>.collapsed to PROFILE_DIR. The session defaults
+    to the trace context's session (or video_id). A shared no-op while profiling is off.
+    """
+    if not profiling_active():
+        return _NO_PROFILE
+    if session is None:
+        attributes = get_trace_attributes()
+        session = attributes.get('session') or attributes.get('video_id') or "run"
+    return _ProfiledStage(stage, session, all_threads)
+
+
+def profiled(stage):
+    """
+    Decorator: runs the function inside profile_stage(stage).
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not profiling_active():
+                return func(*args, **kwargs)
+            with profile_stage(stage):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+@contextmanager
+def profiling_requested(enabled=True):
+    """
+    Turns profiling on for the block (e.g. one Streamlit session) even without PROFILE_SAMPLING.
+    """
+    token = _profiling_requested.set(bool(enabled))
+    try:
+        yield
+    finally:
+        _profiling_requested.reset(token)
@@ -0,0 +1,244 @@
+import mmap
+import os
+import struct
+import sys
+from array import array
+from bisect import bisect_left, bisect_right
+
+# Default caption duration (seconds) when an entry has none
+DEFAULT_ENTRY_DURATION = 3
+
+# Binary transcript format: header, then starts (f64 * n), durations (f64 * n),
+# text offsets (i64 * (n + 1)) and the UTF-8 text buffer. Sections are 8-byte aligned.
+TRANSCRIPT_MAGIC = b"GGTR"
+TRANSCRIPT_FORMAT_VERSION = 1
+_TRANSCRIPT_HEADER = struct.Struct("<4sBBxxQQ")  # magic, version, little-endian flag, n, text bytes
+
+
+class Transcript:
+    """
+    Compact transcript: start times and durations in contiguous float arrays and all
+    text in one UTF-8 buffer indexed by an offsets array (~30 bytes/entry + text,
+    instead of a dict and three objects per entry).
+    Behaves like a read-only list of {'text', 'start', 'duration'} dicts; entries are
+    built on access, so prefer .starts/.durations/text(i) in hot loops.
+    """
+    def __init__(self, starts, durations, offsets, text_buffer, _mapping=None):
+        self.starts = starts
+        self.durations = durations
+        self.offsets = offsets
+        self.text_buffer = text_buffer
+        self._mapping = _mapping  # Keeps a memory-mapped file open while in use
+
+    @classmethod
+    def from_entries(cls, entries):
+        """
+        Builds a Transcript from any iterable of {'text', 'start', 'duration'} dicts.
+        """
+        if isinstance(entries, cls):
+            return entries
+        starts = array('d')
+        durations = array('d')
+        offsets = array('q', [0])
+        chunks = []
+        size = 0
+        for entry in entries:
+            encoded = entry['text'].encode('utf-8')
+            starts.append(entry['start'])
+            durations.append(entry.get('duration', DEFAULT_ENTRY_DURATION))
+            chunks.append(encoded)
+            size += len(encoded)
+            offsets.append(size)
+        return cls(starts, durations, offsets, b"".join(chunks))
+
+    def __len__(self):
+        return len(self.starts)
+
+    def text(self, i):
+        """
+        Text of entry i (decoded on demand).
+        """
+        return bytes(self.text_buffer[self.offsets[i]:self.offsets[i + 1]]).decode('utf-8')
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return Transcript.from_entries(self[j] for j in range(*i.indices(len(self))))
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("transcript index out of range")
+        return {'text': self.text(i), 'start': self.starts[i], 'duration': self.durations[i]}
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def to_list(self):
+        """
+        Returns the transcript as a plain list of dicts (e.g. for JSON).
+        """
+        return list(self)
+
+    def to_bytes(self):
+        """
+        Serializes to the binary format read by from_bytes()/load().
+        """
+        n = len(self)
+        parts = [_TRANSCRIPT_HEADER.pack(TRANSCRIPT_MAGIC, TRANSCRIPT_FORMAT_VERSION, 1, n, len(self.text_buffer))]
+        for values, typecode in ((self.starts, 'd'), (self.durations, 'd'), (self.offsets, 'q')):
+            values = array(typecode, values)
+            if sys.byteorder != 'little':
+                values.byteswap()
+            parts.append(values.tobytes())
+        parts.append(bytes(self.text_buffer))
+        return b"".join(parts)
+
+    @classmethod
+    def from_bytes(cls, data, _mapping=None):
+        """
+        Reads the binary format without copying: arrays are views into `data`
+        (bytes, memoryview or mmap) on little-endian machines.
+        """
+        view = memoryview(data)
+        magic, version, _, n, text_size = _TRANSCRIPT_HEADER.unpack_from(view)
+        if magic != TRANSCRIPT_MAGIC or version != TRANSCRIPT_FORMAT_VERSION:
+            raise ValueError("Not a transcript file (or unsupported version)")
+
+        pos = _TRANSCRIPT_HEADER.size
+        sections = []
+        for typecode, count in (('d', n), ('d', n), ('q', n + 1)):
+            raw = view[pos:pos + 8 * count]
+            if len(raw) != 8 * count:
+                raise ValueError("Truncated transcript file")
+            if sys.byteorder == 'little':
+                sections.append(raw.cast(typecode))
+            else:
+                values = array(typecode, raw.tobytes())
+                values.byteswap()
+                sections.append(values)
+            pos += 8 * count
+        text_buffer = view[pos:pos + text_size]
+        if len(text_buffer) != text_size:
+            raise ValueError("Truncated transcript file")
+        return cls(sections[0], sections[1], sections[2], text_buffer, _mapping=_mapping)
+
+    def save(self, path):
+        """
+        Writes the binary format to `path`.
+        """
+        with open(path, "wb") as f:
+            f.write(self.to_bytes())
+
+    @classmethod
+    def load(cls, path, use_mmap=True):
+        """
+        Loads a transcript saved with save(). With use_mmap the file is memory-mapped,
+        so pages are shared between processes and only read when touched.
+        """
+        with open(path, "rb") as f:
+            if not use_mmap or os.fstat(f.fileno()).st_size == 0:
+                return cls.from_bytes(f.read())
+            mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return cls.from_bytes(mapping, _mapping=mapping)
+
+
+class TranscriptIndex:
+    """
+    Sorted interval index over a transcript (list of {'text', 'start', 'duration'} dicts).
+    Built once per transcript; answers overlap queries in O(log n + k) with binary search.
+    Behaves like the underlying list (len, indexing, iteration), so it can be passed
+    anywhere a transcript is expected. Indices always refer to the original list order.
+    """
+    def __init__(self, transcript):
+        self.transcript = transcript
+
+        # Per-entry start/end in original order (flat float arrays, not lists of floats)
+        if isinstance(transcript, Transcript):
+            self.starts = array('d', transcript.starts)
+            self.ends = array('d', map(float.__add__, transcript.starts, transcript.durations))
+        else:
+            self.starts = array('d', (entry['start'] for entry in transcript))
+            self.ends = array('d', (entry['start'] + entry.get('duration', DEFAULT_ENTRY_DURATION) for entry in transcript))
+
+        # Entries sorted by start, with a running max of end times so the first
+        # entry that can still overlap a query start is found by bisection
+        self._order = array('q', sorted(range(len(transcript)), key=self.starts.__getitem__))
+        self._sorted_starts = array('d', (self.starts[i] for i in self._order))
+        self._sorted_ends = array('d', (self.ends[i] for i in self._order))
+        self._max_ends = array('d')
+        running_max = float('-inf')
+        for end in self._sorted_ends:
+            running_max = max(running_max, end)
+            self._max_ends.append(running_max)
+
+    def __len__(self):
+        return len(self.transcript)
+
+    def __getitem__(self, i):
+        return self.transcript[i]
+
+    def __iter__(self):
+        return iter(self.transcript)
+
+    def overlapping(self, start, end):
+        """
+        Returns the original indices (ascending) of entries that overlap [start, end].
+        """
+        # Entries before `lo` all end before `start`; entries from `hi` on start after `end`
+        lo = bisect_left(self._max_ends, start)
+        hi = bisect_right(self._sorted_starts, end)
+        matches = [self._order[j] for j in range(lo, hi) if self._sorted_ends[j] >= start]
+        matches.sort()
+        return matches
+
+    def starting_between(self, start, end):
+        """
+        Returns the original indices (ascending) of entries whose start is in [start, end).
+        """
+        lo = bisect_left(self._sorted_starts, start)
+        hi = bisect_left(self._sorted_starts, end)
+        matches = sorted(self._order[lo:hi])
+        return matches
+
+    def text_for_interval(self, start, end):
+        """
+        Same contract as get_transcript_text_for_interval.
+        Returns tuple: (combined_text, first_entry_index, last_entry_index)
+        """
+        matches = self.overlapping(start, end)
+        if not matches:
+            return '', None, None
+        return ' '.join(self.text(i) for i in matches), matches[0], matches[-1]
+
+    def text(self, i):
+        """
+        Text of entry i, without building the whole entry for a Transcript.
+        """
+        if isinstance(self.transcript, Transcript):
+            return self.transcript.text(i)
+        return self.transcript[i]['text']
+
+    def previous_start(self, idx):
+        """
+        Start time of the entry before `idx` (for expanding a clip backwards), or None.
+        """
+        if idx is None or idx <= 0:
+            return None
+        return self.starts[idx - 1]
+
+    def next_end(self, idx):
+        """
+        End time of the entry after `idx` (for expanding a clip forwards), or None.
+        """
+        if idx is None or idx >= len(self.transcript) - 1:
+            return None
+        return self.ends[idx + 1]
+
+
+def as_transcript_index(transcript):
+    """
+    Returns `transcript` as a TranscriptIndex, building one only if needed.
+    """
+    if isinstance(transcript, TranscriptIndex):
+        return transcript
+    return TranscriptIndex(transcript)
@@ -1,21 +1,100 @@
+import copy
 import glob
+import json
 import os
+import re
+import shutil
 import subprocess
+import tempfile
+import threading
 import uuid
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 import yt_dlp
+from yt_dlp.utils import DownloadCancelled, download_range_func
 from moviepy.editor import VideoFileClip, concatenate_videoclips, ColorClip
 
+from cache_utils import MEDIA_CACHE, MediaCache, make_cache_key
+from metrics_utils import bind_context, span, traced
+from profiling_utils import profiled
+
 # Buffer constants (in seconds) - used for clip extraction
 PRE_ROLL_BUFFER = 0.5   # Added before clip start to catch first syllable
 POST_ROLL_BUFFER = 2.0  # Added after clip end for punchline/reaction
 
+# yt-dlp format selection (part of the media cache key)
+VIDEO_FORMAT = 'bestvideo[ext=mp4]+bestaudio[ext=m4a]/best[ext=mp4]/best'
+
+# Range downloads: buffered clip ranges closer than this (seconds) share one segment
+RANGE_MERGE_GAP = 10.0
+SEGMENT_MANIFEST_SUFFIX = ".segments.json"
+
+# Preview rendering: number of FFmpeg processes run in parallel
+PREVIEW_WORKERS = max(1, min(4, (os.cpu_count() or 2) // 2))
+
+# Smart render: source codec -> encoder used for the partial GOPs at each cut edge
+SMART_RENDER_ENCODERS = {'h264': 'libx264', 'hevc': 'libx265'}
+SMART_RENDER_AUDIO_CODECS = ['aac']
+# ffprobe profile names -> encoder profiles. Re-encoded edges must carry an SPS the decoder
+# can switch to mid-stream, so sources with any other profile use the filter-graph render.
+SMART_RENDER_PROFILES = {
+    'h264': {
+        'Constrained Baseline': 'baseline',
+        'Baseline': 'baseline',
+        'Main': 'main',
+        'High': 'high',
+        'High 10': 'high10',
+        'High 4:2:2': 'high422',
+        'High 4:4:4 Predictive': 'high444',
+    },
+    'hevc': {
+        'Main': 'main',
+        'Main 10': 'main10',
+    },
+}
+
+# Filter-graph render (single FFmpeg pass, full re-encode): x264 preset/quality and threads
+# (0 = FFmpeg decides). Each clip input gets its own small decoder, so keep those lean.
+REEL_PRESET = os.getenv("REEL_PRESET", "veryfast")
+REEL_CRF = int(os.getenv("REEL_CRF", "18"))
+REEL_THREADS = int(os.getenv("REEL_THREADS", "0"))
+REEL_DECODER_THREADS = 2
+
+# Final-quality previews: fixed encoder settings so previews (and a matching slug) can be
+# joined with the concat demuxer without re-encoding
+FINAL_PREVIEW_VIDEO_ARGS = ['-c:v', 'libx264', '-preset', REEL_PRESET, '-crf', str(REEL_CRF),
+                            '-pix_fmt', 'yuv420p', '-profile:v', 'high', '-video_track_timescale', '90000']
+FINAL_PREVIEW_AUDIO_ARGS = ['-c:a', 'aac', '-b:a', '192k', '-ar', '48000', '-ac', '2']
+
+# Pre-encoded black slugs, reused by every reel with matching stream parameters
+# (set SLUG_CACHE_DISABLED=1 to encode a fresh slug per reel)
+SLUG_CACHE_DIR = os.getenv("SLUG_CACHE_DIR", ".slug_cache")
+SLUG_CACHE_MAX_BYTES = int(os.getenv("SLUG_CACHE_MAX_MB", "50")) * 1024 * 1024
+SLUG_CACHE = None if os.getenv("SLUG_CACHE_DISABLED") else MediaCache(SLUG_CACHE_DIR, max_bytes=SLUG_CACHE_MAX_BYTES)
+# Encoder -> codec_name ffprobe reports for its output (used to validate cached slugs)
+ENCODER_CODECS = {'libx264': 'h264', 'libx265': 'hevc'}
+
+# Keyframe indexes are built once per source file (keyed by path, size and mtime)
+_keyframe_index_cache = {}
+
+def extract_video_id(url):
+    """Extracts the video ID from a YouTube URL."""
+    regex = r"(?:v=|\/)([0-9A-Za-z_-]{11}).*"
+    match = re.search(regex, url)
+    if match:
+        return match.group(1)
+    return None
+
 def cleanup_old_files():
     """
     Removes old downloaded videos, gag reels, and preview clips to prevent clutter.
+    Media kept in the persistent MEDIA_CACHE lives in its own directory and is
+    bounded by the cache's own LRU eviction instead.
     """
     patterns = [
         "downloaded_video_*.mp4", 
+        "downloaded_video_*" + SEGMENT_MANIFEST_SUFFIX,
+        "downloaded_segment_*.mp4",
         "gag_reel_*.mp4", 
         "preview_clip_*.mp4",
         "*.part", 
@@ -31,85 +110,428 @@ def cleanup_old_files():
             except OSError:
                 pass  # Ignore if file is locked
 
-def download_video(url):
+def _file_bytes(path):
+    """
+    Size of a file in bytes, or 0 if it doesn't exist.
+    """
+    try:
+        return os.path.getsize(path)
+    except (OSError, TypeError):
+        return 0
+
+
+def _output_size(path):
+    # on_result hook for traced() renders
+    return {'bytes': _file_bytes(path), 'ok': bool(path)}
+
+
+def download_video(url, video_id=None, progress_callback=None, cancel_event=None):
     """
     Downloads a YouTube video using yt-dlp with a unique filename.
+    With a video_id, the download is kept in the persistent MEDIA_CACHE and
+    later calls for the same video return the cached file without touching yt-dlp.
+    progress_callback(downloaded_bytes, total_bytes): called as data arrives (total may be None)
+    cancel_event: threading.Event; setting it aborts the download and removes partial files
     """
+    cache_kind = f"full-{make_cache_key(VIDEO_FORMAT)[:12]}"
+    if MEDIA_CACHE is not None and video_id:
+        cached = MEDIA_CACHE.lookup(video_id, cache_kind)
+        if cached:
+            print(f"DEBUG: Video {video_id} served from media cache")
+            return cached
+    
     # Generate unique filename
     unique_id = uuid.uuid4().hex[:8]
-    output_path = f"downloaded_video_{unique_id}.mp4"
+    work_dir = MEDIA_CACHE.new_work_dir() if MEDIA_CACHE is not None and video_id else None
+    output_name = f"downloaded_video_{unique_id}.mp4"
+    output_path = os.path.join(work_dir, output_name) if work_dir else output_name
+    
+    def progress_hook(status):
+        # Raising from a hook is how yt-dlp downloads are aborted
+        if cancel_event is not None and cancel_event.is_set():
+            raise DownloadCancelled("Download cancelled")
+        if progress_callback and status.get('status') == 'downloading':
+            progress_callback(status.get('downloaded_bytes') or 0,
+                              status.get('total_bytes') or status.get('total_bytes_estimate'))
     
     ydl_opts = {
-        'format': 'bestvideo[ext=mp4]+bestaudio[ext=m4a]/best[ext=mp4]/best',
+        'format': VIDEO_FORMAT,
         'outtmpl': output_path,
         'quiet': True,
         'no_warnings': True,
         'merge_output_format': 'mp4',
+        'progress_hooks': [progress_hook],
     }
     
     # Clean up old files first
     cleanup_old_files()
         
     try:
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            ydl.download([url])
+        with span("download.full", url=url) as download_span:
+            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+                ydl.download([url])
+            download_span.set(bytes=_file_bytes(output_path))
+        if cancel_event is not None and cancel_event.is_set():
+            raise DownloadCancelled("Download cancelled")
+        if work_dir:
+            return MEDIA_CACHE.store(video_id, cache_kind, work_dir, output_name, {'url': url}) or None
         return output_path
     except Exception as e:
         print(f"Error downloading video: {e}")
+        if work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+        else:
+            # Partial/intermediate files (.part, per-format streams) share the unique name
+            for file in glob.glob(f"downloaded_video_{unique_id}*"):
+                try:
+                    os.remove(file)
+                except OSError:
+                    pass
+        return None
+
+
+class BackgroundDownload:
+    """
+    Runs download_video on a background thread so it overlaps with transcript analysis.
+    Poll progress()/done() from the UI thread; cancel() aborts it and cleans up.
+    """
+    def __init__(self, url, video_id=None):
+        self.url = url
+        self.video_id = video_id
+        self.path = None
+        self.downloaded_bytes = 0
+        self.total_bytes = None
+        self._cancel = threading.Event()
+        self._thread = threading.Thread(target=bind_context(self._run), daemon=True)
+        self._thread.start()
+
+    def _on_progress(self, downloaded, total):
+        self.downloaded_bytes = downloaded
+        self.total_bytes = total
+
+    def _run(self):
+        self.path = download_video(self.url, self.video_id, progress_callback=self._on_progress, cancel_event=self._cancel)
+
+    def done(self):
+        return not self._thread.is_alive()
+
+    def progress(self):
+        """
+        Returns the fraction downloaded (0-1), or None while the size is unknown.
+        """
+        if self.done():
+            return 1.0
+        if not self.total_bytes:
+            return None
+        return min(1.0, self.downloaded_bytes / self.total_bytes)
+
+    def result(self, timeout=None):
+        """
+        Waits for the download and returns its path (None on failure or cancel).
+        """
+        self._thread.join(timeout)
+        return self.path
+
+    def cancel(self):
+        """
+        Aborts the download (partial files are removed by download_video).
+        A download that already finished is left in place.
+        """
+        self._cancel.set()
+
+
+def merge_download_ranges(intervals, merge_gap=RANGE_MERGE_GAP):
+    """
+    Applies the pre/post-roll buffers to each interval and merges ranges that overlap
+    or are within merge_gap seconds of each other.
+    Returns a sorted list of (start, end) tuples.
+    """
+    buffered = sorted((max(0, start - PRE_ROLL_BUFFER), end + POST_ROLL_BUFFER) for start, end in intervals)
+    merged = []
+    for start, end in buffered:
+        if merged and start - merged[-1][1] <= merge_gap:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+SECTION_YDL_OPTS = {
+    'format': VIDEO_FORMAT,
+    'quiet': True,
+    'no_warnings': True,
+    'merge_output_format': 'mp4',
+}
+
+
+def extract_video_info(url):
+    """
+    Resolves the video's formats with yt-dlp (metadata only, nothing downloaded) -
+    what download_video_sections fetches its ranges from.
+    Returns yt-dlp's info dict, or None on failure.
+    """
+    try:
+        with span("download.info", url=url):
+            with yt_dlp.YoutubeDL(SECTION_YDL_OPTS) as ydl:
+                return ydl.extract_info(url, download=False)
+    except Exception as e:
+        print(f"Error extracting video info: {e}")
+        return None
+
+
+def prefetch_video_info(url):
+    """
+    Starts extract_video_info on a background thread, so the format lookup overlaps
+    with transcript analysis when only clip ranges are downloaded.
+    Returns a Future (its result is None on failure).
+    """
+    executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="video-info")
+    future = executor.submit(bind_context(extract_video_info), url)
+    executor.shutdown(wait=False)
+    return future
+
+
+def download_video_sections(url, intervals, merge_gap=RANGE_MERGE_GAP, video_id=None, info=None):
+    """
+    Downloads only the (buffered, merged) time ranges needed for the given intervals
+    instead of the whole video. Each range lands in its own segment file, cut
+    frame-accurately so segment time 0 is exactly the range start.
+    With a video_id, segments are kept in the persistent MEDIA_CACHE (keyed by the
+    exact ranges), so re-fetching the same clips skips yt-dlp entirely.
+    info: yt-dlp info dict from extract_video_info (looked up here if not given)
+    Returns the path of a segment manifest (usable anywhere a video path is), or None.
+    """
+    ranges = merge_download_ranges(intervals, merge_gap)
+    if not ranges:
+        return None
+    
+    cache_kind = f"sections-{make_cache_key(VIDEO_FORMAT, ranges)[:12]}"
+    if MEDIA_CACHE is not None and video_id:
+        cached = MEDIA_CACHE.lookup(video_id, cache_kind)
+        if cached:
+            print(f"DEBUG: Segments for {video_id} served from media cache")
+            return cached
+    
+    # Extract once, then download each range from the same format URLs
+    if info is None:
+        info = extract_video_info(url)
+        if info is None:
+            return None
+    
+    unique_id = uuid.uuid4().hex[:8]
+    work_dir = MEDIA_CACHE.new_work_dir() if MEDIA_CACHE is not None and video_id else None
+    manifest_name = f"downloaded_video_{unique_id}{SEGMENT_MANIFEST_SUFFIX}"
+    
+    # Clean up old files first
+    cleanup_old_files()
+    
+    segments = []
+    try:
+        duration = info.get('duration')
+        
+        for n, (start, end) in enumerate(ranges):
+            if duration:
+                end = min(end, duration)
+            # Segment paths are stored relative to the manifest
+            segment_name = f"downloaded_segment_{unique_id}_{n}.mp4"
+            ydl_opts = dict(SECTION_YDL_OPTS, **{
+                'outtmpl': os.path.join(work_dir, segment_name) if work_dir else segment_name,
+                'download_ranges': download_range_func(None, [(start, end)]),
+                'force_keyframes_at_cuts': True,
+            })
+            segment_path = ydl_opts['outtmpl']
+            with span("download.segment", url=url, range_seconds=round(end - start, 3)) as download_span:
+                with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+                    ydl.process_ie_result(copy.deepcopy(info), download=True)
+                download_span.set(bytes=_file_bytes(segment_path))
+            
+            if not os.path.exists(segment_path) or os.path.getsize(segment_path) == 0:
+                raise RuntimeError(f"Segment {n} ({start:.1f}s - {end:.1f}s) was not created")
+            segments.append({'path': segment_name, 'start': start, 'end': end})
+        
+        manifest = {'url': url, 'duration': duration, 'segments': segments}
+        with open(os.path.join(work_dir, manifest_name) if work_dir else manifest_name, "w") as f:
+            json.dump(manifest, f, indent=2)
+        
+        total = sum(seg['end'] - seg['start'] for seg in segments)
+        print(f"Downloaded {len(segments)} segment(s) covering {total:.1f}s" + (f" of {duration:.0f}s" if duration else ""))
+        if work_dir:
+            return MEDIA_CACHE.store(video_id, cache_kind, work_dir, manifest_name, {'url': url}) or None
+        return manifest_name
+        
+    except Exception as e:
+        print(f"Error downloading video sections: {e}")
+        if work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+        for segment in segments:
+            try:
+                os.remove(segment['path'])
+            except OSError:
+                pass
+        return None
+
+
+def audio_stream_url(url):
+    """
+    Direct URL of the best audio-only format (and the HTTP headers it needs), so FFmpeg
+    can read the audio track without downloading the video.
+    Returns (stream_url, headers).
+    """
+    with yt_dlp.YoutubeDL({'format': 'bestaudio/best', 'quiet': True, 'no_warnings': True}) as ydl:
+        info = ydl.extract_info(url, download=False)
+    return info['url'], info.get('http_headers') or {}
+
+
+def load_segment_manifest(video_path):
+    """
+    Returns the parsed manifest if video_path is a segment manifest, otherwise None.
+    """
+    if not video_path or not video_path.endswith(SEGMENT_MANIFEST_SUFFIX):
+        return None
+    try:
+        with open(video_path) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"Error reading segment manifest {video_path}: {e}")
         return None
+    
+    # Segment paths are relative to the manifest (so cached manifests can move)
+    base_dir = os.path.dirname(video_path)
+    for segment in manifest['segments']:
+        segment['path'] = os.path.join(base_dir, segment['path'])
+    return manifest
+
 
-def create_gag_reel(video_path, intervals, slug_duration=2.0):
+def _find_segment(manifest, start, end):
+    """
+    Returns the segment that best covers [start, end] (largest overlap), or None.
+    """
+    best = None
+    best_overlap = 0
+    for segment in manifest['segments']:
+        overlap = min(end, segment['end']) - max(start, segment['start'])
+        if overlap > best_overlap:
+            best, best_overlap = segment, overlap
+    return best
+
+
+def resolve_video_source(video_path, start, end):
+    """
+    Maps a clip on the source timeline to the local file that holds it.
+    For a plain video file this is a no-op; for a segment manifest it returns the
+    segment path and the clip times relative to that segment.
+    Returns (path, start, end), or (None, start, end) if no segment covers the clip.
+    """
+    manifest = load_segment_manifest(video_path)
+    if manifest is None:
+        return video_path, start, end
+    
+    segment = _find_segment(manifest, max(0, start - PRE_ROLL_BUFFER), end + POST_ROLL_BUFFER)
+    if segment is None:
+        return None, start, end
+    return segment['path'], start - segment['start'], end - segment['start']
+
+
+def source_covers(video_path, intervals):
+    """
+    True if every interval can be cut from video_path (always true for a plain file).
+    """
+    manifest = load_segment_manifest(video_path)
+    if manifest is None:
+        return bool(video_path) and os.path.exists(video_path)
+    duration = manifest.get('duration') or float('inf')
+    for start, end in intervals:
+        # The cut includes the pre/post-roll buffers (the post-roll stops at the end of the source)
+        start, end = max(0, start - PRE_ROLL_BUFFER), min(end + POST_ROLL_BUFFER, duration)
+        segment = _find_segment(manifest, start, end)
+        if segment is None or segment['start'] > start + 0.01 or segment['end'] < end - 0.01:
+            return False
+        if not os.path.exists(segment['path']):
+            return False
+    return True
+
+
+@profiled("create_gag_reel")
+def create_gag_reel(video_path, intervals, slug_duration=2.0, engine="smart"):
     """
     Cuts the video at the specified intervals and stitches them together.
     Adds a black slug between each clip for easier editing.
     intervals: list of tuples (start, end)
     slug_duration: duration of black slug in seconds
+    engine: "smart" (stream copy + edge re-encode), "filtergraph" (one native FFmpeg
+            re-encode) or "moviepy". Smart falls back to filtergraph, which falls back to MoviePy.
+    """
+    with span("render.reel", engine=engine, clips=len(intervals)) as reel_span:
+        if engine == "smart":
+            output_path = create_gag_reel_smart(video_path, intervals, slug_duration)
+            if output_path:
+                reel_span.set(engine_used="smart", **_output_size(output_path))
+                return output_path
+            print("Smart render unavailable for this source, falling back to the filter-graph render...")
+            engine = "filtergraph"
+        
+        if engine == "filtergraph":
+            output_path = create_gag_reel_filtergraph(video_path, intervals, slug_duration)
+            if output_path:
+                reel_span.set(engine_used="filtergraph", **_output_size(output_path))
+                return output_path
+            print("Filter-graph render failed, falling back to MoviePy...")
+        
+        output_path = create_gag_reel_moviepy(video_path, intervals, slug_duration)
+        reel_span.set(engine_used="moviepy", **_output_size(output_path))
+        return output_path
+
+@traced("moviepy.reel", on_result=_output_size)
+def create_gag_reel_moviepy(video_path, intervals, slug_duration=2.0):
+    """
+    Fallback: Cuts and stitches the reel with MoviePy (decodes and re-encodes every frame).
+    intervals: list of tuples (start, end)
+    slug_duration: duration of black slug in seconds
     """
     # Generate unique output filename
     unique_id = uuid.uuid4().hex[:8]
     output_path = f"gag_reel_{unique_id}.mp4"
     
-    original_clip = None
+    sources = {}  # path -> VideoFileClip (one per segment for range downloads)
     final_clip = None
     
+    def open_source(path):
+        if path not in sources:
+            sources[path] = VideoFileClip(path)
+        return sources[path]
+    
     try:
-        # Load the original video
-        original_clip = VideoFileClip(video_path)
+        # Load the original video (or plan against the downloaded segments)
+        manifest = load_segment_manifest(video_path)
+        if manifest is None:
+            plan = plan_reel_sources(video_path, intervals, open_source(video_path).duration)
+        else:
+            plan = plan_reel_sources(video_path, intervals)
+        
+        if not plan:
+            print("No valid clips were created.")
+            return None
         
         # Get video properties for the black slug
-        video_size = original_clip.size
-        video_fps = original_clip.fps
+        first_clip = open_source(plan[0][0])
+        video_size = first_clip.size
+        video_fps = first_clip.fps
         
         # Create a black slug clip
         black_slug = ColorClip(size=video_size, color=(0, 0, 0), duration=slug_duration)
         black_slug = black_slug.set_fps(video_fps)
         
         clips_with_slugs = []
-        for i, (start, end) in enumerate(intervals):
-            # Ensure start/end are within bounds and valid
-            if start < 0: start = 0
-            
-            # Add buffers for context
-            start = max(0, start - PRE_ROLL_BUFFER)
-            end = end + POST_ROLL_BUFFER
-            
-            if end > original_clip.duration: end = original_clip.duration
-            if start >= end: continue
+        for item in plan:
+            if item is None:
+                clips_with_slugs.append(black_slug)
+                continue
             
             # Create subclip
-            clip = original_clip.subclip(start, end)
+            path, start, end = item
+            clip = open_source(path).subclip(start, end)
             clips_with_slugs.append(clip)
             
-            # Add a black slug after each clip (except the last one)
-            if i < len(intervals) - 1:
-                clips_with_slugs.append(black_slug)
-            
-        if not clips_with_slugs:
-            print("No valid clips were created.")
-            if original_clip:
-                original_clip.close()
-            return None
-            
         # Concatenate clips with slugs
         final_clip = concatenate_videoclips(clips_with_slugs)
         
@@ -124,9 +546,9 @@ def create_gag_reel(video_path, intervals, slug_duration=2.0):
         return None
     finally:
         # Ensure clips are closed to release file handles
-        if original_clip:
+        for source in sources.values():
             try:
-                original_clip.close()
+                source.close()
             except:
                 pass
         if final_clip:
@@ -135,16 +557,584 @@ def create_gag_reel(video_path, intervals, slug_duration=2.0):
             except:
                 pass
 
-def create_single_clip(video_path, start, end, index):
+def probe_video(video_path):
+    """
+    Uses ffprobe to read the stream parameters of a video file.
+    Returns a dict with duration, video and audio stream info, or None on failure.
+    """
+    cmd = [
+        'ffprobe',
+        '-v', 'error',
+        '-show_entries', 'format=duration,start_time:stream=index,codec_type,codec_name,profile,level,field_order,color_range,color_space,color_transfer,color_primaries,width,height,pix_fmt,sample_aspect_ratio,r_frame_rate,time_base,sample_rate,channels',
+        '-of', 'json',
+        video_path
+    ]
+
+    try:
+        result = subprocess.run(cmd, capture_output=True, text=True, timeout=60)
+        if result.returncode != 0:
+            print(f"FFprobe error: {result.stderr}")
+            return None
+
+        data = json.loads(result.stdout)
+        info = {
+            'duration': float(data.get('format', {}).get('duration', 0) or 0),
+            'start_time': float(data.get('format', {}).get('start_time', 0) or 0),
+            'video': None,
+            'audio': None,
+        }
+        for stream in data.get('streams', []):
+            codec_type = stream.get('codec_type')
+            if codec_type in ('video', 'audio') and info[codec_type] is None:
+                info[codec_type] = stream
+
+        if info['video']:
+            # r_frame_rate is a fraction like "30000/1001"
+            num, _, den = info['video'].get('r_frame_rate', '0/1').partition('/')
+            info['fps'] = float(num) / float(den or 1) if float(den or 1) else 0.0
+        return info
+
+    except FileNotFoundError:
+        print("FFprobe not found. Please install FFmpeg and add it to PATH.")
+        return None
+    except Exception as e:
+        print(f"Error probing video: {e}")
+        return None
+
+
+def build_keyframe_index(video_path):
+    """
+    Returns the sorted keyframe timestamps (seconds) of the first video stream.
+    Reads packet flags only (no decoding), so it is fast even for hour-long sources.
+    The index is built once per file and cached for later cuts.
+    """
+    try:
+        stat = os.stat(video_path)
+    except OSError:
+        return None
+    cache_key = (os.path.abspath(video_path), stat.st_size, stat.st_mtime)
+    if cache_key in _keyframe_index_cache:
+        return _keyframe_index_cache[cache_key]
+
+    cmd = [
+        'ffprobe',
+        '-v', 'error',
+        '-select_streams', 'v:0',
+        '-show_entries', 'packet=pts_time,flags',
+        '-of', 'csv=p=0',
+        video_path
+    ]
+
+    try:
+        with span("ffmpeg.keyframes"):
+            result = subprocess.run(cmd, capture_output=True, text=True, timeout=600)
+        if result.returncode != 0:
+            print(f"FFprobe error building keyframe index: {result.stderr}")
+            return None
+
+        keyframes = []
+        for line in result.stdout.splitlines():
+            pts_time, _, flags = line.partition(',')
+            if 'K' in flags and pts_time not in ('', 'N/A'):
+                keyframes.append(float(pts_time))
+        keyframes.sort()
+
+        _keyframe_index_cache[cache_key] = keyframes
+        return keyframes
+
+    except FileNotFoundError:
+        print("FFprobe not found. Please install FFmpeg and add it to PATH.")
+        return None
+    except Exception as e:
+        print(f"Error building keyframe index: {e}")
+        return None
+
+
+def plan_reel(intervals, source_duration):
+    """
+    Applies the pre/post-roll buffers and bounds checks used by every reel renderer.
+    Returns a list of (start, end) tuples, with None marking a black slug.
+    """
+    plan = []
+    for i, (start, end) in enumerate(intervals):
+        # Ensure start/end are within bounds and valid
+        if start < 0: start = 0
+
+        # Add buffers for context
+        start = max(0, start - PRE_ROLL_BUFFER)
+        end = end + POST_ROLL_BUFFER
+
+        if end > source_duration: end = source_duration
+        if start >= end: continue
+
+        plan.append((start, end))
+
+        # Add a black slug after each clip (except the last one)
+        if i < len(intervals) - 1:
+            plan.append(None)
+
+    return plan
+
+
+def plan_reel_sources(video_path, intervals, source_duration=None):
+    """
+    Like plan_reel, but every clip also names the file it is cut from: (path, start, end),
+    with None marking a black slug. Handles segment manifests from download_video_sections
+    (source_duration is only needed for plain files).
+    """
+    manifest = load_segment_manifest(video_path)
+    if manifest is None:
+        return [None if item is None else (video_path, item[0], item[1]) for item in plan_reel(intervals, source_duration)]
+    
+    plan = []
+    for item in plan_reel(intervals, manifest.get('duration') or float('inf')):
+        if item is None:
+            if plan and plan[-1] is not None:
+                plan.append(None)
+            continue
+        start, end = item
+        segment = _find_segment(manifest, start, end)
+        if segment is None:
+            print(f"Clip {start:.1f}s - {end:.1f}s was not downloaded, skipping")
+            continue
+        # Clamp to what the segment actually holds
+        local_start = max(0, start - segment['start'])
+        local_end = min(end, segment['end']) - segment['start']
+        if local_start < local_end:
+            plan.append((segment['path'], local_start, local_end))
+    
+    # No slug after the last clip
+    while plan and plan[-1] is None:
+        plan.pop()
+    return plan
+
+
+def plan_smart_cut(start, end, keyframes, min_piece=0.0):
+    """
+    Splits [start, end] into GOP-aligned pieces for smart rendering.
+    Returns a list of (mode, piece_start, piece_end) where mode is "copy" for whole
+    GOPs that can be stream-copied and "encode" for the partial GOPs at each edge.
+    """
+    inner = [k for k in keyframes if start <= k <= end]
+    if len(inner) < 2:
+        # No complete GOP inside the cut - re-encode the whole thing
+        return [("encode", start, end)]
+
+    first_key = inner[0]
+    last_key = inner[-1]
+    pieces = []
+    if first_key - start > min_piece:
+        pieces.append(("encode", start, first_key))
+    pieces.append(("copy", first_key, last_key))
+    if end - last_key > min_piece:
+        pieces.append(("encode", last_key, end))
+    return pieces
+
+
+def _run_ffmpeg(cmd, timeout=600):
+    """
+    Runs an FFmpeg command, printing stderr on failure. Returns True on success.
+    """
+    with span("ffmpeg.run", output=os.path.basename(cmd[-1])) as ffmpeg_span:
+        result = subprocess.run(cmd, capture_output=True, text=True, timeout=timeout)
+        ffmpeg_span.set(returncode=result.returncode)
+    if result.returncode != 0:
+        print(f"FFmpeg error: {result.stderr}")
+        return False
+    return True
+
+
+def _edge_level(video):
+    """
+    Converts ffprobe's numeric level into the encoder's level string, or None if unknown.
+    H.264 reports level_idc (40 = 4.0, 9 = 1b); HEVC reports 30x the level (123 = 4.1).
+    """
+    level = int(video.get('level') or 0)
+    if level <= 0:
+        return None
+    if video['codec_name'] == 'hevc':
+        return f"{level / 30:.1f}"
+    if level == 9:
+        return "1b"
+    return f"{level / 10:.1f}"
+
+
+def _edge_encode_args(info):
+    """
+    Builds encoder arguments that match the source streams, so re-encoded edges
+    can be concatenated with stream-copied GOPs without a full transcode.
+    Profile, level, pixel format and colour signalling all end up in the SPS/VUI, so
+    they're copied from the probe. Returns None if the source's SPS can't be matched
+    (unknown profile or level, interlaced video) - the caller falls back to a full re-encode.
+    """
+    video = info['video']
+    audio = info['audio']
+    profile = SMART_RENDER_PROFILES[video['codec_name']].get(video.get('profile'))
+    level = _edge_level(video)
+    if not profile or not level:
+        print(f"Smart render: can't match profile {video.get('profile')!r} level {video.get('level')!r}")
+        return None
+    if video.get('field_order') not in (None, 'unknown', 'progressive'):
+        print(f"Smart render: interlaced source ({video.get('field_order')})")
+        return None
+
+    args = [
+        '-c:v', SMART_RENDER_ENCODERS[video['codec_name']],
+        '-preset', 'fast',
+        '-crf', '18',
+        '-pix_fmt', video.get('pix_fmt', 'yuv420p'),
+        '-r', video.get('r_frame_rate', '30'),
+        '-profile:v', profile,
+    ]
+    if video['codec_name'] == 'h264':
+        # Same level_idc, and no HRD parameters in the VUI that the source SPS doesn't have
+        args += ['-level', level, '-x264-params', 'nal-hrd=none']
+    else:
+        args += ['-x265-params', f'level-idc={level}:log-level=error']
+    for option, key in (('-color_range', 'color_range'), ('-colorspace', 'color_space'),
+                        ('-color_trc', 'color_transfer'), ('-color_primaries', 'color_primaries')):
+        if video.get(key) and video[key] != 'unknown':
+            args += [option, video[key]]
+    if audio:
+        args += [
+            '-c:a', 'aac',
+            '-ar', str(audio.get('sample_rate', 44100)),
+            '-ac', str(audio.get('channels', 2)),
+        ]
+    return args
+
+
+def _slug_params(video, audio, slug_duration, encode_args, container):
+    """
+    Everything that determines a slug's bytes - its cache key.
+    """
+    return {
+        'width': video['width'],
+        'height': video['height'],
+        'fps': video.get('r_frame_rate', '30'),
+        'pix_fmt': video.get('pix_fmt', 'yuv420p'),
+        'profile': video.get('profile'),
+        'sample_rate': audio.get('sample_rate', 44100) if audio else None,
+        'channels': audio.get('channels', 2) if audio else None,
+        'duration': float(slug_duration),
+        'encode_args': list(encode_args),
+        'container': container,
+    }
+
+
+def _slug_is_valid(path, params):
+    """
+    ffprobe check that a cached slug really has the expected streams and length.
+    """
+    info = probe_video(path)
+    if not info or not info['video']:
+        return False
+    video = info['video']
+    args = params['encode_args']
+    encoder = args[args.index('-c:v') + 1] if '-c:v' in args else None
+    if ENCODER_CODECS.get(encoder, encoder) != video.get('codec_name'):
+        return False
+    if (video.get('width'), video.get('height')) != (params['width'], params['height']):
+        return False
+    if params['sample_rate'] is not None:
+        audio = info['audio']
+        if not audio or str(audio.get('sample_rate')) != str(params['sample_rate']) or audio.get('channels') != params['channels']:
+            return False
+    return abs(info['duration'] - params['duration']) <= 0.25
+
+
+def get_black_slug(video, audio, slug_duration, encode_args, container="mpegts", work_dir=None):
+    """
+    Returns (path, lease) of a black slug (plus silence if `audio`) encoded with
+    encode_args to match the given probe_video stream dicts. Slugs are generated once
+    and served from SLUG_CACHE afterwards (validated with ffprobe on every load).
+    Pass the lease to SLUG_CACHE.release() once the slug has been used.
+    Without a cache the slug is encoded into work_dir. Returns (None, None) on failure.
+    """
+    params = _slug_params(video, audio, slug_duration, encode_args, container)
+    key = make_cache_key('black-slug', params)[:24]
+    
+    if SLUG_CACHE is not None:
+        cached = SLUG_CACHE.lookup("slugs", key)
+        if cached:
+            lease = SLUG_CACHE.acquire(cached)
+            if _slug_is_valid(cached, params):
+                return cached, lease
+            print(f"DEBUG: Cached slug {cached} failed validation, re-encoding")
+            SLUG_CACHE.release(lease)
+            SLUG_CACHE.discard("slugs", key)
+    
+    target_dir = SLUG_CACHE.new_work_dir() if SLUG_CACHE is not None else work_dir or tempfile.mkdtemp(prefix="slug_")
+    slug_name = "slug.ts" if container == "mpegts" else "slug.mp4"
+    slug_path = os.path.join(target_dir, slug_name)
+    cmd = [
+        'ffmpeg', '-y',
+        '-f', 'lavfi', '-i', f"color=c=black:s={params['width']}x{params['height']}:r={params['fps']}:d={slug_duration}",
+    ]
+    if audio:
+        cmd += ['-f', 'lavfi', '-i', f"anullsrc=r={params['sample_rate']}:cl={'mono' if params['channels'] == 1 else 'stereo'}"]
+    cmd += ['-t', str(slug_duration)] + list(encode_args) + ['-f', container, '-loglevel', 'error', slug_path]
+    if not _run_ffmpeg(cmd):
+        if SLUG_CACHE is not None:
+            shutil.rmtree(target_dir, ignore_errors=True)
+        return None, None
+    
+    if SLUG_CACHE is None:
+        return slug_path, None
+    cached = SLUG_CACHE.store("slugs", key, target_dir, slug_name, {'params': params})
+    if not cached:
+        return None, None
+    return cached, SLUG_CACHE.acquire(cached)
+
+
+def create_gag_reel_smart(video_path, intervals, slug_duration=2.0):
+    """
+    Builds the reel by stream-copying every whole GOP inside each buffered interval
+    and re-encoding only the partial GOPs at the cut edges ("smart render").
+    Pieces are written as MPEG-TS and joined with the concat demuxer (no full transcode).
+    Returns the output path, or None if the source can't be smart-rendered.
+    """
+    manifest = load_segment_manifest(video_path)
+    first_path = manifest['segments'][0]['path'] if manifest and manifest['segments'] else video_path
+    
+    info = probe_video(first_path)
+    if not info or not info['video'] or not info['duration']:
+        return None
+    if info['video'].get('codec_name') not in SMART_RENDER_ENCODERS:
+        print(f"Smart render: unsupported video codec {info['video'].get('codec_name')}")
+        return None
+    if info['audio'] and info['audio'].get('codec_name') not in SMART_RENDER_AUDIO_CODECS:
+        print(f"Smart render: unsupported audio codec {info['audio'].get('codec_name')}")
+        return None
+    encode_args = _edge_encode_args(info)
+    if encode_args is None:
+        return None
+
+    plan = plan_reel_sources(video_path, intervals, info['duration'])
+    if not plan:
+        print("No valid clips were created.")
+        return None
+
+    unique_id = uuid.uuid4().hex[:8]
+    output_path = f"gag_reel_{unique_id}.mp4"
+    work_dir = tempfile.mkdtemp(prefix=f"smart_render_{unique_id}_")
+
+    frame_duration = 1.0 / info['fps'] if info.get('fps') else 0.0
+    video = info['video']
+
+    keyframe_indexes = {}
+    
+    def keyframes_for(path):
+        if path not in keyframe_indexes:
+            path_info = info if path == first_path else probe_video(path)
+            keyframes = build_keyframe_index(path)
+            if not path_info or not keyframes:
+                raise RuntimeError(f"Could not index keyframes of {path}")
+            # Packet timestamps are absolute; -ss seeks relative to the container start time
+            keyframe_indexes[path] = [k - path_info['start_time'] for k in keyframes]
+        return keyframe_indexes[path]
+
+    slug_lease = None
+    try:
+        pieces = []
+        slug_path = None
+
+        for item in plan:
+            if item is None:
+                # Black slug with the same stream parameters (pre-encoded, shared across reels)
+                if slug_path is None:
+                    slug_path, slug_lease = get_black_slug(video, info['audio'], slug_duration, encode_args, "mpegts", work_dir)
+                    if slug_path is None:
+                        return None
+                pieces.append(slug_path)
+                continue
+
+            source_path, start, end = item
+            for mode, piece_start, piece_end in plan_smart_cut(start, end, keyframes_for(source_path), frame_duration):
+                piece_path = os.path.join(work_dir, f"piece_{len(pieces):04d}.ts")
+                cmd = [
+                    'ffmpeg', '-y',
+                    '-ss', str(piece_start),
+                    '-i', source_path,
+                    '-t', str(piece_end - piece_start),
+                    '-map', '0:v:0',
+                ]
+                if info['audio']:
+                    cmd += ['-map', '0:a:0']
+                if mode == "copy":
+                    cmd += ['-c', 'copy', '-avoid_negative_ts', 'make_zero']
+                    if video['codec_name'] == 'h264':
+                        cmd += ['-bsf:v', 'h264_mp4toannexb']
+                    elif video['codec_name'] == 'hevc':
+                        cmd += ['-bsf:v', 'hevc_mp4toannexb']
+                else:
+                    cmd += encode_args
+                cmd += ['-f', 'mpegts', '-loglevel', 'error', piece_path]
+
+                if not _run_ffmpeg(cmd):
+                    return None
+                pieces.append(piece_path)
+
+        # Join everything with the concat demuxer - no re-encode
+        list_path = os.path.join(work_dir, "concat.txt")
+        with open(list_path, "w") as f:
+            for piece in pieces:
+                f.write(f"file '{os.path.abspath(piece)}'\n")
+
+        cmd = [
+            'ffmpeg', '-y',
+            '-f', 'concat', '-safe', '0',
+            '-i', list_path,
+            '-c', 'copy',
+        ]
+        if info['audio']:
+            cmd += ['-bsf:a', 'aac_adtstoasc']
+        cmd += ['-movflags', '+faststart', '-loglevel', 'error', output_path]
+        if not _run_ffmpeg(cmd):
+            if os.path.exists(output_path):
+                os.remove(output_path)
+            return None
+
+        if os.path.exists(output_path) and os.path.getsize(output_path) > 0:
+            return output_path
+        return None
+
+    except FileNotFoundError:
+        print("FFmpeg not found. Please install FFmpeg and add it to PATH.")
+        return None
+    except Exception as e:
+        print(f"Error creating gag reel (smart render): {e}")
+        return None
+    finally:
+        if SLUG_CACHE is not None:
+            SLUG_CACHE.release(slug_lease)
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+def build_reel_filtergraph(plan, info, slug_duration):
+    """
+    Builds the filter_complex for a reel plan (see plan_reel_sources). Clip k is read
+    from input k (already seeked to its start); each is trimmed to its exact length,
+    each slug is generated black video + silence, and everything is joined by concat.
+    Returns (filter_complex, has_audio).
+    """
+    video = info['video']
+    audio = info['audio']
+    rate = video.get('r_frame_rate', '30')
+    pix_fmt = video.get('pix_fmt', 'yuv420p')
+    sar = (video.get('sample_aspect_ratio') or '1:1').replace(':', '/')
+    if sar in ('0/1', 'N/A'):
+        sar = '1/1'
+    if audio:
+        sample_rate = audio.get('sample_rate', 44100)
+        layout = 'mono' if audio.get('channels') == 1 else 'stereo'
+        audio_format = f"aformat=sample_fmts=fltp:sample_rates={sample_rate}:channel_layouts={layout}"
+
+    chains = []
+    labels = []
+    clip_input = 0
+    for n, item in enumerate(plan):
+        if item is None:
+            chains.append(f"color=c=black:s={video['width']}x{video['height']}:r={rate}:d={slug_duration},"
+                          f"format={pix_fmt},setsar={sar}[v{n}]")
+            if audio:
+                chains.append(f"anullsrc=r={sample_rate}:cl={layout},atrim=duration={slug_duration},{audio_format}[a{n}]")
+        else:
+            _, start, end = item
+            duration = end - start
+            chains.append(f"[{clip_input}:v:0]trim=duration={duration},setpts=PTS-STARTPTS,"
+                          f"format={pix_fmt},setsar={sar}[v{n}]")
+            if audio:
+                chains.append(f"[{clip_input}:a:0]atrim=duration={duration},asetpts=PTS-STARTPTS,{audio_format}[a{n}]")
+            clip_input += 1
+        labels.append(f"[v{n}][a{n}]" if audio else f"[v{n}]")
+
+    chains.append(f"{''.join(labels)}concat=n={len(plan)}:v=1:a={1 if audio else 0}[outv]" + ("[outa]" if audio else ""))
+    return ";".join(chains), bool(audio)
+
+
+def create_gag_reel_filtergraph(video_path, intervals, slug_duration=2.0, preset=None, threads=None, crf=None):
+    """
+    Builds the reel with a single FFmpeg invocation: one input per clip (input-seeked to
+    the buffered clip start), trim/atrim to the exact length, black slugs generated in the
+    graph and all parts joined with the concat filter. Decoding, compositing and encoding
+    stay in native code (no frames pass through Python).
+    preset/threads/crf: x264 settings (default REEL_PRESET, REEL_THREADS, REEL_CRF)
+    Returns the output path, or None on failure.
+    """
+    preset = preset or REEL_PRESET
+    threads = REEL_THREADS if threads is None else threads
+    crf = REEL_CRF if crf is None else crf
+
+    manifest = load_segment_manifest(video_path)
+    first_path = manifest['segments'][0]['path'] if manifest and manifest['segments'] else video_path
+    info = probe_video(first_path)
+    if not info or not info['video'] or not info['duration']:
+        return None
+
+    plan = plan_reel_sources(video_path, intervals, info['duration'])
+    if not plan:
+        print("No valid clips were created.")
+        return None
+
+    unique_id = uuid.uuid4().hex[:8]
+    output_path = f"gag_reel_{unique_id}.mp4"
+    filter_complex, has_audio = build_reel_filtergraph(plan, info, slug_duration)
+
+    cmd = ['ffmpeg', '-y']
+    for item in plan:
+        if item is None:
+            continue
+        source_path, start, end = item
+        # Input seeking: only the clip's own GOPs are decoded
+        cmd += ['-threads', str(REEL_DECODER_THREADS), '-ss', str(start), '-t', str(end - start), '-i', source_path]
+    cmd += ['-filter_complex', filter_complex, '-map', '[outv]']
+    if has_audio:
+        cmd += ['-map', '[outa]', '-c:a', 'aac', '-b:a', '192k']
+    cmd += [
+        '-c:v', 'libx264', '-preset', preset, '-crf', str(crf), '-pix_fmt', info['video'].get('pix_fmt', 'yuv420p'),
+        '-threads', str(threads),
+        '-movflags', '+faststart',
+        '-loglevel', 'error',
+        output_path,
+    ]
+
+    try:
+        if not _run_ffmpeg(cmd, timeout=3600):
+            if os.path.exists(output_path):
+                os.remove(output_path)
+            return None
+        if os.path.exists(output_path) and os.path.getsize(output_path) > 0:
+            return output_path
+        return None
+    except FileNotFoundError:
+        print("FFmpeg not found. Please install FFmpeg and add it to PATH.")
+        return None
+    except Exception as e:
+        print(f"Error creating gag reel (filter graph): {e}")
+        if os.path.exists(output_path):
+            os.remove(output_path)
+        return None
+
+@traced("render.preview", on_result=_output_size)
+def create_single_clip(video_path, start, end, index, threads=None, quality="preview"):
     """
     Creates a single clip from the video for preview purposes using FFmpeg.
     This is much faster than MoviePy for long videos as it seeks directly.
+    threads: optional cap on FFmpeg threads (used when rendering previews in parallel)
+    quality: "preview" (fast, low quality) or "final" (reel quality with fixed parameters,
+             so stitch_preview_clips can join the previews without re-encoding)
     Returns the path to the preview clip.
     """
     
     unique_id = uuid.uuid4().hex[:8]
     output_path = f"preview_clip_{index}_{unique_id}.mp4"
     
+    # Range downloads: cut from the segment holding this clip
+    video_path, start, end = resolve_video_source(video_path, start, end)
+    if video_path is None:
+        print(f"Preview clip {index} is not covered by the downloaded segments")
+        return None
+    
     try:
         # Add buffers for context
         start = max(0, start - PRE_ROLL_BUFFER)
@@ -162,17 +1152,29 @@ def create_single_clip(video_path, start, end, index):
             '-ss', str(start),  # Seek to start (before -i for fast seek)
             '-i', video_path,
             '-t', str(duration),  # Duration of clip
-            '-c:v', 'libx264',
-            '-preset', 'ultrafast',
-            '-crf', '28',  # Lower quality for faster preview
-            '-c:a', 'aac',
-            '-b:a', '128k',
+        ]
+        if quality == "final":
+            cmd += FINAL_PREVIEW_VIDEO_ARGS + FINAL_PREVIEW_AUDIO_ARGS
+        else:
+            cmd += [
+                '-c:v', 'libx264',
+                '-preset', 'ultrafast',
+                '-crf', '28',  # Lower quality for faster preview
+                '-c:a', 'aac',
+                '-b:a', '128k',
+            ]
+        cmd += [
             '-movflags', '+faststart',
             '-loglevel', 'error',
-            output_path
         ]
+        if threads:
+            # Limit encoder/filter threads so parallel previews don't oversubscribe the CPU
+            cmd += ['-threads', str(threads), '-filter_threads', str(threads)]
+        cmd.append(output_path)
         
-        result = subprocess.run(cmd, capture_output=True, text=True, timeout=120)
+        with span("ffmpeg.run", output=output_path) as ffmpeg_span:
+            result = subprocess.run(cmd, capture_output=True, text=True, timeout=120)
+            ffmpeg_span.set(returncode=result.returncode)
         
         if result.returncode != 0:
             print(f"FFmpeg error for clip {index}: {result.stderr}")
@@ -196,6 +1198,138 @@ def create_single_clip(video_path, start, end, index):
         return None
 
 
+def create_preview_clips(video_path, intervals, max_workers=PREVIEW_WORKERS, ffmpeg_threads=None, progress_callback=None, quality="preview"):
+    """
+    Renders preview clips for all intervals concurrently with a bounded worker pool.
+    Each worker runs one FFmpeg process; ffmpeg_threads caps the threads per process
+    (defaults to an even share of the CPU cores). quality: see create_single_clip.
+    progress_callback(done, total, index, path) is called as each preview finishes.
+    Returns a list of preview paths in interval order (None for clips that failed).
+    """
+    total = len(intervals)
+    results = [None] * total
+    if total == 0:
+        return results
+    
+    max_workers = max(1, min(max_workers or 1, total))
+    if ffmpeg_threads is None:
+        ffmpeg_threads = max(1, (os.cpu_count() or 1) // max_workers)
+    render = bind_context(create_single_clip)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            executor.submit(render, video_path, start, end, i, ffmpeg_threads, quality): i
+            for i, (start, end) in enumerate(intervals)
+        }
+        
+        done = 0
+        for future in as_completed(futures):
+            i = futures[future]
+            try:
+                preview_path = future.result()
+                if preview_path and os.path.exists(preview_path):
+                    results[i] = preview_path
+                else:
+                    print(f"Preview clip {i} creation returned: {preview_path}")
+            except Exception as e:
+                # One failed clip must not abort the batch
+                print(f"Error creating preview {i}: {e}")
+            
+            done += 1
+            if progress_callback:
+                progress_callback(done, total, i, results[i])
+    
+    return results
+
+
+def _concat_signature(info):
+    """
+    The stream parameters that must match for files to be joined with the concat demuxer.
+    """
+    video = info['video'] or {}
+    audio = info['audio'] or {}
+    keys = ('codec_name', 'profile', 'width', 'height', 'pix_fmt', 'sample_aspect_ratio', 'r_frame_rate', 'time_base')
+    return (tuple(video.get(k) for k in keys),
+            tuple(audio.get(k) for k in ('codec_name', 'sample_rate', 'channels')) if audio else None)
+
+
+@traced("render.stitch", on_result=_output_size)
+def stitch_preview_clips(preview_paths, slug_duration=2.0):
+    """
+    Joins already-rendered final-quality previews (create_single_clip quality="final")
+    with black slugs using the concat demuxer - no decoding or re-encoding, so it takes
+    seconds. The slug is encoded once with the previews' exact parameters.
+    Returns the output path, or None if the previews can't be joined losslessly
+    (missing files, mismatched parameters) - callers should then use create_gag_reel.
+    """
+    if not preview_paths or not all(path and os.path.exists(path) for path in preview_paths):
+        return None
+
+    infos = [probe_video(path) for path in preview_paths]
+    if not all(info and info['video'] for info in infos):
+        return None
+    signature = _concat_signature(infos[0])
+    if signature[0][0] != 'h264' or any(_concat_signature(info) != signature for info in infos):
+        print("Preview clips have different encoding parameters, can't stitch them directly")
+        return None
+
+    unique_id = uuid.uuid4().hex[:8]
+    output_path = f"gag_reel_{unique_id}.mp4"
+    work_dir = tempfile.mkdtemp(prefix=f"preview_stitch_{unique_id}_")
+    video = infos[0]['video']
+    audio = infos[0]['audio']
+    slug_lease = None
+
+    try:
+        pieces = [os.path.abspath(preview_paths[0])]
+        if len(preview_paths) > 1:
+            encode_args = FINAL_PREVIEW_VIDEO_ARGS + (FINAL_PREVIEW_AUDIO_ARGS if audio else [])
+            slug_path, slug_lease = get_black_slug(video, audio, slug_duration, encode_args, "mp4", work_dir)
+            if slug_path is None:
+                return None
+
+            slug_info = probe_video(slug_path)
+            if not slug_info or _concat_signature(slug_info) != signature:
+                print("Slug parameters don't match the previews, can't stitch them directly")
+                return None
+            for path in preview_paths[1:]:
+                pieces += [slug_path, os.path.abspath(path)]
+
+        list_path = os.path.join(work_dir, "concat.txt")
+        with open(list_path, "w") as f:
+            for piece in pieces:
+                f.write(f"file '{piece}'\n")
+
+        cmd = [
+            'ffmpeg', '-y',
+            '-f', 'concat', '-safe', '0',
+            '-i', list_path,
+            '-c', 'copy',
+            '-movflags', '+faststart',
+            '-loglevel', 'error',
+            output_path,
+        ]
+        if not _run_ffmpeg(cmd):
+            if os.path.exists(output_path):
+                os.remove(output_path)
+            return None
+        if os.path.exists(output_path) and os.path.getsize(output_path) > 0:
+            return output_path
+        return None
+
+    except FileNotFoundError:
+        print("FFmpeg not found. Please install FFmpeg and add it to PATH.")
+        return None
+    except Exception as e:
+        print(f"Error stitching preview clips: {e}")
+        return None
+    finally:
+        if SLUG_CACHE is not None:
+            SLUG_CACHE.release(slug_lease)
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+@traced("moviepy.clip", on_result=_output_size)
 def create_single_clip_moviepy(video_path, start, end, index):
     """
     Fallback: Creates a single clip using MoviePy (slower but works without FFmpeg).
@@ -203,6 +1337,10 @@ def create_single_clip_moviepy(video_path, start, end, index):
     unique_id = uuid.uuid4().hex[:8]
     output_path = f"preview_clip_{index}_{unique_id}.mp4"
     
+    video_path, start, end = resolve_video_source(video_path, start, end)
+    if video_path is None:
+        return None
+    
     original_clip = None
     subclip = None
     